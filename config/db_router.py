@@ -0,0 +1,106 @@
+"""Маршрутизация запросов между основной БД и репликами (DATABASE_ROUTERS).
+
+По умолчанию все запросы идут в основную базу. На реплики уходят только чтения внутри
+replica_reads(): списки и карточки привычек, публичная лента, выборка кандидатов тика рассылки.
+Запись внутри блока или раньше в том же HTTP-запросе закрепляет чтения за основной базой, поэтому
+клиент сразу видит то, что сам записал. Список, изменённый меньше DATABASE_REPLICA_LAG секунд назад
+(по версии в кэше), тоже читается из основной базы: реплика могла ещё не получить изменение,
+а устаревший ответ попал бы в кэш под новой версией.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.decorators import sync_and_async_middleware
+
+# состояния — изменяемые словари: запись в потоке sync_to_async видна и вызывающему коду
+_request_state = ContextVar('db_request_state', default=None)
+_replica_state = ContextVar('db_replica_state', default=None)
+
+
+@contextmanager
+def replica_reads(changed_at=None):
+    """Разрешает чтения с реплики внутри блока; отдаёт, разрешены ли они.
+
+    changed_at — момент последнего изменения читаемых данных (unix-время), если он известен.
+    """
+    request = _request_state.get()
+    allowed = (
+        bool(settings.DATABASE_REPLICAS)
+        and not (request and request['wrote'])
+        and (changed_at is None or time.time() - changed_at >= settings.DATABASE_REPLICA_LAG)
+    )
+    token = _replica_state.set({'allowed': allowed})
+    try:
+        yield allowed
+    finally:
+        _replica_state.reset(token)
+
+
+@contextmanager
+def request_scope():
+    """Границы HTTP-запроса для правила «чтение после записи — из основной БД»"""
+    token = _request_state.set({'wrote': False})
+    try:
+        yield
+    finally:
+        _request_state.reset(token)
+
+
+@sync_and_async_middleware
+def primary_after_write_middleware(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            with request_scope():
+                return await get_response(request)
+    else:
+        def middleware(request):
+            with request_scope():
+                return get_response(request)
+    return middleware
+
+
+def replica_alias():
+    """Случайная реплика, если чтения с реплики сейчас разрешены, иначе None"""
+    state = _replica_state.get()
+    if state and state['allowed']:
+        return random.choice(settings.DATABASE_REPLICAS)
+    return None
+
+
+def replication_lag(alias):
+    """Отставание реплики в секундах; None, если его не узнать (реплика давно ничего не применяла)"""
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return 0.0
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT CASE WHEN pg_is_in_recovery() "
+            "THEN EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) ELSE 0 END"
+        )
+        lag = cursor.fetchone()[0]
+    return None if lag is None else float(lag)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return replica_alias() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        replica, request = _replica_state.get(), _request_state.get()
+        if replica:
+            replica['allowed'] = False
+        if request:
+            request['wrote'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # на репликах те же данные, что в основной базе
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
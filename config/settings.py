@@ -44,6 +44,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'config.db_router.primary_after_write_middleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -73,10 +74,52 @@ DATABASES = {
         'USER': os.getenv('USER'),
         'PASSWORD': os.getenv('PASSWORD'),
         'HOST': os.getenv('HOST'),
-        'PORT': os.getenv('PORT')
+        'PORT': os.getenv('PORT'),
+        # постоянные соединения: проверка перед повторным использованием вместо обрыва на запросе
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE') or 60),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# реплики для чтения (config/db_router.py): DB_REPLICA_HOSTS=host[:port],host[:port]
+DATABASE_REPLICAS = []
+for number, address in enumerate(filter(None, (os.getenv('DB_REPLICA_HOSTS') or '').split(',')), start=1):
+    host, _, port = address.strip().partition(':')
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        # в тестах реплика — то же, что основная тестовая БД
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica_{number}')
+
+DATABASE_ROUTERS = ['config.db_router.ReplicaRouter']
+# столько секунд после изменения списка он читается из основной БД: реплика могла его ещё не получить
+DATABASE_REPLICA_LAG = float(os.getenv('DB_REPLICA_LAG') or 5)
+
+REDIS_URL = os.getenv('REDIS_URL')
+
+# без REDIS_URL (тесты, локальный запуск) используется кэш в памяти процесса
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# сколько секунд живут закэшированные списки привычек (инвалидация по версии происходит раньше)
+HABIT_CACHE_TTL = 300
+# сколько дней хранятся следы удалённых привычек; клиент с более старой меткой получает полный список
+HABIT_TOMBSTONE_RETENTION_DAYS = 30
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -104,16 +147,26 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'users.User'
+# пароль при входе сверяется в пуле потоков users/passwords.py
+AUTHENTICATION_BACKENDS = ['users.backends.PooledPasswordBackend']
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
-    ]
+    ],
+    # попытки входа (users/throttles.py): с одного IP и на один email
+    'DEFAULT_THROTTLE_RATES': {
+        'login_ip': os.getenv('LOGIN_IP_RATE') or '30/min',
+        'login_email': os.getenv('LOGIN_EMAIL_RATE') or '10/min',
+    },
 }
 
+# потоков для хеширования паролей при регистрации и входе (users/passwords.py)
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS') or os.cpu_count() or 1)
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
@@ -130,8 +183,15 @@ SIMPLE_JWT = {
 
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
     'TOKEN_TYPE_CLAIM': 'token_type',
+    'TOKEN_OBTAIN_SERIALIZER': 'users.serializers.UserTokenObtainPairSerializer',
 }
 
+# пользователь из JWT: сколько секунд он живёт в кэше и можно ли собирать его из claims токена
+# без БД (claims доверяются не дольше AUTH_TRUSTED_CLAIMS_MAX_AGE секунд после выдачи токена)
+AUTH_USER_CACHE_TTL = 60
+AUTH_TRUST_TOKEN_CLAIMS = True if os.getenv('AUTH_TRUST_TOKEN_CLAIMS') == 'True' else False
+AUTH_TRUSTED_CLAIMS_MAX_AGE = 300
+
 CORS_ALLOWED_ORIGINS = [
      'http://localhost:8000',
  ]
@@ -140,6 +200,8 @@ CORS_ALLOW_ALL_ORIGINS = False
 
 CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL')
 CELERY_DEFAULT_BACKEND = os.getenv('CELERY_DEFAULT_BACKEND')
+# chord-у рассылки нужен бэкенд результатов, чтобы собрать сводку по шардам
+CELERY_RESULT_BACKEND = CELERY_DEFAULT_BACKEND
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
@@ -153,11 +215,62 @@ CELERY_BEAT_SCHEDULE = {
         'options': {
             'expires': 60,
         }
-    }
+    },
+    'recompute_dst_reminders': {
+        'task': 'tracker.tasks.recompute_dst_reminders',
+        'schedule': crontab(minute=30),
+    },
+    'rotate_event_partitions': {
+        'task': 'tracker.tasks.rotate_event_partitions',
+        'schedule': crontab(hour=3, minute=15),
+    },
+    'prune_habit_tombstones': {
+        'task': 'tracker.tasks.prune_habit_tombstones',
+        'schedule': crontab(hour=3, minute=30),
+    },
+    'process_telegram_updates': {
+        'task': 'tracker.tasks.process_telegram_updates',
+        'schedule': crontab(minute='*'),
+        'options': {
+            'expires': 60,
+        }
+    },
 }
 
+# время жизни подзадач рассылки, как у самого тика
+REMINDER_TASK_EXPIRES = 60
+# сколько напоминаний в среднем отправляет одна подзадача и максимум подзадач за тик
+REMINDER_BATCH_SIZE = int(os.getenv('REMINDER_BATCH_SIZE') or 500)
+REMINDER_MAX_SHARDS = int(os.getenv('REMINDER_MAX_SHARDS') or 32)
+# доля привычек, по которым рассылка пишет подробную запись в лог на уровне INFO (0 — только сводка)
+REMINDER_LOG_SAMPLE_RATE = float(os.getenv('REMINDER_LOG_SAMPLE_RATE') or 0)
+# неудавшиеся отправки повторяются следующими тиками: сколько минут после срока и сколько попыток всего
+REMINDER_RETRY_MINUTES = int(os.getenv('REMINDER_RETRY_MINUTES') or 30)
+REMINDER_MAX_ATTEMPTS = int(os.getenv('REMINDER_MAX_ATTEMPTS') or 5)
+
+# история отметок и доставок: сколько месяцев хранить подробно и на сколько месяцев вперёд создавать секции
+EVENT_RETENTION_MONTHS = int(os.getenv('EVENT_RETENTION_MONTHS') or 6)
+EVENT_PARTITIONS_AHEAD = 2
+
 CELERY_BEAT_SCHEDULER = 'celery.beat.PersistentScheduler'
 
 
 TELEGRAM_URL = "https://api.telegram.org/bot"
 TELEGRAM_BOT_URL = os.getenv('TELEGRAM_BOT_URL')
+TELEGRAM_TIMEOUT = 10
+# число одновременных запросов к Telegram (и размер пула соединений)
+TELEGRAM_MAX_WORKERS = int(os.getenv('TELEGRAM_MAX_WORKERS') or 32)
+# лимиты Bot API: сообщений в секунду на бота и на один чат
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE') or 30)
+TELEGRAM_CHAT_RATE = float(os.getenv('TELEGRAM_CHAT_RATE') or 1)
+# сколько секунд после начала отправки ещё имеет смысл повторять напоминание
+TELEGRAM_SEND_DEADLINE = 55
+# входящие обновления: имя бота для ссылки привязки, секрет webhook (заголовок
+# X-Telegram-Bot-Api-Secret-Token; пустой — webhook выключен), время жизни токена привязки в секундах
+TELEGRAM_BOT_USERNAME = os.getenv('TELEGRAM_BOT_USERNAME')
+TELEGRAM_WEBHOOK_SECRET = os.getenv('TELEGRAM_WEBHOOK_SECRET')
+TELEGRAM_LINK_TOKEN_TTL = 900
+# размер пачки разбора, задержка склейки webhook-запросов в секундах, срок хранения разобранных обновлений в днях
+TELEGRAM_UPDATES_BATCH_SIZE = int(os.getenv('TELEGRAM_UPDATES_BATCH_SIZE') or 1000)
+TELEGRAM_UPDATES_DEBOUNCE = 2
+TELEGRAM_UPDATES_RETENTION_DAYS = 1
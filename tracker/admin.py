@@ -1,3 +1,27 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 
-# Register your models here.
+from .models import Habit
+from .validators import validate_habit
+
+
+@admin.register(Habit)
+class HabitAdmin(admin.ModelAdmin):
+    list_display = ('id', 'action', 'owner', 'time_of_day', 'is_pleasant', 'is_public', 'next_reminder_at')
+    list_filter = ('is_pleasant', 'is_public')
+    search_fields = ('action', 'owner__email')
+    list_select_related = ('owner',)
+    raw_id_fields = ('owner', 'related_habit')
+    actions = ['validate_selected']
+
+    @admin.action(description='Проверить выбранные привычки')
+    def validate_selected(self, request, queryset):
+        """Проверяет привычки одним проходом движка валидации (связанные привычки — одним запросом)"""
+        habits = list(queryset)
+        invalid = [
+            f'#{habit.pk}: {" ".join(errors)}'
+            for habit, errors in zip(habits, validate_habit.validate_batch(habits)) if errors
+        ]
+        if invalid:
+            self.message_user(request, 'Нарушения правил: ' + '; '.join(invalid), messages.WARNING)
+        else:
+            self.message_user(request, f'Проверено привычек: {len(habits)}, нарушений нет.', messages.SUCCESS)
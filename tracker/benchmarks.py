@@ -0,0 +1,150 @@
+"""Общие утилиты для бенчмарков (management-команды bench_*)."""
+import json
+import math
+import platform
+import random
+import subprocess
+import time
+from contextlib import contextmanager
+from datetime import time as dt_time
+
+import django
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from tracker.models import Habit
+from users.models import User
+
+
+@contextmanager
+def benchmark_database(keepdb=False):
+    """Создаёт временную тестовую БД, чтобы бенчмарк не трогал рабочие данные"""
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=keepdb)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+
+
+def percentile(values, pct):
+    """Перцентиль по методу ближайшего ранга"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)) - 1, 0)
+    return ordered[rank]
+
+
+def summarize(durations):
+    """Сводка по замерам в миллисекундах"""
+    ms = [d * 1000 for d in durations]
+    return {
+        'runs': len(ms),
+        'p50_ms': round(percentile(ms, 50), 3),
+        'p99_ms': round(percentile(ms, 99), 3),
+        'mean_ms': round(sum(ms) / len(ms), 3) if ms else 0.0,
+    }
+
+
+def measure(func, repeat):
+    """Вызывает func repeat раз и возвращает длительности в секундах"""
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - started)
+    return durations
+
+
+def seed_users(count, prefix='bench', with_chat_id=True):
+    """Создаёт пользователей без хеширования пароля (bulk_create)"""
+    users = [
+        User(email=f'{prefix}{i}@bench.local', tg_chat_id=str(100000 + i) if with_chat_id else None)
+        for i in range(count)
+    ]
+    return User.objects.bulk_create(users, batch_size=1000)
+
+
+def seed_habits(owners, count, batch_size=5000, seed=0, hours=range(24), now=None):
+    """Создаёт count привычек со случайным временем в заданных часах, распределяя их по владельцам.
+
+    Расписание напоминаний считается от now (по умолчанию — от текущего момента).
+    """
+    rnd = random.Random(seed)
+    hours = list(hours)
+    created = 0
+    while created < count:
+        size = min(batch_size, count - created)
+        batch = []
+        for i in range(size):
+            habit = Habit(
+                owner=owners[(created + i) % len(owners)],
+                action=f'Привычка {created + i}',
+                place='Дома',
+                time_of_day=dt_time(rnd.choice(hours), rnd.randrange(60)),
+            )
+            habit.refresh_derived_fields(now=now)
+            batch.append(habit)
+        Habit.objects.bulk_create(batch)
+        created += size
+    return created
+
+
+def write_results(path, payload):
+    """Пишет результаты в JSON (или в stdout, если путь не задан)"""
+    data = json.dumps(payload, ensure_ascii=False, indent=2)
+    if path:
+        with open(path, 'w', encoding='utf-8') as fh:
+            fh.write(data)
+    return data
+
+
+# метрики, по которым сравниваются прогоны: для задержек хуже — больше, для пропускной способности — меньше
+LOWER_IS_BETTER = ('p50_ms', 'p99_ms')
+HIGHER_IS_BETTER = ('per_second',)
+
+
+def git_revision():
+    """Текущий коммит (None вне git-репозитория)"""
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                                capture_output=True, text=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def environment():
+    """Условия прогона: с ними сравнение результатов между коммитами имеет смысл"""
+    return {
+        'revision': git_revision(),
+        'started_at': timezone.now().isoformat(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'machine': platform.machine(),
+    }
+
+
+def compare_results(baseline, current, threshold):
+    """Сравнивает результаты прогонов по имени замера.
+
+    Возвращает список (имя, метрика, было, стало, изменение в %, регрессия ли); регрессия —
+    ухудшение больше threshold процентов.
+    """
+    previous = {row['name']: row for row in baseline['results']}
+    rows = []
+    for row in current['results']:
+        before = previous.get(row['name'])
+        if before is None:
+            continue
+        for metric in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+            old, new = before.get(metric), row.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            worse = change if metric in LOWER_IS_BETTER else -change
+            rows.append((row['name'], metric, old, new, round(change, 1), worse > threshold))
+    return rows
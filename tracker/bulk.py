@@ -0,0 +1,198 @@
+"""Массовое создание, изменение и удаление привычек одного владельца.
+
+Все элементы запроса проверяются вместе: связанные привычки и изменяемые записи читаются одним
+запросом на весь пакет, а проверки модели выполняются без обращений к БД. Если хотя бы один
+элемент не прошёл проверку, ничего не записывается, а в ответе возвращаются ошибки по каждому
+элементу (пустой словарь — элемент в порядке). Запись идёт через bulk_create/bulk_update в одной
+транзакции, поэтому сигналы модели не вызываются и кэш списков сбрасывается здесь же.
+"""
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from tracker.cache import PUBLIC_SCOPE, bump_version, owner_scope
+from tracker.models import Habit, HabitTombstone
+from tracker.serializers import HabitBulkItemSerializer
+from tracker.tasks import refresh_reminder_messages
+from tracker.validators import validate_habit
+
+MAX_BULK_ITEMS = 1000
+
+NOT_FOUND_MESSAGE = 'Привычка не найдена.'
+
+
+def _check_payload(items):
+    if not isinstance(items, list) or not items:
+        raise serializers.ValidationError({'non_field_errors': ['Ожидается непустой список.']})
+    if len(items) > MAX_BULK_ITEMS:
+        raise serializers.ValidationError(
+            {'non_field_errors': [f'Не более {MAX_BULK_ITEMS} элементов за запрос.']}
+        )
+
+
+def model_errors(habits):
+    """Проверки модели для всего пакета.
+
+    Вместо full_clean(), который проверяет внешние ключи отдельным запросом на каждую привычку:
+    поля проверяются без обращений к БД, связи — общим движком validate_habit.validate_batch().
+    """
+    errors = []
+    for habit in habits:
+        try:
+            habit.clean_fields(exclude=['owner', 'related_habit'])
+            errors.append({})
+        except DjangoValidationError as e:
+            errors.append(e.message_dict)
+    for item_errors, messages in zip(errors, validate_habit.validate_batch(habits)):
+        if messages:
+            item_errors['non_field_errors'] = messages
+    return errors
+
+
+def _validate_items(items, partial):
+    """Проверка полей каждого элемента; возвращает (validated_data, errors) в порядке элементов"""
+    validated, errors = [], []
+    for item in items:
+        serializer = HabitBulkItemSerializer(data=item, partial=partial, context={'bulk_update': partial})
+        if serializer.is_valid():
+            validated.append(serializer.validated_data)
+            errors.append({})
+        else:
+            validated.append(None)
+            errors.append(serializer.errors)
+    return validated, errors
+
+
+def _resolve_related(validated, errors, batch):
+    """Подставляет связанные привычки, прочитанные одним запросом.
+
+    batch — привычки текущего пакета по id: если связанная привычка меняется в этом же запросе,
+    проверка идёт по её новому состоянию.
+    """
+    related_ids = {data['related_habit'] for data in validated if data and data.get('related_habit')}
+    related = dict(batch)
+    missing = related_ids - set(related)
+    if missing:
+        related.update(Habit.objects.order_by().in_bulk(missing))
+    for index, data in enumerate(validated):
+        if not data or 'related_habit' not in data:
+            continue
+        pk = data.pop('related_habit')
+        if pk is not None and pk not in related:
+            errors[index] = {'related_habit': [f'Недопустимый первичный ключ "{pk}" - объект не существует.']}
+            validated[index] = None
+            continue
+        data['related_habit'] = related.get(pk)
+
+
+def _raise_if_errors(errors):
+    if any(errors):
+        raise serializers.ValidationError(errors)
+
+
+def bulk_create_habits(owner, items):
+    """Создаёт привычки владельца из списка словарей; возвращает созданные объекты"""
+    _check_payload(items)
+    validated, errors = _validate_items(items, partial=False)
+    _resolve_related(validated, errors, {})
+    indexed = [(index, Habit(owner=owner, **data)) for index, data in enumerate(validated) if data is not None]
+    habits = [habit for _, habit in indexed]
+    for (index, _), item_errors in zip(indexed, model_errors(habits)):
+        errors[index] = item_errors
+    _raise_if_errors(errors)
+
+    now = timezone.now()
+    for habit in habits:
+        habit.refresh_derived_fields(now=now)
+    with transaction.atomic():
+        Habit.objects.bulk_create(habits)
+    _invalidate(owner, any(habit.is_public for habit in habits))
+    return habits
+
+
+def bulk_update_habits(owner, items):
+    """Частично изменяет привычки владельца; каждый элемент содержит id и изменяемые поля"""
+    _check_payload(items)
+    validated, errors = _validate_items(items, partial=True)
+    seen = set()
+    for index, data in enumerate(validated):
+        if data is not None and data['id'] in seen:
+            errors[index] = {'id': ['Привычка уже указана в этом запросе.']}
+            validated[index] = None
+        elif data is not None:
+            seen.add(data['id'])
+    with transaction.atomic():
+        # чужие привычки не выбираются и выглядят как несуществующие
+        habits = Habit.objects.select_for_update().filter(owner=owner).order_by().in_bulk(seen)
+        was_public = any(habit.is_public for habit in habits.values())
+        for index, data in enumerate(validated):
+            if data is not None and data['id'] not in habits:
+                errors[index] = {'id': [NOT_FOUND_MESSAGE]}
+                validated[index] = None
+            elif data is not None:
+                # владелец уже загружен: refresh_derived_fields() берёт из него часовой пояс
+                habits[data['id']].owner = owner
+
+        changed_fields = set()
+        for data in validated:
+            if data is None:
+                continue
+            habit = habits[data['id']]
+            for field, value in data.items():
+                if field not in ('id', 'related_habit'):
+                    setattr(habit, field, value)
+                    changed_fields.add(field)
+        _resolve_related(validated, errors, habits)
+
+        updated = []
+        for index, data in enumerate(validated):
+            if data is None:
+                continue
+            habit = habits[data['id']]
+            if 'related_habit' in data:
+                habit.related_habit = data['related_habit']
+                changed_fields.add('related_habit')
+            updated.append((index, habit))
+        for (index, _), item_errors in zip(updated, model_errors([habit for _, habit in updated])):
+            errors[index] = item_errors
+        _raise_if_errors(errors)
+
+        now = timezone.now()
+        habits = [habit for _, habit in updated]
+        for habit in habits:
+            habit.refresh_derived_fields(now=now)
+            habit.updated_at = now
+        fields = changed_fields | set(Habit.DERIVED_FIELDS) | {'updated_at'}
+        Habit.objects.bulk_update(habits, fields=sorted(fields))
+        # у привычек, связанных с изменёнными приятными, в тексте напоминания их action
+        pleasant_ids = [habit.id for habit in habits if habit.is_pleasant]
+        if pleasant_ids:
+            refresh_reminder_messages(Habit.objects.filter(related_habit_id__in=pleasant_ids))
+    _invalidate(owner, was_public or any(habit.is_public for habit in habits))
+    return habits
+
+
+def bulk_delete_habits(owner, ids):
+    """Удаляет привычки владельца по списку id; если хотя бы одной нет, не удаляет ничего"""
+    _check_payload(ids)
+    errors = [{} if isinstance(pk, int) else {'id': ['Ожидается целое число.']} for pk in ids]
+    _raise_if_errors(errors)
+    with transaction.atomic():
+        existing = set(Habit.objects.filter(owner=owner, id__in=ids).values_list('id', flat=True))
+        _raise_if_errors([{} if pk in existing else {'id': [NOT_FOUND_MESSAGE]} for pk in ids])
+        habits = Habit.objects.filter(owner=owner, id__in=existing)
+        # сигналы post_delete пропускают этот пакет: следы пишутся одним INSERT, кэш сбрасывается один раз
+        habits.handled_in_bulk = True
+        habits.delete()
+        HabitTombstone.objects.bulk_create([HabitTombstone(owner=owner, habit_id=pk) for pk in existing])
+    # у связанных привычек обнуляется related_habit, они могут быть в публичной ленте
+    _invalidate(owner, True)
+    return len(existing)
+
+
+def _invalidate(owner, touches_public):
+    scopes = [owner_scope(owner.pk)]
+    if touches_public:
+        scopes.append(PUBLIC_SCOPE)
+    bump_version(*scopes)
@@ -0,0 +1,89 @@
+"""Версионированный кэш ответов со списками привычек.
+
+Каждый список (публичная лента и привычки каждого владельца) имеет свою версию в кэше. Ключ
+ответа содержит версию, поэтому при изменении привычки достаточно сменить версию — старые ответы
+больше не читаются и сами истекают по HABIT_CACHE_TTL.
+
+Версия — время последнего изменения списка в наносекундах, поэтому из неё же без запросов к БД
+получаются валидаторы условного GET (ETag, Last-Modified). Если версия вытеснена из кэша,
+заводится новая с текущим временем: клиенты один раз получат полный ответ вместо 304.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+PUBLIC_SCOPE = 'public'
+
+
+def owner_scope(owner_id):
+    return f'owner:{owner_id}'
+
+
+def _version_key(scope):
+    return f'habits:version:{scope}'
+
+
+def get_version(scope):
+    """Текущая версия списка; если её нет в кэше (первый запрос или вытеснение) — заводит новую"""
+    key = _version_key(scope)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+async def aget_version(scope):
+    """get_version() для асинхронных представлений"""
+    key = _version_key(scope)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, time.time_ns(), timeout=None)
+        version = await cache.aget(key)
+    return version
+
+
+def bump_version(*scopes):
+    """Делает недействительными закэшированные ответы для перечисленных списков"""
+    cache.set_many({_version_key(scope): time.time_ns() for scope in scopes}, timeout=None)
+
+
+def version_time(version):
+    """Момент изменения списка (unix-время в секундах) по его версии"""
+    return version / 10 ** 9
+
+
+def etag(scope, request, version):
+    """ETag ответа: версия списка, адрес с параметрами и формат ответа"""
+    key = f'{scope}:{version}:{request.get_full_path()}:{request.accepted_media_type}'
+    return f'"{hashlib.md5(key.encode()).hexdigest()}"'
+
+
+def _data_key(scope, request, version):
+    path_hash = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f'habits:data:{scope}:{version}:{path_hash}'
+
+
+def cached_data(scope, request, build, version=None):
+    """Возвращает данные ответа для request из кэша или строит их через build() и кэширует"""
+    key = _data_key(scope, request, version or get_version(scope))
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, timeout=settings.HABIT_CACHE_TTL)
+    return data
+
+
+async def acached_data(scope, request, build, version=None):
+    """cached_data() для асинхронных представлений: build — корутинная функция.
+
+    Ключи те же, поэтому синхронные и асинхронные представления читают общий кэш.
+    """
+    key = _data_key(scope, request, version or await aget_version(scope))
+    data = await cache.aget(key)
+    if data is None:
+        data = await build()
+        await cache.aset(key, data, timeout=settings.HABIT_CACHE_TTL)
+    return data
@@ -0,0 +1,195 @@
+"""Отметки о выполнении привычек и счётчики серий.
+
+Счётчики хранятся в самой привычке и обновляются при каждой отметке, поэтому статистика
+читается за O(1) и никогда не сканирует историю HabitCompletion:
+- current_streak — число отметок подряд, где между соседними прошло не больше period_days дней;
+- longest_streak — лучшая серия;
+- completion_mask — битовая маска выполнений за последние 30 дней, отсчитанных от last_completed_on.
+
+Отметка задним числом (например, кнопка «Выполнено» под старым напоминанием) может склеить две
+серии. В пределах окна маски серия, в которую попала отметка, пересчитывается по маске; если
+серия может продолжаться за окном или отметка старше окна, счётчики пересчитываются по истории
+HabitCompletion одним запросом (recompute_streaks).
+"""
+from itertools import groupby
+import math
+
+from django.db import transaction
+from django.utils import timezone
+
+from tracker.models import Habit, HabitCompletion
+
+COMPLETION_WINDOW = 30
+WINDOW_MASK = (1 << COMPLETION_WINDOW) - 1
+
+STATS_FIELDS = ('current_streak', 'longest_streak', 'last_completed_on', 'completion_mask')
+
+
+def local_today(user, now=None):
+    """Текущая дата в часовом поясе пользователя"""
+    return (now or timezone.now()).astimezone(user.timezone).date()
+
+
+def apply_completion(habit, completed_on):
+    """Обновляет счётчики habit в памяти с учётом выполнения в день completed_on.
+
+    Возвращает False, если по маске счётчики не пересчитать и нужен recompute_streaks().
+    """
+    last = habit.last_completed_on
+    if last is None:
+        habit.current_streak = 1
+        habit.completion_mask = 1
+        habit.last_completed_on = completed_on
+    elif completed_on > last:
+        gap = (completed_on - last).days
+        habit.current_streak = habit.current_streak + 1 if gap <= habit.period_days else 1
+        habit.completion_mask = ((habit.completion_mask << gap) | 1) & WINDOW_MASK if gap < COMPLETION_WINDOW else 1
+        habit.last_completed_on = completed_on
+    else:
+        offset = (last - completed_on).days
+        if offset >= COMPLETION_WINDOW:
+            return False
+        habit.completion_mask |= 1 << offset
+        run = _run_around(habit.completion_mask, offset, habit.period_days)
+        if run is None:
+            return False
+        start, length = run
+        if start == 0:
+            habit.current_streak = length
+        habit.longest_streak = max(habit.longest_streak, length)
+    habit.longest_streak = max(habit.longest_streak, habit.current_streak)
+    return True
+
+
+def _run_around(mask, offset, period_days):
+    """Серия из маски, в которую входит день offset: (offset самого позднего дня, длина).
+
+    None, если серия доходит до края окна и может продолжаться за ним.
+    """
+    days = [day for day in range(COMPLETION_WINDOW) if mask >> day & 1]
+    runs = [[days[0]]]
+    for day in days[1:]:
+        if day - runs[-1][-1] <= period_days:
+            runs[-1].append(day)
+        else:
+            runs.append([day])
+    run = next(run for run in runs if offset in run)
+    if COMPLETION_WINDOW - run[-1] <= period_days:
+        return None
+    return run[0], len(run)
+
+
+def recompute_streaks(habits):
+    """Пересчитывает счётчики привычек в памяти по истории HabitCompletion (один запрос).
+
+    История старше EVENT_RETENTION_MONTHS удалена, поэтому серии по ней — оценка снизу: отметка
+    не может укоротить серию, и сохранённые значения не уменьшаются.
+    """
+    habits = {habit.id: habit for habit in habits}
+    history = (HabitCompletion.objects.filter(habit_id__in=habits).order_by('habit_id', 'completed_on')
+               .values_list('habit_id', 'completed_on'))
+    for habit_id, rows in groupby(history, key=lambda row: row[0]):
+        habit = habits[habit_id]
+        days = [day for _, day in rows]
+        current = longest = 1
+        for previous, day in zip(days, days[1:]):
+            current = current + 1 if (day - previous).days <= habit.period_days else 1
+            longest = max(longest, current)
+        last = days[-1]
+        habit.current_streak = max(habit.current_streak, current) if habit.last_completed_on == last else current
+        habit.longest_streak = max(habit.longest_streak, longest)
+        habit.last_completed_on = last
+        habit.completion_mask = 0
+        for day in days:
+            offset = (last - day).days
+            if offset < COMPLETION_WINDOW:
+                habit.completion_mask |= 1 << offset
+
+
+def record_completion(habit, completed_on):
+    """Записывает выполнение и обновляет счётчики; возвращает (привычка со счётчиками, создана ли отметка).
+
+    Строка привычки блокируется на время обновления, поэтому одновременные отметки не теряют
+    приращения. Счётчики пишутся через QuerySet.update(): save() здесь не нужен — расписание,
+    валидация и кэш списков от них не зависят.
+    """
+    with transaction.atomic():
+        locked = Habit.objects.select_for_update().only('id', 'period_days', *STATS_FIELDS).get(pk=habit.pk)
+        if HabitCompletion.objects.filter(habit_id=habit.pk, completed_on=completed_on).exists():
+            return locked, False
+        HabitCompletion.objects.create(habit_id=habit.pk, completed_on=completed_on)
+        if not apply_completion(locked, completed_on):
+            recompute_streaks([locked])
+        Habit.objects.filter(pk=habit.pk).update(**{field: getattr(locked, field) for field in STATS_FIELDS})
+    return locked, True
+
+
+def record_completions(pairs):
+    """Пакетная запись выполнений: pairs — пары (habit_id, completed_on).
+
+    Привычки блокируются одним запросом в порядке id (одновременные пакеты не взаимоблокируются),
+    существующие отметки читаются одним запросом, новые вставляются одним bulk_create, а счётчики
+    пишутся одним bulk_update. Возвращает множество пар, для которых отметка создана.
+    """
+    pairs = set(pairs)
+    if not pairs:
+        return set()
+    habit_ids = {habit_id for habit_id, _ in pairs}
+    with transaction.atomic():
+        habits = {
+            habit.id: habit
+            for habit in Habit.objects.select_for_update().only('id', 'period_days', *STATS_FIELDS)
+            .filter(id__in=habit_ids).order_by('id')
+        }
+        existing = set(
+            HabitCompletion.objects.filter(habit_id__in=habits, completed_on__in={day for _, day in pairs})
+            .values_list('habit_id', 'completed_on')
+        )
+        created = sorted(pair for pair in pairs if pair[0] in habits and pair not in existing)
+        if not created:
+            return set()
+        HabitCompletion.objects.bulk_create(
+            [HabitCompletion(habit_id=habit_id, completed_on=day) for habit_id, day in created],
+            ignore_conflicts=True,
+        )
+        # пары отсортированы по привычке и дате: серия каждой привычки растёт в хронологическом порядке
+        stale = set()
+        for habit_id, day in created:
+            if habit_id not in stale and not apply_completion(habits[habit_id], day):
+                stale.add(habit_id)
+        if stale:
+            # история уже содержит все новые отметки пакета
+            recompute_streaks([habits[habit_id] for habit_id in stale])
+        Habit.objects.bulk_update([habits[habit_id] for habit_id in {pk for pk, _ in created}],
+                                  fields=list(STATS_FIELDS))
+    return set(created)
+
+
+def completion_stats(habit, today):
+    """Статистика по сохранённым счётчикам на дату today"""
+    current, mask = habit.current_streak, habit.completion_mask
+    if habit.last_completed_on is None:
+        current, mask = 0, 0
+    else:
+        age = (today - habit.last_completed_on).days
+        if age > habit.period_days:
+            # срок очередного выполнения прошёл, серия прервана
+            current = 0
+        mask = (mask << age) & WINDOW_MASK if 0 <= age < COMPLETION_WINDOW else 0
+    completed_7 = bin(mask & 0b1111111).count('1')
+    completed_30 = bin(mask).count('1')
+    return {
+        'current_streak': current,
+        'longest_streak': habit.longest_streak,
+        'last_completed_on': habit.last_completed_on,
+        'completed_last_7_days': completed_7,
+        'completed_last_30_days': completed_30,
+        'adherence_7_days': _adherence(completed_7, 7, habit.period_days),
+        'adherence_30_days': _adherence(completed_30, COMPLETION_WINDOW, habit.period_days),
+    }
+
+
+def _adherence(completed, window, period_days):
+    """Доля выполненных от ожидаемого числа выполнений за окно"""
+    expected = math.ceil(window / period_days)
+    return round(min(completed / expected, 1.0), 2)
@@ -0,0 +1,139 @@
+"""Импорт привычек из CSV/NDJSON (management-команда import_habits).
+
+Файл читается потоком и обрабатывается пачками: владельцы находятся одним запросом по email
+на пачку, строки проверяются теми же правилами, что и массовые эндпоинты (bulk.model_errors),
+и вставляются одним bulk_create или, в PostgreSQL, одним COPY. Позиция в файле сохраняется
+в HabitImportCheckpoint в той же транзакции, что и пачка, поэтому после сбоя импорт
+продолжается с первой незаписанной строки без дублей.
+"""
+import csv
+import io
+import json
+from itertools import islice
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from tracker.bulk import model_errors
+from tracker.cache import PUBLIC_SCOPE, bump_version, owner_scope
+from tracker.models import Habit, HabitImportCheckpoint
+from tracker.serializers import HabitBulkItemSerializer
+from users.models import User
+
+IMPORT_FIELDS = (
+    'action', 'place', 'time_of_day', 'is_pleasant', 'reward', 'period_days', 'duration_seconds', 'is_public',
+)
+# колонка владельца: как в выгрузке публичных привычек или короткое имя
+OWNER_COLUMNS = ('owner__email', 'owner_email')
+
+
+def read_rows(path, file_format):
+    """Построчно читает файл, возвращая словари"""
+    with open(path, encoding='utf-8', newline='') as fh:
+        if file_format == 'csv':
+            yield from csv.DictReader(fh)
+        else:
+            for line in fh:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def chunked(rows, size):
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+def _owner_email(row):
+    for column in OWNER_COLUMNS:
+        if row.get(column):
+            return row[column].strip()
+    return None
+
+
+def _item_data(row):
+    """Поля привычки из строки файла; пустые значения CSV означают "по умолчанию\""""
+    return {
+        field: row[field] for field in IMPORT_FIELDS
+        if field in row and row[field] not in ('', None)
+    }
+
+
+def build_habits(rows, start_line):
+    """Проверяет пачку строк; возвращает (привычки, ошибки [(номер строки, ошибки)])"""
+    emails = {_owner_email(row) for row in rows} - {None}
+    owners = {
+        owner.email: owner
+        for owner in User.objects.filter(email__in=emails).only('id', 'email', 'timezone')
+    }
+
+    candidates, errors = [], []
+    for line, row in enumerate(rows, start=start_line):
+        owner = owners.get(_owner_email(row))
+        if owner is None:
+            errors.append((line, {'owner': ['Пользователь с таким email не найден.']}))
+            continue
+        serializer = HabitBulkItemSerializer(data=_item_data(row))
+        if not serializer.is_valid():
+            errors.append((line, serializer.errors))
+            continue
+        data = {field: value for field, value in serializer.validated_data.items() if field in IMPORT_FIELDS}
+        candidates.append((line, Habit(owner=owner, **data)))
+
+    habits = []
+    for (line, habit), item_errors in zip(candidates, model_errors([habit for _, habit in candidates])):
+        if item_errors:
+            errors.append((line, item_errors))
+        else:
+            habits.append(habit)
+
+    now = timezone.now()
+    for habit in habits:
+        habit.refresh_derived_fields(now=now)
+        habit.created_at = habit.updated_at = now
+    return habits, sorted(errors, key=lambda error: error[0])
+
+
+def _copy_value(value):
+    """Значение в текстовом формате COPY"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def copy_habits(habits):
+    """Вставка пачки через COPY FROM STDIN (только PostgreSQL)"""
+    fields = [field for field in Habit._meta.concrete_fields if not field.primary_key]
+    buffer = io.StringIO()
+    for habit in habits:
+        buffer.write('\t'.join(_copy_value(getattr(habit, field.attname)) for field in fields))
+        buffer.write('\n')
+    buffer.seek(0)
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(field.column) for field in fields)
+    with connection.cursor() as cursor:
+        cursor.cursor.copy_expert(f'COPY {quote(Habit._meta.db_table)} ({columns}) FROM STDIN', buffer)
+
+
+def write_chunk(habits, checkpoint, rows_in_chunk, skipped, method):
+    """Пишет пачку и сдвигает позицию импорта в одной транзакции"""
+    with transaction.atomic():
+        if method == 'copy':
+            copy_habits(habits)
+        else:
+            Habit.objects.bulk_create(habits)
+        checkpoint.rows_done += rows_in_chunk
+        checkpoint.imported += len(habits)
+        checkpoint.skipped += skipped
+        checkpoint.save()
+    # bulk_create и COPY не вызывают сигналы модели
+    scopes = {owner_scope(habit.owner_id) for habit in habits}
+    if any(habit.is_public for habit in habits):
+        scopes.add(PUBLIC_SCOPE)
+    if scopes:
+        bump_version(*scopes)
@@ -0,0 +1,207 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from wsgiref.util import setup_testing_defaults
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.core.asgi import get_asgi_application
+from django.core.wsgi import get_wsgi_application
+from django.test import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from tracker.benchmarks import benchmark_database, environment, seed_habits, seed_users, summarize, write_results
+from tracker.models import Habit
+
+ENDPOINTS = ('list', 'public', 'detail')
+HOST = 'testserver'
+
+
+def wsgi_get(application, path, headers):
+    """GET через WSGI-приложение, как его вызывает сервер; возвращает код ответа"""
+    environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'HTTP_HOST': HOST}
+    environ.update({f"HTTP_{name.upper().replace('-', '_')}": value for name, value in headers.items()})
+    setup_testing_defaults(environ)
+    statuses = []
+    body = application(environ, lambda status, response_headers, exc_info=None: statuses.append(status))
+    try:
+        for _ in body:
+            pass
+    finally:
+        body.close()
+    return int(statuses[0].split()[0])
+
+
+async def asgi_get(application, path, headers):
+    """GET через ASGI-приложение, как его вызывает сервер; возвращает код ответа"""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+        'headers': [(b'host', HOST.encode())] + [(name.lower().encode(), value.encode())
+                                                 for name, value in headers.items()],
+        'client': ('127.0.0.1', 50000), 'server': (HOST, 80),
+    }
+    requested, finished, statuses = False, asyncio.Event(), []
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # клиент не отключается, пока не получит ответ
+        await finished.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            statuses.append(message['status'])
+        elif not message.get('more_body'):
+            finished.set()
+
+    await application(scope, receive, send)
+    return statuses[0]
+
+
+@contextmanager
+def database_latency(seconds):
+    """Добавляет задержку к каждому запросу к БД — как у удалённой или нагруженной базы"""
+    if not seconds:
+        yield
+        return
+
+    def delay(execute, sql, params, many, context):
+        time.sleep(seconds)
+        return execute(sql, params, many, context)
+
+    def install(sender, connection, **kwargs):
+        connection.execute_wrappers.append(delay)
+
+    for connection in connections.all(initialized_only=True):
+        install(None, connection)
+    connection_created.connect(install)
+    try:
+        yield
+    finally:
+        connection_created.disconnect(install)
+        for connection in connections.all(initialized_only=True):
+            if delay in connection.execute_wrappers:
+                connection.execute_wrappers.remove(delay)
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест чтения привычек: пропускная способность при одновременных соединениях '
+            'в режиме WSGI (пул синхронных воркеров) и ASGI (один процесс с циклом событий)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100, help='Читателей (у каждого свой JWT)')
+        parser.add_argument('--habits', type=int, default=2000, help='Привычек в таблице')
+        parser.add_argument('--requests', type=int, default=300, help='Запросов на каждый замер')
+        parser.add_argument('--concurrency', default='8,32,128', help='Одновременных соединений через запятую')
+        parser.add_argument('--workers', type=int, default=4, help='Синхронных воркеров WSGI')
+        parser.add_argument('--db-latency-ms', type=float, default=5, help='Задержка каждого запроса к БД')
+        parser.add_argument('--endpoints', default=','.join(ENDPOINTS),
+                            help=f'Эндпоинты через запятую: {", ".join(ENDPOINTS)}')
+        parser.add_argument('--output', help='Файл для JSON-результатов')
+
+    @override_settings(ALLOWED_HOSTS=[HOST])
+    def handle(self, *args, **options):
+        endpoints = [endpoint.strip() for endpoint in options['endpoints'].split(',') if endpoint.strip()]
+        unknown = set(endpoints) - set(ENDPOINTS)
+        if unknown:
+            raise CommandError(f'Неизвестные эндпоинты: {", ".join(sorted(unknown))}')
+        levels = [int(level) for level in options['concurrency'].split(',') if level.strip()]
+
+        rows = []
+        with benchmark_database():
+            env = environment()
+            owners = seed_users(options['users'])
+            seed_habits(owners, options['habits'])
+            Habit.objects.filter(id__in=list(Habit.objects.values_list('id', flat=True)[::10])).update(is_public=True)
+            habit_ids = {}
+            for owner_id, habit_id in Habit.objects.order_by('id').values_list('owner_id', 'id').iterator():
+                habit_ids.setdefault(owner_id, habit_id)
+            readers = [
+                ({'Authorization': f'Bearer {AccessToken.for_user(owner)}'}, habit_ids.get(owner.pk))
+                for owner in owners
+            ]
+            with database_latency(options['db_latency_ms'] / 1000):
+                for endpoint in endpoints:
+                    requests = [self.request(endpoint, *readers[i % len(readers)]) for i in range(options['requests'])]
+                    for concurrency in levels:
+                        # каждый замер начинается с пустого кэша: списки читаются из БД
+                        cache.clear()
+                        rows.append(self.run_wsgi(endpoint, requests, concurrency, options['workers']))
+                        cache.clear()
+                        # asyncio.run(), а не async_to_sync: иначе синхронные вызовы ORM всех запросов
+                        # уходили бы в главный поток, а не в потоки своих запросов, как под ASGI-сервером
+                        rows.append(asyncio.run(self.run_asgi(endpoint, requests, concurrency)))
+
+        for row in rows:
+            self.stdout.write(f"{row['mode']} {row['endpoint']} x{row['concurrency']}: {row['per_second']} запросов/с, "
+                              f"p50={row['p50_ms']} мс, p99={row['p99_ms']} мс, ошибок: {row['errors']}")
+        write_results(options['output'], {
+            'benchmark': 'async_reads',
+            'environment': env,
+            'parameters': {key: options[key] for key in ('users', 'habits', 'requests', 'workers', 'db_latency_ms')},
+            'results': rows,
+        })
+
+    @staticmethod
+    def request(endpoint, headers, habit_id):
+        url = {
+            'list': '/api/tracker/habits/',
+            'public': '/api/tracker/habits/public/',
+            'detail': f'/api/tracker/habits/{habit_id}/',
+        }[endpoint]
+        return url, headers
+
+    @staticmethod
+    def row(mode, endpoint, concurrency, durations, errors, elapsed):
+        return {
+            'mode': mode,
+            'endpoint': endpoint,
+            'concurrency': concurrency,
+            **summarize(durations),
+            'per_second': round(len(durations) / elapsed, 1),
+            'errors': sum(errors),
+        }
+
+    def run_wsgi(self, endpoint, requests, concurrency, workers):
+        """concurrency клиентов на workers синхронных воркеров: лишние соединения ждут свободного воркера"""
+        application = get_wsgi_application()
+        worker_slots = threading.BoundedSemaphore(workers)
+        durations, errors = [], []
+
+        def call(url, headers):
+            started = time.perf_counter()
+            with worker_slots:
+                code = wsgi_get(application, url, headers)
+            durations.append(time.perf_counter() - started)
+            errors.append(code != 200)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as clients:
+            for future in [clients.submit(call, url, headers) for url, headers in requests]:
+                future.result()
+        return self.row('wsgi', endpoint, concurrency, durations, errors, time.perf_counter() - started)
+
+    async def run_asgi(self, endpoint, requests, concurrency):
+        """concurrency клиентов на один ASGI-процесс: каждый запрос ждёт БД, не занимая цикл событий"""
+        application = get_asgi_application()
+        connections_open = asyncio.Semaphore(concurrency)
+        durations, errors = [], []
+
+        async def call(url, headers):
+            async with connections_open:
+                started = time.perf_counter()
+                code = await asgi_get(application, url, headers)
+                durations.append(time.perf_counter() - started)
+                errors.append(code != 200)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(call(url, headers) for url, headers in requests))
+        return self.row('asgi', endpoint, concurrency, durations, errors, time.perf_counter() - started)
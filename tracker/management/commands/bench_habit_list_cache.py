@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from rest_framework.test import APIClient
+
+from tracker.benchmarks import benchmark_database, measure, seed_habits, seed_users, summarize, write_results
+from tracker.cache import PUBLIC_SCOPE, bump_version, owner_scope
+from tracker.models import Habit
+
+ENDPOINTS = (
+    ('public', '/api/tracker/habits/public/'),
+    ('owner_list', '/api/tracker/habits/'),
+)
+
+
+class Command(BaseCommand):
+    help = 'Замер p50/p99 списка привычек и публичной ленты с холодным и прогретым кэшем'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--habits', type=int, default=5000, help='Всего привычек в таблице')
+        parser.add_argument('--public', type=int, default=500, help='Сколько из них публичных')
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--requests', type=int, default=200, help='Запросов на каждый режим')
+        parser.add_argument('--output', help='Файл для JSON-результатов')
+
+    @override_settings(ALLOWED_HOSTS=['testserver'])
+    def handle(self, *args, **options):
+        results = []
+        with benchmark_database():
+            owners = seed_users(options['users'])
+            seed_habits(owners, options['habits'])
+            public_ids = Habit.objects.order_by('id').values_list('id', flat=True)[:options['public']]
+            Habit.objects.filter(id__in=list(public_ids)).update(is_public=True)
+
+            client = APIClient()
+            client.force_authenticate(user=owners[0])
+            scopes = {'public': PUBLIC_SCOPE, 'owner_list': owner_scope(owners[0].pk)}
+            for name, url in ENDPOINTS:
+                # холодный кэш: перед каждым запросом меняем версию, как это делает запись привычки
+                cold = measure(lambda: (bump_version(scopes[name]), client.get(url)), options['requests'])
+                client.get(url)
+                warm = measure(lambda: client.get(url), options['requests'])
+                for mode, durations in (('cold', cold), ('warm', warm)):
+                    row = {'endpoint': name, 'cache': mode, **summarize(durations)}
+                    results.append(row)
+                    self.stdout.write(f"{name} ({mode}): p50={row['p50_ms']} мс, p99={row['p99_ms']} мс")
+        write_results(options['output'], {'benchmark': 'habit_list_cache', 'results': results})
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from rest_framework.pagination import Cursor
+from rest_framework.test import APIClient, APIRequestFactory
+
+from tracker.benchmarks import benchmark_database, measure, seed_habits, seed_users, summarize, write_results
+from tracker.cache import bump_version, owner_scope
+from tracker.models import Habit
+from tracker.paginators import HabitsPaginator
+
+
+class Command(BaseCommand):
+    help = 'Замер времени страницы списка привычек на разной глубине (курсорная пагинация)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--habits', type=int, default=100000, help='Привычек у одного владельца')
+        parser.add_argument('--depths', default='0,1000,10000,99000',
+                            help='Позиции первой записи страницы через запятую')
+        parser.add_argument('--requests', type=int, default=100, help='Запросов на каждую глубину')
+        parser.add_argument('--output', help='Файл для JSON-результатов')
+
+    @override_settings(ALLOWED_HOSTS=['testserver'])
+    def handle(self, *args, **options):
+        results = []
+        with benchmark_database():
+            owner = seed_users(1)[0]
+            seed_habits([owner], options['habits'])
+            ordered = Habit.objects.filter(owner=owner).order_by('-created_at', '-id')
+            client = APIClient()
+            client.force_authenticate(user=owner)
+            paginator = HabitsPaginator()
+            paginator.base_url = APIRequestFactory().get('/api/tracker/habits/').build_absolute_uri()
+            for depth in (int(depth) for depth in options['depths'].split(',')):
+                if depth:
+                    previous = ordered[depth - 1]
+                    url = paginator.encode_cursor(Cursor(0, False, HabitsPaginator._position(previous)))
+                else:
+                    url = '/api/tracker/habits/'
+                # кэш списка сбрасывается перед каждым запросом: меряется именно выборка страницы
+                durations = measure(lambda: (bump_version(owner_scope(owner.pk)), client.get(url)),
+                                    options['requests'])
+                row = {'depth': depth, **summarize(durations)}
+                results.append(row)
+                self.stdout.write(f"depth={depth}: p50={row['p50_ms']} мс, p99={row['p99_ms']} мс")
+        write_results(options['output'], {'benchmark': 'habit_pagination', 'results': results})
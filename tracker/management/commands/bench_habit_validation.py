@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from tracker.benchmarks import benchmark_database, measure, seed_habits, seed_users, summarize, write_results
+from tracker.models import Habit
+from tracker.validators import validate_habit
+
+
+class Command(BaseCommand):
+    help = 'Сравнение проверки привычек по одной и пакетом (validate_batch)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--habits', type=int, default=2000, help='Размер проверяемого пакета')
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--output', help='Файл для JSON-результатов')
+
+    def handle(self, *args, **options):
+        results = []
+        with benchmark_database():
+            owners = seed_users(10)
+            pleasant = [Habit.objects.create(owner=owner, action='Приятная', is_pleasant=True) for owner in owners]
+            seed_habits(owners, options['habits'])
+            # каждой привычке назначается приятная связанная привычка её владельца
+            for owner, habit in zip(owners, pleasant):
+                Habit.objects.filter(owner=owner, is_pleasant=False).update(related_habit=habit)
+            queryset = Habit.objects.filter(is_pleasant=False).order_by('id')
+
+            def per_habit():
+                for habit in queryset.all():
+                    validate_habit(habit)
+
+            def batched():
+                validate_habit.validate_batch(list(queryset.all()))
+
+            for mode, func in (('per_habit', per_habit), ('batch', batched)):
+                row = {'mode': mode, 'habits': options['habits'], **summarize(measure(func, options['repeat']))}
+                results.append(row)
+                self.stdout.write(f"{mode}: p50={row['p50_ms']} мс, p99={row['p99_ms']} мс на пакет")
+        write_results(options['output'], {'benchmark': 'habit_validation', 'results': results})
@@ -0,0 +1,79 @@
+import asyncio
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, override_settings
+
+from tracker.benchmarks import benchmark_database, environment, summarize, write_results
+from users.models import User
+
+PASSWORD = 'bench-password'
+
+
+class Command(BaseCommand):
+    help = ('Замер входа через асинхронный LoginApiView: запросов в секунду при разной конкурентности '
+            'и наибольшая пропускная способность, при которой p99 укладывается в --target-ms')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=64, help='Запросов на каждый уровень конкурентности')
+        parser.add_argument('--concurrency', default='1,2,4,8,16', help='Уровни конкурентности через запятую')
+        parser.add_argument('--target-ms', type=float, default=1000, help='Допустимая задержка p99')
+        parser.add_argument('--output', help='Файл для JSON-результатов')
+
+    def handle(self, *args, **options):
+        levels = [int(level) for level in options['concurrency'].split(',') if level.strip()]
+        # троттлинг входа отключён: все запросы идут от одного адреса и на один email
+        rates = {**settings.REST_FRAMEWORK.get('DEFAULT_THROTTLE_RATES', {}), 'login_ip': None, 'login_email': None}
+        rest_framework = {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': rates}
+        with benchmark_database(), override_settings(ALLOWED_HOSTS=['testserver'], REST_FRAMEWORK=rest_framework):
+            env = environment()
+            user = User.objects.create(email='login@bench.local')
+            user.set_password(PASSWORD)
+            user.save()
+            # asyncio.run(), а не async_to_sync: иначе синхронные вызовы ORM всех запросов уходили бы
+            # в главный поток, а не в потоки своих запросов, как под ASGI-сервером
+            rows = [asyncio.run(self.run_level(user.email, level, options['requests'])) for level in levels]
+
+        for row in rows:
+            self.stdout.write(f"конкурентность {row['concurrency']}: {row['per_second']} входов/с, "
+                              f"p50={row['p50_ms']} мс, p99={row['p99_ms']} мс, ошибок: {row['errors']}")
+        within = [row for row in rows if row['p99_ms'] <= options['target_ms'] and not row['errors']]
+        best = max(within, key=lambda row: row['per_second'], default=None)
+        if best:
+            self.stdout.write(f"При p99 <= {options['target_ms']} мс: {best['per_second']} входов/с "
+                              f"(конкурентность {best['concurrency']})")
+        else:
+            self.stdout.write(f"Ни один уровень не уложился в p99 <= {options['target_ms']} мс")
+        write_results(options['output'], {
+            'benchmark': 'login',
+            'environment': env,
+            'parameters': {'requests': options['requests'], 'target_ms': options['target_ms'],
+                           'hash_workers': settings.PASSWORD_HASH_WORKERS},
+            'results': rows,
+            'best_within_target': best,
+        })
+
+    async def run_level(self, email, concurrency, requests):
+        """requests входов, не больше concurrency одновременно"""
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+        durations, errors = [], []
+
+        async def login():
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post('/users/login/', data={'email': email, 'password': PASSWORD},
+                                             content_type='application/json')
+                durations.append(time.perf_counter() - started)
+                errors.append(response.status_code != 200)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(requests)))
+        elapsed = time.perf_counter() - started
+        return {
+            'concurrency': concurrency,
+            **summarize(durations),
+            'per_second': round(requests / elapsed, 1),
+            'errors': sum(errors),
+        }
@@ -0,0 +1,60 @@
+from datetime import time as dt_time, timedelta
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from tracker.benchmarks import benchmark_database, measure, seed_habits, seed_users, summarize, write_results
+from tracker.models import next_occurrence
+from tracker.tasks import due_reminders
+
+# час, в котором лежат "должные" привычки; фоновые привычки в него не попадают
+DUE_HOUR = 8
+
+
+class Command(BaseCommand):
+    help = 'Замер времени выборки напоминаний за один тик при разном размере таблицы привычек'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,100000,1000000',
+                            help='Размеры таблицы привычек через запятую')
+        parser.add_argument('--due', type=int, default=3000,
+                            help='Сколько привычек лежит в проверяемом часе (постоянно для всех размеров)')
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--ticks', type=int, default=50, help='Количество тиков на каждый размер')
+        parser.add_argument('--output', help='Файл для JSON-результатов')
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options['sizes'].split(','))
+        background_hours = [hour for hour in range(24) if hour != DUE_HOUR]
+        results = []
+        with benchmark_database():
+            owners = seed_users(options['users'])
+            first_tick = next_occurrence(dt_time(DUE_HOUR), timezone.now(), ZoneInfo(settings.TIME_ZONE))
+            # расписание считается от минуты до первого тика, чтобы все "должные" привычки были в одних сутках
+            seeded_at = first_tick - timedelta(minutes=1)
+            seeded = seed_habits(owners, options['due'], hours=[DUE_HOUR], now=seeded_at)
+            for size in sizes:
+                seeded += seed_habits(owners, max(size - seeded, 0), seed=size, hours=background_hours,
+                                      now=seeded_at)
+                # каждый тик смотрит на своё окно, как это делает beat раз в минуту
+                ticks = iter(range(options['ticks']))
+                due_counts = []
+                durations = measure(
+                    lambda: due_counts.append(sum(
+                        1 for _ in due_reminders(first_tick + timedelta(minutes=next(ticks) % 60))
+                    )),
+                    options['ticks'],
+                )
+                row = {
+                    'habits': seeded,
+                    'due_per_tick': round(sum(due_counts) / len(due_counts), 1),
+                    **summarize(durations),
+                }
+                results.append(row)
+                self.stdout.write(
+                    f"habits={seeded}, due={row['due_per_tick']}: "
+                    f"p50={row['p50_ms']} мс, p99={row['p99_ms']} мс на тик"
+                )
+        write_results(options['output'], {'benchmark': 'reminder_sweep', 'results': results})
@@ -0,0 +1,134 @@
+import time
+from contextlib import ExitStack, contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from tracker.benchmarks import benchmark_database, environment, seed_habits, seed_users, write_results
+from tracker.cache import PUBLIC_SCOPE, bump_version, owner_scope
+from tracker.models import Habit
+from tracker.tasks import due_reminders, reschedule_missed_reminders
+
+BENCH_REPLICA = 'bench_replica'
+
+
+@contextmanager
+def replica_connection():
+    """Реплика для замера: первая из DATABASE_REPLICAS или второе соединение к той же БД.
+
+    Соединение реплики смотрит во временную БД бенчмарка, как зеркало в тестах.
+    """
+    primary = connections['default'].settings_dict
+    if settings.DATABASE_REPLICAS:
+        alias = settings.DATABASE_REPLICAS[0]
+        old_name = connections[alias].settings_dict['NAME']
+        connections[alias].creation.set_as_test_mirror(primary)
+        try:
+            yield alias
+        finally:
+            connections[alias].close()
+            connections[alias].settings_dict['NAME'] = old_name
+        return
+    connections.settings[BENCH_REPLICA] = dict(primary)
+    try:
+        yield BENCH_REPLICA
+    finally:
+        connections[BENCH_REPLICA].close()
+        del connections[BENCH_REPLICA]
+        del connections.settings[BENCH_REPLICA]
+
+
+class Command(BaseCommand):
+    help = ('Нагрузка на основную БД без реплик и с репликой: запросы чтения привычек, публичной ленты '
+            'и выборки тика рассылки по базам')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--habits', type=int, default=10000)
+        parser.add_argument('--requests', type=int, default=300, help='Запросов на каждый эндпоинт')
+        parser.add_argument('--sweeps', type=int, default=20, help='Выборок тика рассылки')
+        parser.add_argument('--output', help='Файл для JSON-результатов')
+
+    @override_settings(ALLOWED_HOSTS=['testserver'])
+    def handle(self, *args, **options):
+        rows = []
+        with benchmark_database():
+            env = environment()
+            owners = seed_users(options['users'])
+            seed_habits(owners, options['habits'])
+            public_ids = list(Habit.objects.values_list('id', flat=True)[::10])
+            Habit.objects.filter(id__in=public_ids).update(is_public=True)
+            first_habits = {}
+            for owner_id, habit_id in Habit.objects.order_by('id').values_list('owner_id', 'id').iterator():
+                first_habits.setdefault(owner_id, habit_id)
+
+            with replica_connection() as replica:
+                for label, replicas in (('primary_only', []), ('with_replica', [replica])):
+                    # окно отставания выключено: каждый холодный список может читаться с реплики
+                    with override_settings(DATABASE_REPLICAS=replicas, DATABASE_REPLICA_LAG=0):
+                        rows += self.run_workload(label, replica, owners, first_habits, options)
+
+        for row in rows:
+            self.stdout.write(f"{row['mode']} {row['name']}: основная БД — {row['primary_queries']} запросов, "
+                              f"реплика — {row['replica_queries']}, {row['seconds']} с")
+        write_results(options['output'], {
+            'benchmark': 'replica_reads',
+            'environment': env,
+            'parameters': {key: options[key] for key in ('users', 'habits', 'requests', 'sweeps')},
+            'results': rows,
+        })
+
+    def run_workload(self, label, replica, owners, first_habits, options):
+        client = APIClient()
+        now = timezone.now()
+        cases = {
+            # холодный кэш: перед запросом меняется версия списка, как после записи
+            'habits_list': lambda i: (bump_version(owner_scope(owners[i].pk)),
+                                      client.get('/api/tracker/habits/')),
+            'habits_public': lambda i: (bump_version(PUBLIC_SCOPE), client.get('/api/tracker/habits/public/')),
+            'habits_detail': lambda i: client.get(f'/api/tracker/habits/{first_habits[owners[i].pk]}/'),
+        }
+        rows = []
+        for name, call in cases.items():
+            rows.append(self.measure(label, name, replica, options['requests'], lambda i: (
+                client.force_authenticate(user=owners[i % len(owners)]), call(i % len(owners)),
+            )))
+        rows.append(self.measure(label, 'sweep_selection', replica, options['sweeps'], lambda i: self.select_due(
+            now + timedelta(minutes=i * 7),
+        )))
+        return rows
+
+    @staticmethod
+    def select_due(now):
+        """Выборка тика без переноса сроков: пропущенные и должные напоминания"""
+        with transaction.atomic():
+            list(due_reminders(now, for_update=True))
+            transaction.set_rollback(True)
+        with transaction.atomic():
+            reschedule_missed_reminders(now)
+            # замеры не должны менять расписание для следующих тиков
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def measure(label, name, replica, repeat, func):
+        with ExitStack() as stack:
+            primary = stack.enter_context(CaptureQueriesContext(connections['default']))
+            secondary = stack.enter_context(CaptureQueriesContext(connections[replica]))
+            started = time.perf_counter()
+            for i in range(repeat):
+                func(i)
+            elapsed = time.perf_counter() - started
+        return {
+            'mode': label,
+            'name': name,
+            'runs': repeat,
+            'primary_queries': len(primary.captured_queries),
+            'replica_queries': len(secondary.captured_queries),
+            'seconds': round(elapsed, 3),
+        }
@@ -0,0 +1,97 @@
+import io
+import itertools
+import logging
+import time
+from datetime import time as dt_time, timedelta
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from django.utils import timezone
+
+from tracker.benchmarks import benchmark_database, seed_habits, seed_users, write_results
+from tracker.models import Habit, ReminderDelivery
+from tracker.tasks import send_reminder_notification
+
+# режим -> (уровень логгеров tracker, REMINDER_LOG_SAMPLE_RATE)
+MODES = {
+    'debug': (logging.DEBUG, 0.0),
+    'sampled': (logging.INFO, 0.01),
+    'aggregate': (logging.INFO, 0.0),
+}
+
+
+class _OkResponse:
+    status_code = 200
+    headers = {'Content-Type': 'application/json'}
+
+    def json(self):
+        return {'ok': True, 'result': {}}
+
+
+class _OkSession:
+    """Сессия, которая мгновенно отвечает ok=true, без сети"""
+
+    def get(self, url, params=None, timeout=None):
+        return _OkResponse()
+
+
+class Command(BaseCommand):
+    help = 'Сравнение процессорного времени тика рассылки при разных режимах логирования'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--habits', type=int, default=20000, help='Сколько напоминаний приходится на тик')
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--output', help='Файл для JSON-результатов')
+
+    def handle(self, *args, **options):
+        results = []
+        with benchmark_database():
+            owners = seed_users(options['users'])
+            seeded_at = timezone.now().replace(second=0, microsecond=0)
+            seed_habits(owners, options['habits'], hours=[0], now=seeded_at)
+            # все напоминания на один тик; отправка подменена, чтобы мерить только сам тик
+            tick = seeded_at + timedelta(minutes=1)
+            Habit.objects.update(time_of_day=dt_time(0, 0), next_reminder_at=tick)
+
+            # у каждого прогона свой срок, иначе слоты доставки уже заняты прошлым прогоном и он ничего не отправляет
+            ticks = (tick + timedelta(seconds=run) for run in itertools.count())
+            for mode, (level, sample_rate) in MODES.items():
+                cpu, records, sent = self._run(mode, level, sample_rate, ticks, options['repeat'])
+                row = {'mode': mode, 'habits': options['habits'], 'cpu_seconds': round(cpu, 3),
+                       'log_bytes': records, 'sent_min': sent}
+                results.append(row)
+                self.stdout.write(f"{mode}: {row['cpu_seconds']} с CPU на тик, {records} байт логов, "
+                                  f"отправлено не меньше {sent}")
+        write_results(options['output'], {'benchmark': 'sweep_logging', 'results': results})
+
+    def _run(self, mode, level, sample_rate, ticks, repeat):
+        stream = io.StringIO()
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s %(message)s'))
+        tracker_logger = logging.getLogger('tracker')
+        previous_level = tracker_logger.level
+        tracker_logger.addHandler(handler)
+        tracker_logger.setLevel(level)
+        best, sent = None, []
+        try:
+            with override_settings(REMINDER_LOG_SAMPLE_RATE=sample_rate, REMINDER_BATCH_SIZE=10 ** 9,
+                                   TELEGRAM_GLOBAL_RATE=10 ** 9, TELEGRAM_CHAT_RATE=10 ** 9), \
+                    mock.patch('tracker.services.get_tg_session', return_value=_OkSession()):
+                for _, tick in zip(range(repeat), ticks):
+                    Habit.objects.update(next_reminder_at=tick)
+                    stream.seek(0)
+                    stream.truncate()
+                    with mock.patch('tracker.tasks.timezone.now', return_value=tick):
+                        started = time.process_time()
+                        send_reminder_notification()
+                        elapsed = time.process_time() - started
+                    best = elapsed if best is None else min(best, elapsed)
+                    sent.append(ReminderDelivery.objects.filter(
+                        scheduled_for=tick, status=ReminderDelivery.STATUS_SENT,
+                    ).count())
+        finally:
+            tracker_logger.removeHandler(handler)
+            tracker_logger.setLevel(previous_level)
+        return best, len(stream.getvalue().encode()), min(sent)
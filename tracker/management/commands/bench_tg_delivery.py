@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from tracker.benchmarks import write_results
+from tracker.services import TelegramSendScheduler, deliver_reminders
+from tracker.telegram_stub import fake_telegram_process
+
+# темп, который не ограничивает отправку: замеряется только пул соединений
+UNLIMITED_RATE = 1e9
+
+
+class Command(BaseCommand):
+    help = 'Замер доставки напоминаний в локальную заглушку Telegram API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=10000)
+        parser.add_argument('--workers', type=int, default=None, help='По умолчанию TELEGRAM_MAX_WORKERS')
+        parser.add_argument('--latency-ms', type=float, default=20, help='Задержка ответа заглушки')
+        parser.add_argument('--rate', type=float, default=0,
+                            help='Лимит сообщений в секунду на бота и на чат; 0 — без лимитов')
+        parser.add_argument('--deadline', type=float, default=3600, help='Окно отправки в секундах')
+        parser.add_argument('--output', help='Файл для JSON-результатов')
+
+    def handle(self, *args, **options):
+        messages = [
+            (i, str(100000 + i), f'Напоминание {i}')
+            for i in range(options['messages'])
+        ]
+        with fake_telegram_process(latency=options['latency_ms'] / 1000) as base_url, \
+                override_settings(TELEGRAM_URL=base_url, TELEGRAM_BOT_URL='bench'):
+            rate = options['rate'] or UNLIMITED_RATE
+            scheduler = TelegramSendScheduler(global_rate=rate, chat_rate=rate, deadline=options['deadline'])
+            started = time.perf_counter()
+            results = deliver_reminders(messages, max_workers=options['workers'], scheduler=scheduler)
+            elapsed = time.perf_counter() - started
+
+        sent = sum(1 for result in results if result.ok)
+        row = {
+            'messages': len(messages),
+            'sent': sent,
+            'failed': len(results) - sent,
+            'seconds': round(elapsed, 3),
+            'messages_per_second': round(len(messages) / elapsed, 1),
+        }
+        self.stdout.write(
+            f"{row['sent']}/{row['messages']} за {row['seconds']} с ({row['messages_per_second']} сообщений/с)"
+        )
+        write_results(options['output'], {'benchmark': 'tg_delivery', 'results': [row]})
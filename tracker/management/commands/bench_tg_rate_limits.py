@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from tracker.benchmarks import write_results
+from tracker.services import TelegramSendScheduler, deliver_reminders
+from tracker.telegram_stub import fake_telegram_process
+
+
+class Command(BaseCommand):
+    help = 'Замер пропускной способности отправки на заглушке Telegram API, которая соблюдает лимиты'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=600)
+        parser.add_argument('--chats', type=int, default=300)
+        parser.add_argument('--global-rate', type=float, default=30, help='Лимит сообщений в секунду на бота')
+        parser.add_argument('--chat-rate', type=float, default=1, help='Лимит сообщений в секунду на чат')
+        parser.add_argument('--latency-ms', type=float, default=20)
+        parser.add_argument('--output', help='Файл для JSON-результатов')
+
+    def handle(self, *args, **options):
+        messages = [
+            (i, str(100000 + i % options['chats']), f'Напоминание {i}')
+            for i in range(options['messages'])
+        ]
+        global_rate, chat_rate = options['global_rate'], options['chat_rate']
+        stub_options = {
+            'latency': options['latency_ms'] / 1000,
+            'global_rate': global_rate,
+            'chat_rate': chat_rate,
+            # небольшой запас на сетевой джиттер, как у настоящего API
+            'burst': 2,
+        }
+        with fake_telegram_process(**stub_options) as base_url, \
+                override_settings(TELEGRAM_URL=base_url, TELEGRAM_BOT_URL='bench'):
+            scheduler = TelegramSendScheduler(global_rate=global_rate, chat_rate=chat_rate, deadline=3600)
+            started = time.perf_counter()
+            results = deliver_reminders(messages, scheduler=scheduler)
+            elapsed = time.perf_counter() - started
+
+        sent = sum(1 for result in results if result.ok)
+        achieved = sent / elapsed
+        row = {
+            'messages': len(messages),
+            'sent': sent,
+            'failed': len(results) - sent,
+            'retried': sum(1 for result in results if result.attempts > 1),
+            'seconds': round(elapsed, 3),
+            'messages_per_second': round(achieved, 2),
+            'limit_utilization': round(achieved / global_rate, 3),
+        }
+        self.stdout.write(
+            f"{sent}/{len(messages)} за {row['seconds']} с: {row['messages_per_second']} сообщений/с "
+            f"({row['limit_utilization']:.0%} лимита), повторов: {row['retried']}"
+        )
+        write_results(options['output'], {'benchmark': 'tg_rate_limits', 'results': [row]})
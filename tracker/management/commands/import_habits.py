@@ -0,0 +1,68 @@
+import json
+import os
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from tracker.imports import build_habits, chunked, read_rows, write_chunk
+from tracker.models import HabitImportCheckpoint
+
+
+class Command(BaseCommand):
+    help = 'Импорт привычек из CSV или NDJSON пачками с продолжением после сбоя'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл с привычками; владелец задаётся колонкой owner_email')
+        parser.add_argument('--file-format', choices=['csv', 'ndjson'],
+                            help='Формат файла (по умолчанию — по расширению)')
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--method', choices=['bulk', 'copy'], default='bulk',
+                            help='bulk_create или COPY FROM STDIN (только PostgreSQL)')
+        parser.add_argument('--source', help='Имя импорта для контрольной точки (по умолчанию — путь к файлу)')
+        parser.add_argument('--restart', action='store_true', help='Начать импорт сначала, сбросив контрольную точку')
+        parser.add_argument('--errors', help='Файл NDJSON для отклонённых строк (номер строки и ошибки)')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['file_format'] or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+        if options['method'] == 'copy' and connection.vendor != 'postgresql':
+            raise CommandError('COPY поддерживается только в PostgreSQL, используйте --method bulk.')
+
+        source = options['source'] or os.path.abspath(path)
+        checkpoint, _ = HabitImportCheckpoint.objects.get_or_create(source=source)
+        if options['restart']:
+            checkpoint.rows_done = checkpoint.imported = checkpoint.skipped = 0
+            checkpoint.save()
+        if checkpoint.rows_done:
+            self.stdout.write(f'Продолжение импорта со строки {checkpoint.rows_done + 1}')
+
+        errors_file = open(options['errors'], 'a', encoding='utf-8') if options['errors'] else None
+        rows = islice(read_rows(path, file_format), checkpoint.rows_done, None)
+        started = time.perf_counter()
+        processed = imported = 0
+        try:
+            for chunk in chunked(rows, options['chunk_size']):
+                habits, errors = build_habits(chunk, start_line=checkpoint.rows_done + 1)
+                write_chunk(habits, checkpoint, len(chunk), len(errors), options['method'])
+                if errors_file:
+                    for line, item_errors in errors:
+                        errors_file.write(json.dumps({'line': line, 'errors': item_errors}, ensure_ascii=False) + '\n')
+                processed += len(chunk)
+                imported += len(habits)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f'Строк {checkpoint.rows_done}: импортировано {checkpoint.imported}, '
+                    f'отклонено {checkpoint.skipped}, {processed / elapsed:.0f} строк/с'
+                )
+        finally:
+            if errors_file:
+                errors_file.close()
+
+        elapsed = time.perf_counter() - started
+        rate = processed / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: обработано {processed} строк за {elapsed:.1f} с ({rate:.0f} строк/с), '
+            f'импортировано {imported}, всего по файлу {checkpoint.imported}'
+        ))
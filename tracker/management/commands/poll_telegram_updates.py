@@ -0,0 +1,42 @@
+import logging
+import time
+
+import requests
+from django.core.management.base import BaseCommand
+
+from tracker.services import TelegramAPIError
+from tracker.telegram_updates import fetch_updates, next_offset, process_all_pending
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = ('Получение входящих обновлений Telegram через getUpdates (long polling) и их пакетный разбор. '
+            'Для режима без webhook: пока у бота задан webhook, getUpdates недоступен')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Один цикл опроса и разбора, затем выход')
+        parser.add_argument('--timeout', type=int, default=30, help='Длительность long polling в секундах')
+        parser.add_argument('--limit', type=int, default=100, help='Обновлений за один запрос (до 100)')
+        parser.add_argument('--batch-size', type=int, help='Обновлений в одной пачке разбора')
+
+    def handle(self, *args, **options):
+        offset = next_offset()
+        while True:
+            try:
+                fetched, offset = fetch_updates(offset, timeout=0 if options['once'] else options['timeout'],
+                                                limit=options['limit'])
+            except (TelegramAPIError, requests.RequestException):
+                if options['once']:
+                    raise
+                logger.exception("Не удалось получить обновления Telegram, повтор через 5 с")
+                time.sleep(5)
+                continue
+            result = process_all_pending(options['batch_size'])
+            if fetched or options['once']:
+                self.stdout.write(
+                    f"Получено {fetched}, разобрано {result['updates']}, "
+                    f"ответов {result['replies']}, нажатий подтверждено {result['answers']}"
+                )
+            if options['once']:
+                return
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tracker.partitions import PARTITION_KEYS, convert_to_partitioned, rotate_partitions, supports_partitioning
+
+
+class Command(BaseCommand):
+    help = ('Помесячные секции истории отметок и доставок: создание секций вперёд, '
+            'свёртка в дневные сводки и удаление устаревших месяцев')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--convert', action='store_true',
+                            help='Один раз перевести обычные таблицы в секционированные (только PostgreSQL)')
+        parser.add_argument('--retention-months', type=int, help='Сколько месяцев хранить подробную историю')
+        parser.add_argument('--ahead', type=int, help='На сколько месяцев вперёд создавать секции')
+
+    def handle(self, *args, **options):
+        if options['convert']:
+            if not supports_partitioning():
+                raise CommandError('Секционирование поддерживается только в PostgreSQL.')
+            for model in PARTITION_KEYS:
+                converted = convert_to_partitioned(model, ahead=options['ahead'])
+                state = 'переведена на секции' if converted else 'уже секционирована'
+                self.stdout.write(f'{model._meta.db_table}: {state}')
+
+        report = rotate_partitions(retention_months=options['retention_months'], ahead=options['ahead'])
+        for table, changes in report.items():
+            self.stdout.write(
+                f"{table}: создано {len(changes['created'])}, удалено {len(changes['dropped'])}, "
+                f"строк сводки {changes['rolled_up']}"
+            )
@@ -0,0 +1,165 @@
+import json
+import time
+from datetime import timedelta
+
+from celery import current_app
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from tracker.benchmarks import (
+    benchmark_database, compare_results, environment, measure, seed_habits, seed_users, summarize, write_results,
+)
+from tracker.cache import PUBLIC_SCOPE, bump_version, owner_scope
+from tracker.models import Habit, ReminderDelivery
+from tracker.tasks import send_reminder_notification
+from tracker.telegram_stub import fake_telegram_process
+from users.models import User
+
+SECTIONS = ('api', 'sweep')
+LOGIN_PASSWORD = 'bench-password'
+
+
+class Command(BaseCommand):
+    help = ('Набор замеров для сравнения коммитов: p50/p99 и пропускная способность эндпоинтов привычек '
+            'и пользователей, полный тик рассылки на заглушке Telegram; результаты — в JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Пользователей в таблице')
+        parser.add_argument('--habits', type=int, default=20000, help='Привычек в таблице (до миллионов)')
+        parser.add_argument('--public', type=int, default=1000, help='Сколько из них публичных')
+        parser.add_argument('--requests', type=int, default=200, help='Запросов на каждый эндпоинт привычек')
+        parser.add_argument('--auth-requests', type=int, default=20,
+                            help='Запросов на регистрацию и вход (каждый хеширует пароль)')
+        parser.add_argument('--due', type=int, default=2000, help='Напоминаний в одном тике рассылки')
+        parser.add_argument('--sweeps', type=int, default=5, help='Сколько тиков рассылки замерить')
+        parser.add_argument('--latency-ms', type=float, default=20, help='Задержка ответа заглушки Telegram')
+        parser.add_argument('--only', default=','.join(SECTIONS), help=f'Разделы через запятую: {", ".join(SECTIONS)}')
+        parser.add_argument('--output', help='Файл для JSON-результатов')
+        parser.add_argument('--compare', help='JSON предыдущего прогона для сравнения')
+        parser.add_argument('--max-regression', type=float, default=20,
+                            help='Допустимое ухудшение метрики в процентах при --compare')
+
+    @override_settings(ALLOWED_HOSTS=['testserver'])
+    def handle(self, *args, **options):
+        sections = [section.strip() for section in options['only'].split(',') if section.strip()]
+        unknown = set(sections) - set(SECTIONS)
+        if unknown:
+            raise CommandError(f'Неизвестные разделы: {", ".join(sorted(unknown))}')
+
+        results = []
+        with benchmark_database():
+            env = environment()
+            started = time.perf_counter()
+            owners = seed_users(options['users'])
+            # расписание фоновых привычек отодвинуто на час, чтобы во время замера они не стали должными
+            seed_habits(owners, options['habits'], now=timezone.now() + timedelta(hours=1))
+            public_ids = Habit.objects.order_by('id').values_list('id', flat=True)[:options['public']]
+            Habit.objects.filter(id__in=list(public_ids)).update(is_public=True)
+            self.stdout.write(f"Данные: {options['users']} пользователей, {options['habits']} привычек "
+                              f"за {time.perf_counter() - started:.1f} с")
+            if 'api' in sections:
+                results += self.bench_api(owners[0], options)
+            if 'sweep' in sections:
+                results += self.bench_sweep(owners, options)
+
+        for row in results:
+            self.stdout.write(f"{row['name']}: p50={row['p50_ms']} мс, p99={row['p99_ms']} мс, "
+                              f"{row['per_second']}/с")
+        payload = {
+            'benchmark': 'suite',
+            'environment': env,
+            'parameters': {key: options[key] for key in (
+                'users', 'habits', 'public', 'requests', 'auth_requests', 'due', 'sweeps', 'latency_ms',
+            )},
+            'results': results,
+        }
+        write_results(options['output'], payload)
+        if options['compare']:
+            self.compare(options['compare'], payload, options['max_regression'])
+
+    def bench_api(self, owner, options):
+        client = APIClient()
+        client.force_authenticate(user=owner)
+        anonymous = APIClient()
+        login_user = User.objects.create(email='login@bench.local')
+        login_user.set_password(LOGIN_PASSWORD)
+        login_user.save()
+
+        counter = iter(range(10 ** 9))
+        scopes = {'habits_list': owner_scope(owner.pk), 'habits_public': PUBLIC_SCOPE}
+        urls = {'habits_list': '/api/tracker/habits/', 'habits_public': '/api/tracker/habits/public/'}
+        cases = []
+        for name, url in urls.items():
+            # холодный кэш: перед запросом меняется версия, как после записи привычки
+            cases.append((f'api.{name}.cold', options['requests'],
+                          lambda url=url, scope=scopes[name]: (bump_version(scope), client.get(url))[1]))
+            cases.append((f'api.{name}.warm', options['requests'], lambda url=url: client.get(url)))
+        cases += [
+            ('api.habits_create', options['requests'], lambda: client.post(
+                '/api/tracker/habits/', data={'action': f'Новая привычка {next(counter)}', 'place': 'Дома'})),
+            ('api.users_register', options['auth_requests'], lambda: anonymous.post(
+                '/users/register/', data={'email': f'new{next(counter)}@bench.local', 'password': 'secret-pass'})),
+            ('api.users_login', options['auth_requests'], lambda: anonymous.post(
+                '/users/login/', data={'email': login_user.email, 'password': LOGIN_PASSWORD})),
+        ]
+
+        rows = []
+        for name, repeat, request in cases:
+            errors = []
+            durations = measure(lambda: errors.append(request().status_code >= 400), repeat)
+            rows.append({
+                'name': name,
+                **summarize(durations),
+                'per_second': round(len(durations) / sum(durations), 1),
+                'errors': sum(errors),
+            })
+        return rows
+
+    def bench_sweep(self, owners, options):
+        """Полный тик send_reminder_notification: выборка, слоты, подзадачи и отправка в заглушку"""
+        due = options['due']
+        seed_habits(owners, due, seed=due, now=timezone.now() + timedelta(hours=1))
+        due_ids = list(Habit.objects.order_by('-id').values_list('id', flat=True)[:due])
+
+        durations, sent = [], []
+        with fake_telegram_process(latency=options['latency_ms'] / 1000) as base_url, \
+                override_settings(TELEGRAM_URL=base_url, TELEGRAM_BOT_URL='bench',
+                                  TELEGRAM_GLOBAL_RATE=10 ** 6, TELEGRAM_CHAT_RATE=10 ** 6):
+            eager = current_app.conf.task_always_eager
+            # chord подзадач выполняется в этом же процессе, без брокера
+            current_app.conf.task_always_eager = True
+            try:
+                for run in range(options['sweeps']):
+                    # у каждого тика свой срок, иначе слоты доставки уже заняты прошлым тиком
+                    scheduled_for = timezone.now() - timedelta(seconds=run + 1)
+                    Habit.objects.filter(id__in=due_ids).update(next_reminder_at=scheduled_for)
+                    durations += measure(send_reminder_notification, 1)
+                    sent.append(ReminderDelivery.objects.filter(
+                        scheduled_for=scheduled_for, status=ReminderDelivery.STATUS_SENT,
+                    ).count())
+            finally:
+                current_app.conf.task_always_eager = eager
+
+        summary = summarize(durations)
+        return [{
+            'name': 'sweep.send_reminder_notification',
+            **summary,
+            'per_second': round(due / (summary['mean_ms'] / 1000), 1),
+            'reminders': due,
+            'sent_min': min(sent),
+        }]
+
+    def compare(self, path, payload, threshold):
+        with open(path, encoding='utf-8') as fh:
+            baseline = json.load(fh)
+        self.stdout.write(f"Сравнение с {baseline.get('environment', {}).get('revision') or path}:")
+        regressions = []
+        for name, metric, old, new, change, regressed in compare_results(baseline, payload, threshold):
+            mark = ' РЕГРЕССИЯ' if regressed else ''
+            self.stdout.write(f"  {name} {metric}: {old} -> {new} ({change:+}%){mark}")
+            if regressed:
+                regressions.append(f'{name} {metric}')
+        if regressions:
+            raise CommandError(f'Ухудшение больше {threshold}%: {", ".join(regressions)}')
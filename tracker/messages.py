@@ -0,0 +1,49 @@
+"""Текст напоминания о привычке.
+
+Текст собирается при сохранении привычки и хранится в Habit.reminder_message вместе с версией
+шаблона, поэтому рассылка ничего не форматирует. При изменении шаблона нужно увеличить
+REMINDER_MESSAGE_VERSION: тексты старой версии считаются устаревшими и пересобираются перед отправкой.
+"""
+
+REMINDER_MESSAGE_VERSION = 1
+
+# поля привычки, из которых собирается текст (плюс action связанной привычки)
+MESSAGE_SOURCE_FIELDS = ('id', 'action', 'place', 'time_of_day', 'duration_seconds', 'reward', 'related_habit')
+
+
+def render_reminder_message(action, place, time_of_day, duration_seconds, reward, related_action):
+    """Собирает текст напоминания из значений полей привычки."""
+    time_str = time_of_day.strftime('%H:%M') if time_of_day else 'любое время'
+    place_str = f" в {place}" if place else ""
+    
+    message = (
+        f"! Напоминание о привычке!\n\n"
+        f"Я буду {action}{place_str} в {time_str}.\n"
+        f"Время выполнения: {duration_seconds} секунд."
+    )
+    
+    if reward:
+        message += f"\nВознаграждение: {reward}"
+    elif related_action:
+        message += f"\nПосле выполнения: {related_action}"
+    
+    return message
+
+
+DONE_CALLBACK_PREFIX = 'done'
+
+
+def done_keyboard(habit_id, scheduled_ts):
+    """Кнопка «Выполнено» под напоминанием; в callback_data — привычка и срок напоминания (unix-время)"""
+    return {'inline_keyboard': [[
+        {'text': 'Выполнено', 'callback_data': f'{DONE_CALLBACK_PREFIX}:{habit_id}:{int(scheduled_ts)}'},
+    ]]}
+
+
+def parse_done_callback(data):
+    """Разбирает callback_data кнопки «Выполнено»; возвращает (habit_id, scheduled_ts) или None"""
+    prefix, _, rest = (data or '').partition(':')
+    habit_id, _, scheduled_ts = rest.partition(':')
+    if prefix != DONE_CALLBACK_PREFIX or not habit_id.isdigit() or not scheduled_ts.isdigit():
+        return None
+    return int(habit_id), int(scheduled_ts)
@@ -1,6 +1,11 @@
+from datetime import datetime, timedelta
+
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 
+from .cache import bump_version, owner_scope
+from .messages import REMINDER_MESSAGE_VERSION, render_reminder_message
 from .validators import (
     validate_habit,
     validate_duration_seconds_value,
@@ -8,6 +13,43 @@ from .validators import (
 )
 
 
+def next_occurrence(time_of_day, after, tz):
+    """Ближайший момент с локальным временем time_of_day строго позже after"""
+    local_date = after.astimezone(tz).date()
+    candidate = datetime.combine(local_date, time_of_day, tzinfo=tz)
+    if candidate <= after:
+        candidate = datetime.combine(local_date + timedelta(days=1), time_of_day, tzinfo=tz)
+    return candidate
+
+
+def realign_to_wall_clock(moment, time_of_day, tz):
+    """Возвращает момент с локальным временем time_of_day в сутках, ближайших к moment.
+
+    Срок напоминания сдвигается в UTC на целые сутки, поэтому после перехода на летнее/зимнее
+    время он уезжает на час от локального time_of_day; здесь он возвращается на место.
+    """
+    local_date = moment.astimezone(tz).date()
+    candidates = [
+        datetime.combine(local_date + timedelta(days=shift), time_of_day, tzinfo=tz)
+        for shift in (-1, 0, 1)
+    ]
+    return min(candidates, key=lambda candidate: abs(candidate - moment))
+
+
+def set_null_and_mark_message_stale(collector, field, sub_objs, using):
+    """on_delete для related_habit: обнуляет связь и помечает текст напоминания устаревшим.
+
+    Выполняется тем же UPDATE, что и обнуление, без запросов на каждую привычку; текст
+    пересобирается перед отправкой.
+    """
+    models.SET_NULL(collector, field, sub_objs, using)
+    collector.add_field_update(field.model._meta.get_field('reminder_message_version'), 0, sub_objs)
+    # related_habit входит в ответ API: дельта-синхронизация должна увидеть изменение
+    collector.add_field_update(field.model._meta.get_field('updated_at'), timezone.now(), sub_objs)
+    # связанные привычки могут принадлежать другим владельцам: их закэшированные списки тоже устарели
+    bump_version(*{owner_scope(habit.owner_id) for habit in sub_objs})
+
+
 class Habit(models.Model):
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='habits', on_delete=models.CASCADE)
     action = models.CharField(max_length=300)
@@ -15,7 +57,8 @@ class Habit(models.Model):
     time_of_day = models.TimeField(null=True, blank=True)
 
     is_pleasant = models.BooleanField(default=False)
-    related_habit = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL, related_name='related_to')
+    related_habit = models.ForeignKey('self', null=True, blank=True, on_delete=set_null_and_mark_message_stale,
+                                      related_name='related_to')
     reward = models.CharField(max_length=300, blank=True)
 
     period_days = models.PositiveIntegerField(
@@ -31,22 +74,210 @@ class Habit(models.Model):
 
     is_public = models.BooleanField(default=False)
 
+    # счётчики выполнения; обновляются при каждой отметке (tracker/completions.py)
+    current_streak = models.PositiveIntegerField(default=0, editable=False)
+    longest_streak = models.PositiveIntegerField(default=0, editable=False)
+    last_completed_on = models.DateField(null=True, blank=True, editable=False)
+    # бит i — выполнена ли привычка за i дней до last_completed_on (последние 30 дней)
+    completion_mask = models.PositiveBigIntegerField(default=0, editable=False)
+
+    # момент следующего напоминания; сдвигается на period_days после каждой рассылки
+    next_reminder_at = models.DateTimeField(null=True, blank=True, editable=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # готовый текст напоминания и версия шаблона, по которой он собран (tracker/messages.py)
+    reminder_message = models.TextField(blank=True, editable=False)
+    reminder_message_version = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    # поля, которые заполняет refresh_derived_fields()
+    DERIVED_FIELDS = ('next_reminder_at', 'reminder_message', 'reminder_message_version')
+
     class Meta:
-        ordering = ['-created_at']
+        ordering = ['-created_at', '-id']
+        indexes = [
+            models.Index(fields=['next_reminder_at'], name='habit_next_reminder_idx'),
+            # курсорная пагинация: список владельца и публичная лента в порядке (created_at, id)
+            models.Index(fields=['owner', '-created_at', '-id'], name='habit_owner_created_idx'),
+            models.Index(fields=['-created_at', '-id'], name='habit_public_created_idx',
+                         condition=models.Q(is_public=True)),
+            # дельта-синхронизация: изменения владельца после метки клиента
+            models.Index(fields=['owner', 'updated_at'], name='habit_owner_updated_idx'),
+        ]
 
     def clean(self):
         """Валидация модели через отдельные валидаторы"""
         validate_habit(self)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # запоминаем расписание из БД, чтобы пересчитывать next_reminder_at только при его изменении
+        instance._loaded_schedule = instance._schedule()
+        # а публичность — чтобы сбрасывать кэш публичной ленты, когда привычка из неё уходит
+        instance._loaded_is_public = instance.__dict__.get('is_public')
+        return instance
+
+    def _schedule(self):
+        return (self.__dict__.get('time_of_day'), self.__dict__.get('period_days'))
+
+    def refresh_derived_fields(self, now=None):
+        """Пересчитывает служебные поля, которые хранятся ради быстрой рассылки: срок и текст напоминания.
+
+        Вызывается из save(); при bulk_create/bulk_update его нужно вызвать вручную.
+        """
+        self.refresh_schedule(now=now)
+        self.refresh_reminder_message()
+
+    def refresh_schedule(self, now=None):
+        """Срок напоминания считается в часовом поясе владельца и хранится в UTC, поэтому тику не
+        нужно ничего переводить между поясами.
+        """
+        if self.time_of_day is None:
+            self.next_reminder_at = None
+        elif self.next_reminder_at is None or self._schedule() != getattr(self, '_loaded_schedule', None):
+            self.next_reminder_at = next_occurrence(self.time_of_day, now or timezone.now(), self.owner.timezone)
+        self._loaded_schedule = self._schedule()
+
+    def render_reminder_message(self):
+        related_action = self.related_habit.action if self.related_habit else None
+        return render_reminder_message(
+            self.action, self.place, self.time_of_day, self.duration_seconds, self.reward, related_action,
+        )
+
+    def refresh_reminder_message(self):
+        self.reminder_message = self.render_reminder_message()
+        self.reminder_message_version = REMINDER_MESSAGE_VERSION
+
     def save(self, *args, **kwargs):
         """Валидация будет выполняться всегда, независимо от источника данных"""
         self.full_clean()
+        self.refresh_derived_fields()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, *self.DERIVED_FIELDS}
         super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Я буду {self.action} в {self.time_of_day or 'любое время'} в {self.place}."
 
 
+class ReminderDelivery(models.Model):
+    """Журнал доставки: одна запись на привычку и срок напоминания.
+
+    Уникальность (habit, scheduled_for) гарантирует, что слот займёт только один тик,
+    даже если тики наложились или задача была перезапущена.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Ожидает отправки'),
+        (STATUS_SENT, 'Отправлено'),
+        (STATUS_FAILED, 'Ошибка отправки'),
+    ]
+
+    habit = models.ForeignKey(Habit, related_name='deliveries', on_delete=models.CASCADE)
+    scheduled_for = models.DateTimeField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    # токен тика, который занял слот: по нему тик узнаёт свои записи после вставки
+    claim_token = models.UUIDField()
+    claimed_at = models.DateTimeField()
+    sent_at = models.DateTimeField(null=True, blank=True)
+    # задержка доставки относительно срока напоминания
+    latency_ms = models.PositiveIntegerField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.CharField(max_length=300, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['habit', 'scheduled_for'], name='unique_reminder_slot'),
+        ]
+        indexes = [
+            # повтор неудавшихся отправок: следующий тик ищет их по сроку среди немногих строк с ошибкой
+            models.Index(fields=['scheduled_for'], name='reminder_failed_idx',
+                         condition=models.Q(status='failed')),
+        ]
+
+    def __str__(self):
+        return f"{self.habit_id} @ {self.scheduled_for:%Y-%m-%d %H:%M}: {self.status}"
+
+
+class HabitTombstone(models.Model):
+    """След удалённой привычки для дельта-синхронизации; хранится HABIT_TOMBSTONE_RETENTION_DAYS дней"""
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='habit_tombstones', on_delete=models.CASCADE)
+    habit_id = models.PositiveBigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['owner', 'deleted_at'], name='habit_tombstone_owner_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.owner_id}: {self.habit_id}"
+
+
+class HabitCompletion(models.Model):
+    """Отметка о выполнении привычки: не больше одной на привычку за день (по часовому поясу владельца)"""
+    habit = models.ForeignKey(Habit, related_name='completions', on_delete=models.CASCADE)
+    completed_on = models.DateField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['habit', 'completed_on'], name='unique_habit_completion_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.habit_id}: {self.completed_on}"
+
+
+class HabitDailyActivity(models.Model):
+    """Дневная сводка по привычке, в которую сворачиваются отметки и доставки из удаляемых старых месяцев"""
+    habit = models.ForeignKey(Habit, related_name='daily_activity', on_delete=models.CASCADE)
+    day = models.DateField()
+    completions = models.PositiveSmallIntegerField(default=0)
+    reminders_sent = models.PositiveIntegerField(default=0)
+    reminders_failed = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['habit', 'day'], name='unique_habit_activity_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.habit_id}: {self.day}"
+
+
+class HabitImportCheckpoint(models.Model):
+    """Позиция импорта привычек из файла: сохраняется в одной транзакции с каждой пачкой строк"""
+    source = models.CharField(max_length=500, unique=True)
+    rows_done = models.PositiveBigIntegerField(default=0)
+    imported = models.PositiveBigIntegerField(default=0)
+    skipped = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.source}: {self.rows_done}"
+
+
+class TelegramUpdate(models.Model):
+    """Входящее обновление Telegram (webhook или getUpdates).
+
+    update_id — первичный ключ, поэтому повторно доставленное обновление не записывается дважды;
+    максимальный update_id служит смещением для следующего getUpdates.
+    """
+    update_id = models.BigIntegerField(primary_key=True)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['update_id'], name='tg_update_pending_idx', condition=models.Q(processed_at__isnull=True)),
+        ]
+
+    def __str__(self):
+        return str(self.update_id)
@@ -1,8 +1,110 @@
-from rest_framework.pagination import PageNumberPagination
+from datetime import datetime
 
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+from rest_framework.response import Response
 
-class HabitsPaginator(PageNumberPagination):
+
+class HabitsPaginator(CursorPagination):
+    """Курсорная (keyset) пагинация по паре (created_at, id).
+
+    Курсор хранит created_at и id последней записи страницы, следующая страница выбирается
+    условием "строго после этой пары" по индексу, без OFFSET. Поэтому время страницы не зависит
+    от её номера, а записи с одинаковым created_at не теряются и не дублируются.
+    Общее количество (COUNT) считается только по запросу ?count=true.
+    """
 
     page_size = 5
     page_size_query_param = "page_size"
-    max_page_size = 5
+    # для массовых клиентов: по умолчанию 5, но можно явно запросить до 100 записей на страницу
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        reverse = self._start(request)
+        self.count = queryset.count() if self._wants_count(request) else None
+        return self._set_page(list(self._window(queryset, reverse)), reverse)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset() для асинхронных представлений"""
+        reverse = self._start(request)
+        self.count = await queryset.acount() if self._wants_count(request) else None
+        return self._set_page([row async for row in self._window(queryset, reverse)], reverse)
+
+    def _start(self, request):
+        """Разбирает параметры запроса; возвращает, идёт ли выборка назад"""
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.cursor = self.decode_cursor(request)
+        return bool(self.cursor and self.cursor.reverse)
+
+    def _wants_count(self, request):
+        return request.query_params.get(self.count_query_param, '').lower() in ('1', 'true')
+
+    def _window(self, queryset, reverse):
+        if reverse:
+            queryset = queryset.order_by('created_at', 'id')
+        else:
+            queryset = queryset.order_by('-created_at', '-id')
+        if self.cursor is not None:
+            queryset = queryset.filter(self._after(self.cursor.position, reverse))
+        # одна лишняя запись показывает, есть ли следующая страница
+        return queryset[:self.page_size + 1]
+
+    def _set_page(self, rows, reverse):
+        has_more = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor is not None
+        return self.page
+
+    def _after(self, position, reverse):
+        """Условие "после позиции курсора" в порядке выборки"""
+        try:
+            created_at, pk = position.rsplit('|', 1)
+            created_at, pk = datetime.fromisoformat(created_at), int(pk)
+        except (AttributeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if reverse:
+            return Q(created_at__gte=created_at) & (Q(created_at__gt=created_at) | Q(id__gt=pk))
+        # created_at__lte задаёт диапазон по индексу, остальное отсекает записи с той же меткой
+        return Q(created_at__lte=created_at) & (Q(created_at__lt=created_at) | Q(id__lt=pk))
+
+    @staticmethod
+    def _position(habit):
+        return f'{habit.created_at.isoformat()}|{habit.pk}'
+
+    def _link(self, position, reverse):
+        return self.encode_cursor(Cursor(offset=0, reverse=reverse, position=position))
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if self.page:
+            return self._link(self._position(self.page[-1]), reverse=False)
+        return self._link(self.cursor.position, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.page:
+            return self._link(self._position(self.page[0]), reverse=True)
+        return self._link(self.cursor.position, reverse=True)
+
+    def get_paginated_response(self, data):
+        payload = {}
+        if self.count is not None:
+            payload['count'] = self.count
+        payload.update(next=self.get_next_link(), previous=self.get_previous_link(), results=data)
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        schema = super().get_paginated_response_schema(schema)
+        schema['properties']['count'] = {'type': 'integer', 'example': 123}
+        return schema
@@ -0,0 +1,233 @@
+"""Помесячное хранение истории событий: отметок о выполнении и журнала доставки.
+
+В PostgreSQL таблицы HabitCompletion и ReminderDelivery секционируются по месяцам
+(PARTITION BY RANGE по дате события), поэтому запросы с условием на дату читают только нужные
+месяцы, а старые месяцы удаляются целиком через DROP TABLE без VACUUM. Перед удалением строки
+месяца сворачиваются в дневные сводки HabitDailyActivity.
+
+Таблицы создаются миграциями как обычные; convert_to_partitioned() один раз переводит их
+в секционированные (management-команда rotate_event_partitions --convert). Дальше
+rotate_partitions() (beat-задача раз в сутки) заранее создаёт секции на ближайшие месяцы
+и удаляет устаревшие. В других СУБД (SQLite в тестах) и для несекционированных таблиц
+устаревшие строки сворачиваются и удаляются обычным DELETE.
+"""
+import logging
+from datetime import date, datetime, time, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from tracker.models import HabitCompletion, HabitDailyActivity, ReminderDelivery
+
+logger = logging.getLogger(__name__)
+
+# модель -> поле, по которому таблица делится на месяцы
+PARTITION_KEYS = {
+    HabitCompletion: 'completed_on',
+    ReminderDelivery: 'scheduled_for',
+}
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return f'{table}_p{month:%Y%m}'
+
+
+def _bound(model, month):
+    """Граница секции в типе поля: дата или начало месяца в UTC"""
+    if isinstance(model._meta.get_field(PARTITION_KEYS[model]), models.DateTimeField):
+        return datetime.combine(month, time.min, tzinfo=dt_timezone.utc)
+    return month
+
+
+def _key_range(model, month):
+    key = PARTITION_KEYS[model]
+    return {f'{key}__gte': _bound(model, month), f'{key}__lt': _bound(model, add_months(month, 1))}
+
+
+def supports_partitioning():
+    return connection.vendor == 'postgresql'
+
+
+def is_partitioned(model):
+    if not supports_partitioning():
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid '
+            'WHERE c.relname = %s AND pg_table_is_visible(c.oid)',
+            [model._meta.db_table],
+        )
+        return cursor.fetchone() is not None
+
+
+def list_partitions(model):
+    """Месяцы существующих секций таблицы (секция по умолчанию не входит)"""
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT child.relname FROM pg_inherits i '
+            'JOIN pg_class parent ON parent.oid = i.inhparent '
+            'JOIN pg_class child ON child.oid = i.inhrelid '
+            'WHERE parent.relname = %s AND pg_table_is_visible(parent.oid)',
+            [table],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    prefix = f'{table}_p'
+    return sorted(
+        date(int(name[-6:-2]), int(name[-2:]), 1)
+        for name in names if name.startswith(prefix) and name[len(prefix):].isdigit()
+    )
+
+
+def create_partition(model, month):
+    table = model._meta.db_table
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TABLE IF NOT EXISTS {quote(partition_name(table, month))} PARTITION OF {quote(table)} '
+            f'FOR VALUES FROM (%s) TO (%s)',
+            [_bound(model, month), _bound(model, add_months(month, 1))],
+        )
+
+
+def convert_to_partitioned(model, ahead=None):
+    """Переводит обычную таблицу событий в секционированную по месяцам, сохраняя строки.
+
+    Первичный ключ и уникальные ограничения секционированной таблицы обязаны включать ключ
+    секционирования, поэтому первичный ключ становится (id, <ключ>); уникальность id по-прежнему
+    обеспечивает последовательность. Таблица блокируется на время переноса — запускать в окно
+    обслуживания.
+    """
+    if is_partitioned(model):
+        return False
+    ahead = settings.EVENT_PARTITIONS_AHEAD if ahead is None else ahead
+    table = model._meta.db_table
+    key = model._meta.get_field(PARTITION_KEYS[model]).column
+    legacy = f'{table}_legacy'
+    quote = connection.ops.quote_name
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {quote(table)} RENAME TO {quote(legacy)}')
+        cursor.execute(
+            f'CREATE TABLE {quote(table)} (LIKE {quote(legacy)} INCLUDING DEFAULTS INCLUDING IDENTITY) '
+            f'PARTITION BY RANGE ({quote(key)})'
+        )
+        cursor.execute(f'ALTER TABLE {quote(table)} ADD PRIMARY KEY ("id", {quote(key)})')
+        for constraint in model._meta.constraints:
+            columns = [model._meta.get_field(field).column for field in constraint.fields]
+            cursor.execute(
+                f'ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(constraint.name)} '
+                f'UNIQUE ({", ".join(quote(column) for column in columns)})'
+            )
+        for field in model._meta.concrete_fields:
+            if field.remote_field is None:
+                continue
+            related = field.related_model._meta
+            cursor.execute(
+                f'ALTER TABLE {quote(table)} ADD FOREIGN KEY ({quote(field.column)}) '
+                f'REFERENCES {quote(related.db_table)} ({quote(related.pk.column)}) DEFERRABLE INITIALLY DEFERRED'
+            )
+            cursor.execute(f'CREATE INDEX ON {quote(table)} ({quote(field.column)})')
+
+        cursor.execute(f'SELECT MIN({quote(key)}) FROM {quote(legacy)}')
+        oldest = cursor.fetchone()[0]
+        current = month_start(timezone.now())
+        month = month_start(oldest) if oldest is not None else current
+        while month <= add_months(current, ahead):
+            create_partition(model, month)
+            month = add_months(month, 1)
+        cursor.execute(f'CREATE TABLE {quote(table + "_default")} PARTITION OF {quote(table)} DEFAULT')
+
+        cursor.execute(f'INSERT INTO {quote(table)} SELECT * FROM {quote(legacy)}')
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence(%s, 'id'), COALESCE((SELECT MAX(id) FROM {quote(table)}), 0) + 1, false)",
+            [table],
+        )
+        cursor.execute(f'DROP TABLE {quote(legacy)}')
+        # LIKE не копирует индексы, поэтому индексы из Meta.indexes создаются заново на новой таблице,
+        # когда старая с теми же именами индексов уже удалена
+        with connection.schema_editor() as editor:
+            for index in model._meta.indexes:
+                cursor.execute(str(index.create_sql(model, editor)))
+    logger.info('Таблица %s переведена на помесячные секции', table)
+    return True
+
+
+def rollup_activity(model, start, end):
+    """Сворачивает события модели в интервале [start, end) в дневные сводки HabitDailyActivity.
+
+    Повторный запуск по тому же интервалу даёт тот же результат: значения сводки перезаписываются.
+    """
+    if model is HabitCompletion:
+        rows = (
+            HabitCompletion.objects.filter(completed_on__gte=start, completed_on__lt=end)
+            .values('habit_id', day=F('completed_on'))
+            .annotate(completions=Count('id'))
+        )
+        fields = ['completions']
+    else:
+        rows = (
+            ReminderDelivery.objects.filter(scheduled_for__gte=start, scheduled_for__lt=end)
+            .values('habit_id', day=TruncDate('scheduled_for', tzinfo=dt_timezone.utc))
+            .annotate(
+                reminders_sent=Count('id', filter=Q(status=ReminderDelivery.STATUS_SENT)),
+                reminders_failed=Count('id', filter=Q(status=ReminderDelivery.STATUS_FAILED)),
+            )
+        )
+        fields = ['reminders_sent', 'reminders_failed']
+    activity = [HabitDailyActivity(**row) for row in rows.order_by()]
+    HabitDailyActivity.objects.bulk_create(
+        activity, update_conflicts=True, unique_fields=['habit', 'day'], update_fields=fields, batch_size=5000,
+    )
+    return len(activity)
+
+
+def rotate_partitions(retention_months=None, ahead=None, now=None):
+    """Создаёт секции на ahead месяцев вперёд и удаляет месяцы старше retention_months.
+
+    Возвращает {имя таблицы: {'created': [...], 'dropped': [...], 'rolled_up': N}}.
+    """
+    retention_months = settings.EVENT_RETENTION_MONTHS if retention_months is None else retention_months
+    ahead = settings.EVENT_PARTITIONS_AHEAD if ahead is None else ahead
+    current = month_start(now or timezone.now())
+    cutoff = add_months(current, -retention_months)
+    report = {}
+    for model in PARTITION_KEYS:
+        table = model._meta.db_table
+        created, dropped, rolled_up = [], [], 0
+        if is_partitioned(model):
+            existing = set(list_partitions(model))
+            for offset in range(ahead + 1):
+                month = add_months(current, offset)
+                if month not in existing:
+                    create_partition(model, month)
+                    created.append(partition_name(table, month))
+            for month in sorted(existing):
+                if month >= cutoff:
+                    break
+                with transaction.atomic():
+                    rolled_up += rollup_activity(model, *_key_range(model, month).values())
+                    with connection.cursor() as cursor:
+                        cursor.execute(f'DROP TABLE {connection.ops.quote_name(partition_name(table, month))}')
+                dropped.append(partition_name(table, month))
+        else:
+            key = PARTITION_KEYS[model]
+            oldest = model.objects.order_by(key).values_list(key, flat=True).first()
+            if oldest is not None and month_start(oldest) < cutoff:
+                with transaction.atomic():
+                    rolled_up = rollup_activity(model, _bound(model, month_start(oldest)), _bound(model, cutoff))
+                    model.objects.filter(**{f'{key}__lt': _bound(model, cutoff)}).delete()
+                dropped.append(f'{table} < {cutoff}')
+        report[table] = {'created': created, 'dropped': dropped, 'rolled_up': rolled_up}
+    return report
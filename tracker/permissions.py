@@ -2,12 +2,16 @@ from rest_framework import permissions
 
 
 class IsOwnerOrReadOnly(permissions.BasePermission):
-    """Доступно для чтения всем, изменение только владельцу"""
+    """Доступно для чтения всем, изменение только владельцу.
+
+    Владелец сравнивается по owner_id без загрузки связанного объекта, поэтому проверка не обращается
+    к БД и подходит для асинхронных представлений.
+    """
 
     def has_object_permission(self, request, view, obj):
         if request.method in permissions.SAFE_METHODS:
             return True
-        return obj.owner == request.user
+        return obj.owner_id == request.user.pk
 
 
 class IsOwnerOnly(permissions.BasePermission):
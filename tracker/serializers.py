@@ -15,3 +15,26 @@ class HabitSerializer(serializers.ModelSerializer):
                   'reward', 'period_days', 'duration_seconds', 'is_public', 'created_at', 'updated_at']
         read_only_fields = ['created_at', 'updated_at', 'owner']
 
+
+
+class HabitBulkItemSerializer(HabitSerializer):
+    """Элемент массового запроса: related_habit принимается как id и разрешается сразу для всего пакета"""
+    id = serializers.IntegerField(required=False)
+    related_habit = serializers.IntegerField(required=False, allow_null=True)
+
+    def validate(self, attrs):
+        if self.context.get('bulk_update') and 'id' not in attrs:
+            raise serializers.ValidationError({'id': ['Обязательное поле.']})
+        if not self.context.get('bulk_update'):
+            attrs.pop('id', None)
+        return attrs
+
+
+class HabitCompletionSerializer(serializers.Serializer):
+    """Отметка о выполнении: дата по часовому поясу владельца, по умолчанию — сегодня"""
+    completed_on = serializers.DateField(required=False)
+
+    def validate_completed_on(self, value):
+        if value > self.context['today']:
+            raise serializers.ValidationError('Нельзя отметить выполнение в будущем.')
+        return value
@@ -1,35 +1,285 @@
+import json
 import logging
+import math
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
-from config.settings import TELEGRAM_URL, TELEGRAM_BOT_URL
+from requests.adapters import HTTPAdapter
+from django.conf import settings
 
 logger = logging.getLogger(__name__)
 
+# результат доставки одного сообщения: key — идентификатор, переданный вызывающим кодом,
+# sent_at — unix-время успешной отправки
+DeliveryResult = namedtuple('DeliveryResult', ['key', 'ok', 'error', 'attempts', 'sent_at'], defaults=(1, None))
 
-def send_tg_reminder(chat_id, message):
-    """Отправляет напоминание в Telegram."""
-    params = {
-        'text': message,
-        'chat_id': chat_id
-    }
-    
-    url = f"{TELEGRAM_URL}{TELEGRAM_BOT_URL}/sendMessage"
-    logger.info(f"Отправка сообщения в Telegram: chat_id={chat_id}, url={url}")
-    
+_session = None
+_session_lock = threading.Lock()
+
+
+class TelegramAPIError(Exception):
+    """Telegram API ответил ok=false"""
+
+    def __init__(self, description, error_code=None, retry_after=None):
+        super().__init__(f"Telegram API вернул ошибку: {description}")
+        self.error_code = error_code
+        self.retry_after = retry_after
+
+
+class TelegramRetryAfter(TelegramAPIError):
+    """Превышен лимит отправки (429), повторить можно через retry_after секунд"""
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity про запас.
+
+    Методы принимают текущее время явно и не синхронизированы — блокировку держит вызывающий код.
+    """
+
+    def __init__(self, rate, capacity=1, now=None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic() if now is None else now
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def ready_at(self, now):
+        """Момент, когда в ведре появится целый токен (с учётом уже запланированных отправок)"""
+        self._refill(now)
+        start = max(now, self.updated)
+        ready = start if self.tokens >= 1 else start + (1 - self.tokens) / self.rate
+        return max(ready, self.blocked_until)
+
+    def consume(self, at):
+        """Списывает токен на момент at (не раньше ready_at)"""
+        self._refill(at)
+        self.tokens -= 1
+
+    def try_acquire(self, now):
+        """Берёт токен, если он есть; иначе возвращает время ожидания, ничего не списывая"""
+        self._refill(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def block(self, now, seconds):
+        """Запрещает выдачу токенов на seconds секунд (ответ 429 с retry_after)"""
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+
+class TelegramSendScheduler:
+    """Темп отправки с учётом лимитов Telegram.
+
+    Общее ведро ограничивает скорость бота целиком, отдельное ведро на каждый чат — скорость
+    сообщений в один чат. Ответ 429 приостанавливает и чат, и общее ведро на retry_after,
+    сетевые ошибки и 5xx повторяются с экспоненциальной задержкой; всё это — только пока
+    не истёк deadline (окно напоминания), иначе сообщение считается неотправленным.
+    """
+
+    def __init__(self, global_rate=None, chat_rate=None, deadline=None, backoff=0.5, clock=time.monotonic,
+                 sleep=time.sleep):
+        self.clock = clock
+        self.sleep = sleep
+        now = clock()
+        self.global_bucket = TokenBucket(global_rate or settings.TELEGRAM_GLOBAL_RATE, now=now)
+        self.chat_rate = chat_rate or settings.TELEGRAM_CHAT_RATE
+        self.chat_buckets = {}
+        self.deadline = now + (deadline or settings.TELEGRAM_SEND_DEADLINE)
+        self.backoff = backoff
+        self._lock = threading.Lock()
+
+    def _chat_bucket(self, chat_id, now):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, now=now)
+        return bucket
+
+    def _wait_turn(self, chat_id):
+        """Ждёт токены общего ведра и ведра чата; False, если отправка не успевает до deadline"""
+        with self._lock:
+            now = self.clock()
+            chat_bucket = self._chat_bucket(chat_id, now)
+            send_at = max(self.global_bucket.ready_at(now), chat_bucket.ready_at(now))
+            if send_at > self.deadline:
+                return False
+            self.global_bucket.consume(send_at)
+            chat_bucket.consume(send_at)
+        if send_at > now:
+            self.sleep(send_at - now)
+        return True
+
+    def _retry_delay(self, error, attempt, chat_id):
+        """Задержка перед повтором или None, если ошибку повторять бессмысленно"""
+        if isinstance(error, TelegramRetryAfter):
+            with self._lock:
+                now = self.clock()
+                self.global_bucket.block(now, error.retry_after)
+                self._chat_bucket(chat_id, now).block(now, error.retry_after)
+            return 0.0
+        if isinstance(error, TelegramAPIError) and error.error_code and error.error_code < 500:
+            return None
+        return self.backoff * 2 ** (attempt - 1)
+
+    def send(self, chat_id, message, session=None, reply_markup=None):
+        """Отправляет сообщение с соблюдением лимитов и повторами; возвращает (ответ, попытки).
+
+        У исключения, с которым отправка в итоге не удалась, есть атрибут attempts.
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            if not self._wait_turn(chat_id):
+                error = TimeoutError(f"Окно отправки истекло (попыток: {attempt - 1})")
+                error.attempts = attempt - 1
+                raise error
+            try:
+                return send_tg_reminder(chat_id, message, session=session, reply_markup=reply_markup), attempt
+            except (TelegramAPIError, requests.RequestException) as e:
+                delay = self._retry_delay(e, attempt, chat_id)
+                if delay is None or self.clock() + delay > self.deadline:
+                    e.attempts = attempt
+                    raise
+                logger.warning("Повтор отправки в чат %s (попытка %d): %s", chat_id, attempt, e)
+                if delay:
+                    self.sleep(delay)
+
+
+def get_tg_session():
+    """Общая HTTP-сессия с пулом keep-alive соединений к Telegram API."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=settings.TELEGRAM_MAX_WORKERS,
+                )
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
+
+def tg_method_url(method):
+    """URL метода Bot API"""
+    return f"{settings.TELEGRAM_URL}{settings.TELEGRAM_BOT_URL}/{method}"
+
+
+def call_tg_method(method, params, session=None, timeout=None):
+    """Вызывает метод Bot API и возвращает поле result ответа.
+
+    Ответ ok=false превращается в TelegramAPIError (TelegramRetryAfter для 429 с retry_after).
+    """
+    url = tg_method_url(method)
+    chat_id = params.get('chat_id')
     try:
-        response = requests.get(url, params=params, timeout=10)
-        logger.info(f"Ответ от Telegram API: статус={response.status_code}")
-        
-        response.raise_for_status()
+        response = (session or get_tg_session()).get(
+            url, params=params, timeout=timeout or settings.TELEGRAM_TIMEOUT,
+        )
+        logger.debug("Ответ от Telegram API (%s): статус=%s", method, response.status_code)
+
+        if not response.headers.get('Content-Type', '').startswith('application/json'):
+            response.raise_for_status()
 
         result = response.json()
-        logger.info(f"Результат от Telegram API: {result}")
-        
+        logger.debug("Результат от Telegram API: %s", result)
+
         if not result.get('ok'):
-            error_msg = f"Telegram API вернул ошибку: {result.get('description', 'Unknown error')}"
-            logger.error(error_msg)
-            raise Exception(error_msg)
-        
-        return result
+            description = result.get('description', 'Unknown error')
+            error_code = result.get('error_code', response.status_code)
+            retry_after = (result.get('parameters') or {}).get('retry_after')
+            if error_code == 429 and retry_after is not None:
+                logger.warning("Лимит Telegram API, повтор через %s с: chat_id=%s", retry_after, chat_id)
+                raise TelegramRetryAfter(description, error_code, retry_after)
+            logger.error("Telegram API вернул ошибку: %s (%s, chat_id=%s)", description, method, chat_id)
+            raise TelegramAPIError(description, error_code)
+
+        return result.get('result')
     except requests.RequestException as e:
-        logger.error(f"Ошибка при запросе к Telegram API: {str(e)}", exc_info=True)
+        logger.error("Ошибка при запросе к Telegram API: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
         raise
+
+
+def send_tg_reminder(chat_id, message, session=None, reply_markup=None):
+    """Отправляет напоминание в Telegram; reply_markup — клавиатура (например, кнопка «Выполнено»)."""
+    params = {
+        'text': message,
+        'chat_id': chat_id
+    }
+    if reply_markup:
+        params['reply_markup'] = json.dumps(reply_markup, ensure_ascii=False)
+
+    logger.debug("Отправка сообщения в Telegram: chat_id=%s", chat_id)
+    return call_tg_method('sendMessage', params, session=session)
+
+
+def get_tg_updates(offset=None, timeout=0, limit=100, session=None):
+    """Забирает входящие обновления (getUpdates); timeout — длительность long polling в секундах"""
+    params = {'timeout': timeout, 'limit': limit}
+    if offset is not None:
+        params['offset'] = offset
+    return call_tg_method('getUpdates', params, session=session,
+                          timeout=timeout + settings.TELEGRAM_TIMEOUT)
+
+
+def answer_callback_queries(answers, max_workers=None):
+    """Параллельно отвечает на нажатия кнопок; answers — список (callback_query_id, текст).
+
+    Ошибки только логируются: без ответа Telegram сам уберёт индикатор загрузки на кнопке.
+    """
+    answers = list(answers)
+    if not answers:
+        return 0
+    session = get_tg_session()
+
+    def answer(item):
+        callback_query_id, text = item
+        try:
+            call_tg_method('answerCallbackQuery', {'callback_query_id': callback_query_id, 'text': text},
+                           session=session)
+        except (TelegramAPIError, requests.RequestException):
+            return False
+        return True
+
+    max_workers = min(max_workers or settings.TELEGRAM_MAX_WORKERS, len(answers))
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='tg-answers') as executor:
+        return sum(executor.map(answer, answers))
+
+
+def deliver_reminders(messages, max_workers=None, scheduler=None):
+    """Параллельно отправляет сообщения через общий пул соединений.
+
+    messages — итерируемое из кортежей (key, chat_id, text) или (key, chat_id, text, reply_markup).
+    Одно медленное или упавшее сообщение не задерживает остальные: число одновременных запросов
+    ограничено max_workers, темп и повторы задаёт scheduler (по умолчанию TelegramSendScheduler с лимитами из настроек).
+    Возвращает список DeliveryResult в порядке входных сообщений.
+    """
+    messages = list(messages)
+    if not messages:
+        return []
+    max_workers = min(max_workers or settings.TELEGRAM_MAX_WORKERS, len(messages))
+    scheduler = scheduler or TelegramSendScheduler()
+    session = get_tg_session()
+
+    def deliver(item):
+        key, chat_id, text, *markup = item
+        try:
+            _, attempts = scheduler.send(chat_id, text, session=session, reply_markup=markup[0] if markup else None)
+        except Exception as e:
+            return DeliveryResult(key, False, str(e), getattr(e, 'attempts', 1))
+        return DeliveryResult(key, True, None, attempts, time.time())
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='tg-delivery') as executor:
+        return list(executor.map(deliver, messages))
@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from tracker.cache import PUBLIC_SCOPE, bump_version, owner_scope
+from tracker.models import Habit, HabitTombstone
+from tracker.sync import deleted_by_owner_cascade, deleted_in_bulk
+from tracker.tasks import refresh_reminder_messages, reschedule_habits
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def reschedule_on_timezone_change(sender, instance, created, **kwargs):
+    """При смене часового пояса пользователя пересчитывает сроки напоминаний его привычек"""
+    if created or not instance.timezone_changed:
+        return
+    reschedule_habits(Habit.objects.filter(owner=instance, time_of_day__isnull=False))
+    instance._loaded_timezone = instance.timezone
+
+
+@receiver(post_save, sender=Habit)
+def invalidate_cache_on_save(sender, instance, **kwargs):
+    """Сбрасывает кэш списка владельца и, если привычка была или стала публичной, публичной ленты"""
+    scopes = [owner_scope(instance.owner_id)]
+    if instance.is_public or getattr(instance, '_loaded_is_public', False):
+        scopes.append(PUBLIC_SCOPE)
+    bump_version(*scopes)
+    instance._loaded_is_public = instance.is_public
+
+
+@receiver(post_delete, sender=Habit)
+def invalidate_cache_on_delete(sender, instance, origin=None, **kwargs):
+    """При удалении у связанных привычек обнуляется related_habit, они могут быть в публичной ленте"""
+    if deleted_in_bulk(origin):
+        return
+    bump_version(owner_scope(instance.owner_id), PUBLIC_SCOPE)
+
+
+@receiver(post_delete, sender=Habit)
+def leave_tombstone(sender, instance, origin=None, **kwargs):
+    """След удаления для дельта-синхронизации клиентов"""
+    if not (deleted_by_owner_cascade(origin) or deleted_in_bulk(origin)):
+        HabitTombstone.objects.create(owner_id=instance.owner_id, habit_id=instance.pk)
+
+
+@receiver(post_save, sender=Habit)
+def refresh_dependent_messages(sender, instance, created, **kwargs):
+    """Текст напоминания включает action связанной приятной привычки — пересобираем его у зависимых"""
+    if not created and instance.is_pleasant:
+        refresh_reminder_messages(Habit.objects.filter(related_habit=instance))
+
@@ -0,0 +1,75 @@
+"""Дельта-синхронизация списка привычек владельца.
+
+Клиент хранит метку watermark из прошлого ответа и получает только привычки, созданные или
+изменённые после неё (индекс (owner, updated_at)), и id удалённых — по следам HabitTombstone.
+Метка сдвигается назад на SYNC_OVERLAP: updated_at ставится до фиксации транзакции, и запись,
+зафиксированная чуть позже выдачи метки, не теряется; клиент применяет изменения идемпотентно.
+
+Если метка старше срока хранения следов удаления, отдаётся полный список с full=true — клиент
+заменяет им локальную копию.
+"""
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import QuerySet
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import serializers
+
+from tracker.cache import get_version, owner_scope, version_time
+from tracker.models import Habit, HabitTombstone
+
+SYNC_OVERLAP = timedelta(seconds=5)
+
+
+def parse_watermark(value):
+    """Метка клиента из параметра since (ISO 8601); без часового пояса считается UTC"""
+    if not value:
+        return None
+    try:
+        since = parse_datetime(value)
+    except ValueError:
+        since = None
+    if since is None:
+        raise serializers.ValidationError({'since': ['Ожидается дата и время в формате ISO 8601.']})
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since, dt_timezone.utc)
+    return since
+
+
+def habit_changes(owner, since, now=None):
+    """Изменения привычек владельца после метки since; возвращает (queryset, удалённые id, full)"""
+    now = now or timezone.now()
+    horizon = now - timedelta(days=settings.HABIT_TOMBSTONE_RETENTION_DAYS)
+    if since is None or since < horizon:
+        return Habit.objects.filter(owner=owner), [], True
+
+    start = since - SYNC_OVERLAP
+    # версия списка в кэше — время последнего изменения: если оно раньше метки, в БД идти не нужно
+    if version_time(get_version(owner_scope(owner.pk))) < start.timestamp():
+        return Habit.objects.none(), [], False
+    changed = Habit.objects.filter(owner=owner, updated_at__gte=start).order_by('updated_at', 'id')
+    deleted = sorted(set(
+        HabitTombstone.objects.filter(owner=owner, deleted_at__gte=start).values_list('habit_id', flat=True)
+    ))
+    return changed, deleted, False
+
+
+def deleted_by_owner_cascade(origin):
+    """Удаление пришло от удаления пользователя: следы для его привычек не нужны"""
+    if origin is None:
+        return False
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model is not Habit
+
+
+def deleted_in_bulk(origin):
+    """Удаление пришло из bulk_delete_habits: следы и сброс кэша он делает сам, на весь пакет сразу"""
+    return getattr(origin, 'handled_in_bulk', False)
+
+
+def prune_tombstones(now=None):
+    """Удаляет следы старше HABIT_TOMBSTONE_RETENTION_DAYS"""
+    cutoff = (now or timezone.now()) - timedelta(days=settings.HABIT_TOMBSTONE_RETENTION_DAYS)
+    deleted, _ = HabitTombstone.objects.filter(deleted_at__lt=cutoff).delete()
+    return deleted
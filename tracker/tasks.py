@@ -1,100 +1,492 @@
 import logging
+import math
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import chain, groupby
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
 from django.utils import timezone
-from celery import shared_task
+from celery import chord, shared_task
 
-from tracker.models import Habit
-from tracker.services import send_tg_reminder
+from config.db_router import replica_reads, replication_lag
+from tracker.messages import MESSAGE_SOURCE_FIELDS, REMINDER_MESSAGE_VERSION, done_keyboard
+from tracker.models import Habit, ReminderDelivery, realign_to_wall_clock
+from tracker.partitions import rotate_partitions
+from tracker.services import TelegramSendScheduler, deliver_reminders
+from tracker.sync import prune_tombstones
+from tracker.telegram_updates import process_all_pending, prune_processed_updates
+from users.models import User
 
 logger = logging.getLogger(__name__)
 
+REMINDER_WINDOW = timedelta(minutes=1)
+# срок может уйти вперёд максимум на 7 дней (period_days), плюс запас до следующего запуска
+DST_LOOKAHEAD = timedelta(days=8)
+
+# колонки, которые нужны для отправки; связи разворачиваются JOIN-ом в том же запросе
+REMINDER_FIELDS = (
+    'id', 'period_days', 'next_reminder_at', 'reminder_message', 'reminder_message_version',
+    'owner_id', 'owner__tg_chat_id',
+)
+REMINDER_CHUNK_SIZE = 2000
+
 
 @shared_task
 def send_reminder_notification():
-    """Периодическая задача для проверки и отправки напоминаний о привычках."""
-    from django.utils import timezone as tz
-    from django.conf import settings
-    import pytz
-    
-    # Получаем текущее время в локальном часовом поясе проекта
-    local_tz = pytz.timezone(settings.TIME_ZONE)
-    current_datetime = tz.now().astimezone(local_tz)
-    current_time = current_datetime.time()
-    current_date = current_datetime.date()
-    
-    logger.info(f"Проверка напоминаний. Текущее время (локальное): {current_time}")
-
-    habits = Habit.objects.filter(time_of_day__isnull=False)
-    logger.info(f"Найдено привычек с указанным временем: {habits.count()}")
-    
-    sent_count = 0
-    for habit in habits:
-        logger.info(f"Проверка привычки {habit.id}: время={habit.time_of_day}, владелец={habit.owner.email}, tg_chat_id={habit.owner.tg_chat_id}")
-
-        if habit.time_of_day:
-            current_minutes = current_time.hour * 60 + current_time.minute
-            habit_minutes = habit.time_of_day.hour * 60 + habit.time_of_day.minute
-            time_diff = abs(current_minutes - habit_minutes)
-            logger.info(f"Разница во времени для привычки {habit.id}: {time_diff} минут (текущее={current_time}, привычка={habit.time_of_day})")
-        
-        if should_send_reminder(habit, current_time, current_date):
-            logger.info(f"Время совпадает для привычки {habit.id}")
-            
-            if habit.owner.tg_chat_id:
-                message = format_reminder_message(habit)
-                logger.info(f"Отправка напоминания для привычки {habit.id} пользователю {habit.owner.email}")
-
-                try:
-                    send_tg_reminder(habit.owner.tg_chat_id, message)
-                    sent_count += 1
-                    logger.info(f"Напоминание успешно отправлено для привычки {habit.id}")
-                except Exception as e:
-                    logger.error(f"Ошибка при отправке напоминания для привычки {habit.id}: {str(e)}", exc_info=True)
-            else:
-                logger.warning(f"У пользователя {habit.owner.email} не указан tg_chat_id для привычки {habit.id}")
-        else:
-            logger.info(f"Время не совпадает для привычки {habit.id}: текущее={current_time}, привычка={habit.time_of_day}")
-    
+    """Периодическая задача: выбирает напоминания и раздаёт их на отправку подзадачам.
+
+    Должные напоминания (next_reminder_at <= now) забираются одним индексированным запросом и
+    сразу переносятся на следующий срок, поэтому повторный или наложившийся тик их уже не увидит.
+    Слоты, отправка по которым не удалась, тик забирает из журнала доставки заново (reclaim_failed_slots).
+    Небольшой тик отправляется сразу в этой же задаче. Если напоминаний больше
+    REMINDER_BATCH_SIZE, они делятся на шарды по владельцу и уходят chord-ом подзадач
+    send_reminder_batch, которые могут выполняться на разных воркерах; итоговую сводку
+    собирает summarize_reminder_batches.
+
+    В логи пишется одна сводная запись на тик; подробности по привычкам — только на уровне
+    DEBUG или для доли REMINDER_LOG_SAMPLE_RATE привычек.
+    """
+    started = time.monotonic()
+    now = timezone.now()
+    checked_at = now.isoformat()
+
+    stats = {'missed': reschedule_missed_reminders(now), 'due': 0, 'skipped': 0}
+    with transaction.atomic():
+        rows = list(due_reminders(now, for_update=True))
+        advance_reminders(rows)
+    stats['due'] = len(rows)
+    rows = [row for row in rows if row['owner__tg_chat_id']]
+    stats['skipped'] = stats['due'] - len(rows)
+    claimed = claim_reminder_slots(rows, now)
+    stats['duplicates'] = len(rows) - len(claimed)
+    for row in rows:
+        row['delivery_id'] = claimed.get(row['id'])
+    retried = reclaim_failed_slots(now)
+    stats['retried'] = len(retried)
+    rows.extend(retried)
+    # тексты хранятся готовыми; устаревшие (другая версия шаблона) пересобираются одним запросом
+    stale = [row for row in rows if row['reminder_message_version'] != REMINDER_MESSAGE_VERSION]
+    if stale:
+        messages = refresh_reminder_messages(Habit.objects.filter(id__in=[row['id'] for row in stale]))
+        for row in stale:
+            row['reminder_message'] = messages[row['id']]
+
+    detail_level, sample_rate = habit_log_sampling()
+    shards = {}
+    for row in rows:
+        habit_id = row['id']
+        delivery_id = row['delivery_id']
+        if sample_rate and (sample_rate >= 1 or random.random() < sample_rate):
+            logger.log(detail_level, "Напоминание для привычки %s: срок=%s, владелец=%s, tg_chat_id=%s, слот=%s",
+                       habit_id, row['next_reminder_at'], row['owner_id'], row['owner__tg_chat_id'], delivery_id)
+        if delivery_id is None:
+            continue
+
+        scheduled_ts = row['next_reminder_at'].timestamp()
+        shards.setdefault(row['owner_id'], []).append((
+            (delivery_id, scheduled_ts), row['owner__tg_chat_id'], row['reminder_message'],
+            done_keyboard(habit_id, scheduled_ts),
+        ))
+    stats['select_ms'] = round((time.monotonic() - started) * 1000, 1)
+
+    batches = shard_reminders(shards)
+    if len(batches) <= 1:
+        batch_results = [send_reminder_batch(batch) for batch in batches]
+        return summarize_reminder_batches(batch_results, stats, checked_at)
+
+    expires = settings.REMINDER_TASK_EXPIRES
+    # общий лимит бота делится между шардами, которые отправляют одновременно
+    rate_share = settings.TELEGRAM_GLOBAL_RATE / len(batches)
+    header = [send_reminder_batch.s(batch, rate_share).set(expires=expires) for batch in batches]
+    callback = summarize_reminder_batches.s(stats, checked_at)
+    chord(header)(callback)
+
+    result = {
+        'status': 'dispatched',
+        'reminders_due': stats['due'],
+        'shards': len(batches),
+        'checked_at': checked_at,
+    }
+    logger.info("Напоминания розданы подзадачам: %s", result)
+    return result
+
+
+@shared_task
+def send_reminder_batch(messages, global_rate=None):
+    """Отправляет один шард напоминаний и записывает итог в журнал доставки.
+
+    messages — список ((delivery_id, scheduled_ts), chat_id, text, reply_markup); статусы всех сообщений шарда
+    сохраняются одним bulk_update.
+    """
+    started = time.monotonic()
+    scheduler = TelegramSendScheduler(global_rate=global_rate)
+    results = deliver_reminders(messages, scheduler=scheduler)
+    failed_count = record_deliveries(results)
+    for delivery in results:
+        if not delivery.ok:
+            logger.warning("Напоминание %s не отправлено: %s", delivery.key[0], delivery.error)
+    return {
+        'sent': len(results) - failed_count,
+        'failed': failed_count,
+        'send_ms': round((time.monotonic() - started) * 1000, 1),
+    }
+
+
+@shared_task
+def summarize_reminder_batches(batch_results, stats, checked_at):
+    """Собирает результаты шардов в итоговую сводку тика и пишет её одной записью в лог."""
     result = {
         'status': 'success',
-        'reminders_sent': sent_count,
-        'checked_at': timezone.now().isoformat()
+        'reminders_due': stats['due'],
+        'reminders_sent': sum(batch['sent'] for batch in batch_results),
+        'reminders_failed': sum(batch['failed'] for batch in batch_results),
+        'reminders_skipped': stats['skipped'],
+        'reminders_duplicate': stats['duplicates'],
+        'reminders_retried': stats['retried'],
+        'reminders_missed': stats['missed'],
+        'shards': len(batch_results),
+        'select_ms': stats['select_ms'],
+        # шарды идут параллельно, поэтому длительность отправки — самый долгий из них
+        'send_ms': max((batch['send_ms'] for batch in batch_results), default=0.0),
+        'checked_at': checked_at,
     }
-    logger.info(f"Задача завершена: {result}")
+    logger.info(
+        "Рассылка напоминаний: due=%d sent=%d failed=%d skipped=%d duplicate=%d retried=%d missed=%d shards=%d "
+        "select_ms=%.1f send_ms=%.1f",
+        result['reminders_due'], result['reminders_sent'], result['reminders_failed'], result['reminders_skipped'],
+        result['reminders_duplicate'], result['reminders_retried'], result['reminders_missed'], result['shards'],
+        result['select_ms'],
+        result['send_ms'],
+        extra={'reminder_sweep': result},
+    )
     return result
 
 
-def should_send_reminder(habit, current_time, current_date):
-    """Определяет, нужно ли отправить напоминание для привычки."""
-    if not habit.time_of_day:
-        return False
+def habit_log_sampling():
+    """Уровень и доля подробных записей о привычках для одного тика.
+
+    При включённом DEBUG подробности пишутся по каждой привычке, иначе — для случайной доли
+    REMINDER_LOG_SAMPLE_RATE привычек на уровне INFO.
+    """
+    if logger.isEnabledFor(logging.DEBUG):
+        return logging.DEBUG, 1.0
+    if not logger.isEnabledFor(logging.INFO):
+        return logging.INFO, 0.0
+    return logging.INFO, settings.REMINDER_LOG_SAMPLE_RATE
+
+
+def shard_reminders(messages_by_owner):
+    """Делит сообщения на шарды по хешу владельца.
+
+    Все напоминания одного владельца попадают в один шард; число шардов выбирается так,
+    чтобы в среднем на шард приходилось не больше REMINDER_BATCH_SIZE сообщений.
+    """
+    total = sum(len(messages) for messages in messages_by_owner.values())
+    if not total:
+        return []
+    shard_count = min(math.ceil(total / settings.REMINDER_BATCH_SIZE), settings.REMINDER_MAX_SHARDS)
+    batches = [[] for _ in range(shard_count)]
+    for owner_id, messages in messages_by_owner.items():
+        batches[owner_id % shard_count].extend(messages)
+    return [batch for batch in batches if batch]
+
+
+def due_reminders(now, for_update=False):
+    """Потоково отдаёт данные для напоминаний, срок которых наступил в последние REMINDER_WINDOW.
+
+    Выборка — один диапазонный запрос по индексу next_reminder_at, стоимость зависит только от
+    числа должных напоминаний. Строки — словари с колонками REMINDER_FIELDS: владелец и связанная
+    привычка приходят из JOIN, поэтому количество запросов не зависит от числа напоминаний.
+    for_update блокирует выбранные привычки (занятые другим тиком пропускаются); если есть реплика,
+    диапазон просматривается на ней, а основная база только блокирует кандидатов по первичному ключу.
+    """
+    queryset = Habit.objects.filter(next_reminder_at__gt=now - REMINDER_WINDOW, next_reminder_at__lte=now)
+    if not for_update:
+        return _reminder_rows(queryset)
+    locked = queryset.select_for_update(skip_locked=True, of=('self',))
+    candidates = replica_candidates(queryset)
+    if candidates is None:
+        return _reminder_rows(locked)
+    return chain.from_iterable(
+        _reminder_rows(locked.filter(pk__in=candidates[start:start + REMINDER_CHUNK_SIZE]))
+        for start in range(0, len(candidates), REMINDER_CHUNK_SIZE)
+    )
+
+
+def _reminder_rows(queryset):
+    return queryset.order_by().values(*REMINDER_FIELDS).iterator(chunk_size=REMINDER_CHUNK_SIZE)
+
+
+def replica_candidates(queryset):
+    """id привычек из queryset по данным реплики или None, если реплики нет или она отстаёт.
+
+    Основная база заново проверяет условие queryset для каждого кандидата, поэтому привычки, уже
+    перенесённые прошлым тиком, но ещё должные на реплике, не отправятся дважды. Пропустить
+    реплика может только изменения последних DATABASE_REPLICA_LAG секунд — как и основная база
+    пропускает строки, зафиксированные во время выборки.
+    """
+    with replica_reads() as allowed:
+        if not allowed:
+            return None
+        ids = queryset.order_by().values_list('id', flat=True)
+        alias = ids.db
+        lag = replication_lag(alias)
+        if lag is None or lag > settings.DATABASE_REPLICA_LAG:
+            logger.info("Реплика %s отстаёт (%s с), выборка идёт в основной БД", alias, lag)
+            return None
+        return list(ids.using(alias))
+
 
-    habit_time = habit.time_of_day
+def advance_reminders(rows):
+    """Переносит next_reminder_at выбранных привычек на period_days вперёд.
 
-    current_minutes = current_time.hour * 60 + current_time.minute
-    habit_minutes = habit_time.hour * 60 + habit_time.minute
-    time_diff = abs(current_minutes - habit_minutes)
+    Один UPDATE на пару (срок, период), а не на привычку. Условие по старому сроку делает шаг
+    идемпотентным: повторный вызов с теми же строками ничего не сдвинет второй раз.
+    """
+    key = lambda row: (row['next_reminder_at'], row['period_days'])
+    for (scheduled, period_days), group in groupby(sorted(rows, key=key), key=key):
+        Habit.objects.filter(pk__in=[row['id'] for row in group], next_reminder_at=scheduled).update(
+            next_reminder_at=scheduled + timedelta(days=period_days),
+        )
 
-    if time_diff > 1:
-        return False
-    
-    return True
+
+def claim_reminder_slots(rows, now):
+    """Занимает слоты (привычка, срок) в журнале доставки и возвращает {habit_id: delivery_id}.
+
+    Все слоты пачки вставляются одним INSERT ... ON CONFLICT DO NOTHING, затем одним запросом по
+    уникальному индексу читаются записи с токеном этого тика. Слоты, которые уже занял другой или
+    предыдущий тик, в результат не попадают — по ним ничего не отправляется.
+    """
+    if not rows:
+        return {}
+    token = uuid.uuid4()
+    ReminderDelivery.objects.bulk_create(
+        [
+            ReminderDelivery(habit_id=row['id'], scheduled_for=row['next_reminder_at'],
+                             claim_token=token, claimed_at=now)
+            for row in rows
+        ],
+        ignore_conflicts=True,
+        batch_size=REMINDER_CHUNK_SIZE,
+    )
+    claimed = ReminderDelivery.objects.filter(
+        habit_id__in=[row['id'] for row in rows],
+        scheduled_for__in={row['next_reminder_at'] for row in rows},
+        claim_token=token,
+    ).values_list('habit_id', 'id')
+    return dict(claimed)
+
+
+def reclaim_failed_slots(now):
+    """Заново занимает слоты, отправка по которым не удалась, и возвращает строки для повторной отправки.
+
+    Срок привычки к этому моменту уже перенесён advance_reminders, поэтому в выборку тика она не
+    попадёт до следующего периода. Вместо этого один условный UPDATE переводит слоты failed -> pending
+    под токеном тика — наложившийся тик тот же слот уже не получит, — а один SELECT с JOIN читает их
+    вместе с данными привычки. Повторяются слоты не старше REMINDER_RETRY_MINUTES минут, на которые
+    потрачено меньше REMINDER_MAX_ATTEMPTS попыток; строки — как у due_reminders, со сроком слота и
+    delivery_id.
+    """
+    token = uuid.uuid4()
+    # условие на срок оставляет в плане только частичный индекс reminder_failed_idx последних секций
+    window = {
+        'scheduled_for__gt': now - timedelta(minutes=settings.REMINDER_RETRY_MINUTES),
+        'scheduled_for__lte': now,
+    }
+    reclaimed = ReminderDelivery.objects.filter(
+        status=ReminderDelivery.STATUS_FAILED, attempts__lt=settings.REMINDER_MAX_ATTEMPTS, **window,
+    ).update(status=ReminderDelivery.STATUS_PENDING, claim_token=token, claimed_at=now)
+    if not reclaimed:
+        return []
+    slots = ReminderDelivery.objects.filter(claim_token=token, **window).values(
+        'id', 'scheduled_for', *(f'habit__{field}' for field in REMINDER_FIELDS),
+    )
+    rows = []
+    for slot in slots:
+        if not slot['habit__owner__tg_chat_id']:
+            # владелец отвязал Telegram: слот остаётся pending и больше не повторяется
+            continue
+        row = {field: slot[f'habit__{field}'] for field in REMINDER_FIELDS}
+        row['next_reminder_at'] = slot['scheduled_for']
+        row['delivery_id'] = slot['id']
+        rows.append(row)
+    return rows
+
+
+def record_deliveries(results):
+    """Сохраняет статус, время, задержку и число попыток по результатам доставки; возвращает число ошибок"""
+    if not results:
+        return 0
+    deliveries = []
+    failed_count = 0
+    for result in results:
+        delivery_id, scheduled_ts = result.key
+        # попытки копятся между тиками: по ним reclaim_failed_slots прекращает повторы
+        delivery = ReminderDelivery(id=delivery_id, attempts=F('attempts') + result.attempts)
+        if result.ok:
+            delivery.status = ReminderDelivery.STATUS_SENT
+            delivery.sent_at = datetime.fromtimestamp(result.sent_at, tz=dt_timezone.utc)
+            delivery.latency_ms = max(int((result.sent_at - scheduled_ts) * 1000), 0)
+            delivery.error = ''
+        else:
+            failed_count += 1
+            delivery.status = ReminderDelivery.STATUS_FAILED
+            delivery.error = (result.error or '')[:300]
+        deliveries.append(delivery)
+    # условие на срок оставляет в плане только секции журнала за эти сроки
+    scheduled = [result.key[1] for result in results]
+    ReminderDelivery.objects.filter(
+        scheduled_for__gte=datetime.fromtimestamp(min(scheduled), tz=dt_timezone.utc),
+        scheduled_for__lte=datetime.fromtimestamp(max(scheduled), tz=dt_timezone.utc),
+    ).bulk_update(
+        deliveries, ['status', 'sent_at', 'latency_ms', 'attempts', 'error'], batch_size=REMINDER_CHUNK_SIZE,
+    )
+    return failed_count
+
+
+def reschedule_habits(queryset, now=None):
+    """Заново считает next_reminder_at для привычек из queryset и сохраняет изменившиеся.
+
+    Используется при смене часового пояса владельца и для пропущенных напоминаний; обычный тик
+    сюда не попадает.
+    """
+    habits = list(
+        queryset.select_related('owner')
+        .only('id', 'time_of_day', 'period_days', 'next_reminder_at', 'owner__timezone')
+        .order_by()
+    )
+    changed = []
+    for habit in habits:
+        previous = habit.next_reminder_at
+        habit.next_reminder_at = None
+        habit.refresh_schedule(now=now)
+        if habit.next_reminder_at != previous:
+            changed.append(habit)
+    Habit.objects.bulk_update(changed, ['next_reminder_at'], batch_size=REMINDER_CHUNK_SIZE)
+    return len(changed)
+
+
+def reschedule_missed_reminders(now):
+    """Переносит в будущее напоминания, срок которых прошёл мимо окна (например, пока не работал beat).
+
+    Обычно выборка пуста; пропущенные напоминания не отправляются задним числом.
+    """
+    queryset = Habit.objects.filter(next_reminder_at__lte=now - REMINDER_WINDOW)
+    candidates = replica_candidates(queryset)
+    if candidates is not None:
+        # с репликой пустая выборка обычного тика не доходит до основной базы
+        queryset = queryset.filter(pk__in=candidates)
+    missed = reschedule_habits(queryset, now=now) if candidates != [] else 0
+    if missed:
+        logger.warning("Перенесено пропущенных напоминаний: %d", missed)
+    return missed
+
+
+@shared_task
+def recompute_dst_reminders():
+    """Выравнивает сроки напоминаний в поясах, где скоро переход на летнее/зимнее время.
+
+    Тик сдвигает срок на period_days суток в UTC, и после перехода напоминание уехало бы на час.
+    Задача раз в час находит пояса пользователей, у которых смещение от UTC меняется в ближайшие
+    DST_LOOKAHEAD, и возвращает сроки их привычек на локальное time_of_day.
+    """
+    now = timezone.now()
+    # начало окна чуть в прошлом: ловим и сроки, сдвинутые тиками за последний час до перехода
+    window_start, window_end = now - timedelta(hours=2), now + DST_LOOKAHEAD
+    zones = {
+        tz for tz in User.objects.values_list('timezone', flat=True).distinct()
+        if window_start.astimezone(tz).utcoffset() != window_end.astimezone(tz).utcoffset()
+    }
+    if not zones:
+        return {'status': 'success', 'zones': [], 'rescheduled': 0}
+
+    habits = list(
+        Habit.objects.filter(owner__timezone__in=zones, next_reminder_at__gt=now)
+        .select_related('owner')
+        .only('id', 'time_of_day', 'next_reminder_at', 'owner__timezone')
+    )
+    changed = []
+    for habit in habits:
+        aligned = realign_to_wall_clock(habit.next_reminder_at, habit.time_of_day, habit.owner.timezone)
+        if aligned != habit.next_reminder_at:
+            habit.next_reminder_at = aligned
+            changed.append(habit)
+    Habit.objects.bulk_update(changed, ['next_reminder_at'], batch_size=REMINDER_CHUNK_SIZE)
+
+    result = {'status': 'success', 'zones': sorted(str(tz) for tz in zones), 'rescheduled': len(changed)}
+    logger.info("Пересчёт расписания из-за перехода времени: %s", result)
+    return result
 
 
 def format_reminder_message(habit):
     """Форматирует сообщение напоминания о привычке."""
-    time_str = habit.time_of_day.strftime('%H:%M') if habit.time_of_day else 'любое время'
-    place_str = f" в {habit.place}" if habit.place else ""
-    
-    message = (
-        f"! Напоминание о привычке!\n\n"
-        f"Я буду {habit.action}{place_str} в {time_str}.\n"
-        f"Время выполнения: {habit.duration_seconds} секунд."
+    return habit.render_reminder_message()
+
+
+def refresh_reminder_messages(queryset):
+    """Заново собирает сохранённые тексты напоминаний привычек из queryset; возвращает {id: текст}.
+
+    Нужен, когда текст устарел без сохранения самой привычки: изменилась или удалена связанная
+    привычка, либо сменилась версия шаблона REMINDER_MESSAGE_VERSION.
+    """
+    habits = list(
+        queryset.select_related('related_habit')
+        .only(*MESSAGE_SOURCE_FIELDS, 'related_habit__action')
+        .order_by()
     )
-    
-    if habit.reward:
-        message += f"\nВознаграждение: {habit.reward}"
-    elif habit.related_habit:
-        message += f"\nПосле выполнения: {habit.related_habit.action}"
-    
-    return message
+    for habit in habits:
+        habit.refresh_reminder_message()
+    Habit.objects.bulk_update(habits, ['reminder_message', 'reminder_message_version'], batch_size=REMINDER_CHUNK_SIZE)
+    return {habit.id: habit.reminder_message for habit in habits}
+
+
+@shared_task
+def rotate_event_partitions():
+    """Раз в сутки: секции истории на ближайшие месяцы, свёртка и удаление устаревших месяцев"""
+    report = rotate_partitions()
+    for table, changes in report.items():
+        if changes['created'] or changes['dropped']:
+            logger.info('Секции %s: создано %s, удалено %s, строк сводки %s',
+                        table, changes['created'], changes['dropped'], changes['rolled_up'])
+    return report
+
 
+@shared_task
+def prune_habit_tombstones():
+    """Раз в сутки: удаление устаревших следов удалённых привычек"""
+    deleted = prune_tombstones()
+    if deleted:
+        logger.info('Удалено следов удалённых привычек: %s', deleted)
+    return deleted
+
+
+# ключ кэша: задача разбора входящих обновлений уже запланирована
+TELEGRAM_PROCESSING_KEY = 'telegram:processing-scheduled'
+
+
+def schedule_update_processing():
+    """Планирует разбор входящих обновлений через TELEGRAM_UPDATES_DEBOUNCE секунд.
+
+    Пока задача не началась, новые обновления её не планируют повторно: всплеск webhook-запросов
+    склеивается в одну задачу, которая разбирает накопившееся пачками.
+    """
+    delay = settings.TELEGRAM_UPDATES_DEBOUNCE
+    if cache.add(TELEGRAM_PROCESSING_KEY, 1, timeout=delay + 60):
+        process_telegram_updates.apply_async(countdown=delay)
+
+
+@shared_task
+def process_telegram_updates():
+    """Разбор входящих обновлений Telegram: после webhook и раз в минуту как страховка"""
+    # обновления, пришедшие во время разбора, запланируют следующую задачу
+    cache.delete(TELEGRAM_PROCESSING_KEY)
+    result = process_all_pending()
+    result['pruned'] = prune_processed_updates()
+    if result['updates']:
+        logger.info("Входящие обновления Telegram: %s", result)
+    return result
@@ -0,0 +1,196 @@
+"""Локальная заглушка Telegram Bot API для тестов и бенчмарков."""
+import json
+import math
+import multiprocessing
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from tracker.services import TokenBucket
+
+
+class _StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _params(self):
+        query = {key: values[-1] for key, values in parse_qs(urlsplit(self.path).query).items()}
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            body = self.rfile.read(length)
+            if self.headers.get('Content-Type', '').startswith('application/json'):
+                query.update(json.loads(body))
+            else:
+                query.update({key: values[-1] for key, values in parse_qs(body.decode()).items()})
+        return query
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self):
+        stub = self.server.stub
+        method = urlsplit(self.path).path.rsplit('/', 1)[-1]
+        params = self._params()
+        status, payload = stub.handle(method, params)
+        self._reply(status, payload)
+
+    do_GET = _handle
+    do_POST = _handle
+
+
+class FakeTelegramServer:
+    """Заглушка Bot API на 127.0.0.1 в отдельном потоке.
+
+    Запоминает отправленные сообщения и ответы на нажатия кнопок; latency имитирует сетевую
+    задержку, а chat_id из failing_chats получают ответ ok=false. push_update() ставит входящее
+    обновление в очередь getUpdates: как и настоящий API, заглушка отдаёт обновления начиная
+    с offset, забывает подтверждённые и при пустой очереди ждёт до timeout секунд. Если заданы global_rate/chat_rate, заглушка, как и
+    настоящий API, отвечает 429 с retry_after при превышении лимитов (с запасом burst сообщений).
+    Используется как контекстный менеджер:
+
+        with FakeTelegramServer() as stub, override_settings(TELEGRAM_URL=stub.base_url): ...
+    """
+
+    def __init__(self, latency=0.0, failing_chats=(), global_rate=None, chat_rate=None, burst=1):
+        self.latency = latency
+        self.failing_chats = {str(chat_id) for chat_id in failing_chats}
+        self.global_bucket = TokenBucket(global_rate, capacity=burst) if global_rate else None
+        self.chat_rate = chat_rate
+        self.burst = burst
+        self.chat_buckets = {}
+        self.messages = []
+        self.callback_answers = []
+        self.updates = []
+        self.rate_limited = 0
+        self._last_update_id = 0
+        self._lock = threading.Lock()
+        self._updates_ready = threading.Condition(self._lock)
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/bot'
+
+    def handle(self, method, params):
+        """Возвращает (HTTP-статус, JSON-ответ) для вызова метода Bot API"""
+        if self.latency:
+            time.sleep(self.latency)
+        if method == 'getUpdates':
+            return self._get_updates(params)
+        if method == 'answerCallbackQuery':
+            with self._lock:
+                self.callback_answers.append(params)
+            return 200, {'ok': True, 'result': True}
+        if method != 'sendMessage':
+            return 404, {'ok': False, 'error_code': 404, 'description': 'Not Found'}
+        chat_id = str(params.get('chat_id'))
+        if chat_id in self.failing_chats:
+            return 400, {'ok': False, 'error_code': 400, 'description': 'Bad Request: chat not found'}
+        with self._lock:
+            wait = self._rate_limit_wait(chat_id)
+            if wait:
+                self.rate_limited += 1
+                return 429, {
+                    'ok': False, 'error_code': 429,
+                    'description': f'Too Many Requests: retry after {math.ceil(wait)}',
+                    'parameters': {'retry_after': math.ceil(wait)},
+                }
+            self.messages.append(params)
+            message_id = len(self.messages)
+        return 200, {'ok': True, 'result': {'message_id': message_id, 'chat': {'id': chat_id}}}
+
+    def push_update(self, update):
+        """Добавляет входящее обновление (без update_id — присваивается следующий); возвращает update_id"""
+        with self._updates_ready:
+            update = dict(update)
+            update.setdefault('update_id', self._last_update_id + 1)
+            self._last_update_id = max(self._last_update_id, update['update_id'])
+            self.updates.append(update)
+            self._updates_ready.notify_all()
+        return update['update_id']
+
+    def _get_updates(self, params):
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        deadline = time.monotonic() + float(params.get('timeout') or 0)
+        with self._updates_ready:
+            # обновления до offset подтверждены и больше не отдаются
+            self.updates = [update for update in self.updates if update['update_id'] >= offset]
+            while not self.updates and time.monotonic() < deadline:
+                self._updates_ready.wait(deadline - time.monotonic())
+                self.updates = [update for update in self.updates if update['update_id'] >= offset]
+            return 200, {'ok': True, 'result': self.updates[:limit]}
+
+    def _rate_limit_wait(self, chat_id):
+        now = time.monotonic()
+        if self.chat_rate:
+            bucket = self.chat_buckets.get(chat_id)
+            if bucket is None:
+                bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, capacity=self.burst, now=now)
+            wait = bucket.try_acquire(now)
+            if wait:
+                return wait
+        if self.global_bucket:
+            wait = self.global_bucket.try_acquire(now)
+            if wait and self.chat_rate:
+                bucket.tokens += 1
+            return wait
+        return 0.0
+
+    def start(self):
+        self._server = _StubHTTPServer(('127.0.0.1', 0), _Handler)
+        self._server.stub = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def _serve_forever(options, ready):
+    server = FakeTelegramServer(**options).start()
+    ready.put(server.base_url)
+    server._thread.join()
+
+
+@contextmanager
+def fake_telegram_process(**options):
+    """Запускает заглушку в отдельном процессе и отдаёт её base_url.
+
+    Нужен бенчмаркам: в одном процессе с клиентом заглушка делит с ним GIL и сама
+    становится узким местом. Отправленные сообщения в этом режиме не запоминаются.
+    """
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve_forever, args=(options, ready), daemon=True)
+    process.start()
+    try:
+        yield ready.get(timeout=10)
+    finally:
+        process.terminate()
+        process.join()
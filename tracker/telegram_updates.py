@@ -0,0 +1,195 @@
+"""Входящие обновления Telegram: привязка чата к пользователю и кнопка «Выполнено».
+
+Обновления приходят через webhook (TelegramWebhookView) или getUpdates (команда
+poll_telegram_updates) и сначала только сохраняются в TelegramUpdate: update_id — первичный ключ,
+поэтому повторная доставка одного обновления ничего не дублирует. Разбор идёт пачками
+(process_pending_updates): на пачку — один запрос токенов привязки, один запрос привычек
+и одна пакетная запись выполнений, а ответы пользователям отправляются параллельно уже после
+фиксации транзакции. Всплеск нажатий после утренней рассылки обрабатывается несколькими
+запросами к БД на пачку, а не несколькими на каждое нажатие.
+"""
+import logging
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from tracker.completions import local_today, record_completions
+from tracker.messages import parse_done_callback
+from tracker.models import Habit, TelegramUpdate
+from tracker.services import answer_callback_queries, deliver_reminders, get_tg_updates
+from users.authentication import forget_users
+from users.models import TelegramLinkToken, User
+
+logger = logging.getLogger(__name__)
+
+START_COMMAND = '/start'
+
+LINKED_MESSAGE = 'Чат привязан к аккаунту {email}. Напоминания о привычках будут приходить сюда.'
+INVALID_TOKEN_MESSAGE = 'Ссылка недействительна или устарела. Получите новую в приложении.'
+COMPLETED_ANSWER = 'Отмечено выполнение за {day:%d.%m.%Y}'
+ALREADY_COMPLETED_ANSWER = 'Выполнение за {day:%d.%m.%Y} уже отмечено'
+INVALID_CALLBACK_ANSWER = 'Эта кнопка больше не действует'
+
+
+def store_updates(updates):
+    """Сохраняет обновления; уже записанные update_id пропускаются"""
+    rows = [TelegramUpdate(update_id=update['update_id'], payload=update) for update in updates]
+    TelegramUpdate.objects.bulk_create(rows, ignore_conflicts=True)
+    return len(rows)
+
+
+def next_offset():
+    """Смещение для getUpdates: следующий после последнего сохранённого update_id"""
+    last = TelegramUpdate.objects.aggregate(last=Max('update_id'))['last']
+    return None if last is None else last + 1
+
+
+def fetch_updates(offset, timeout=0, limit=100):
+    """Забирает через getUpdates всё накопившееся; возвращает (число обновлений, новое смещение).
+
+    Ждёт (long polling) только первый запрос: пока Telegram отдаёт полные порции по limit,
+    следующие запрашиваются сразу, чтобы всплеск разбирался общими пачками.
+    """
+    fetched = 0
+    while True:
+        updates = get_tg_updates(offset, timeout=timeout, limit=limit)
+        store_updates(updates)
+        fetched += len(updates)
+        if updates:
+            offset = max(update['update_id'] for update in updates) + 1
+        if len(updates) < limit:
+            return fetched, offset
+        timeout = 0
+
+
+def _start_token(message):
+    text = (message.get('text') or '').strip()
+    command, _, token = text.partition(' ')
+    if command.split('@')[0] != START_COMMAND:
+        return None
+    return token.strip()
+
+
+def link_chats(messages, now):
+    """Привязывает чаты по командам /start <токен>; возвращает ответы [(chat_id, текст)]"""
+    commands = [
+        (str(message['chat']['id']), token)
+        for message in messages
+        if (token := _start_token(message)) is not None and 'chat' in message
+    ]
+    if not commands:
+        return []
+    tokens = {
+        link.token: link
+        for link in TelegramLinkToken.objects.select_related('user').filter(
+            token__in={token for _, token in commands if token},
+            used_at__isnull=True,
+            created_at__gte=now - timedelta(seconds=settings.TELEGRAM_LINK_TOKEN_TTL),
+        )
+    }
+    replies, used, users = [], [], {}
+    for chat_id, token in commands:
+        link = tokens.pop(token, None)
+        if link is None:
+            replies.append((chat_id, INVALID_TOKEN_MESSAGE))
+            continue
+        link.used_at = now
+        link.user.tg_chat_id = chat_id
+        used.append(link)
+        users[link.user_id] = link.user
+        replies.append((chat_id, LINKED_MESSAGE.format(email=link.user.email)))
+    if used:
+        TelegramLinkToken.objects.bulk_update(used, ['used_at'])
+        User.objects.bulk_update(users.values(), ['tg_chat_id'])
+        # bulk_update не вызывает сигналы: закэшированные для аутентификации копии устарели
+        forget_users(*users)
+        logger.info("Привязано чатов Telegram: %s", len(users))
+    return replies
+
+
+def complete_from_callbacks(callbacks, now):
+    """Отмечает выполнения по нажатиям «Выполнено»; возвращает ответы [(callback_query_id, текст)].
+
+    Дата выполнения — локальная дата напоминания в часовом поясе владельца. Нажатие засчитывается,
+    только если кнопку нажали в чате, привязанном к владельцу привычки.
+    """
+    parsed = [(callback, parse_done_callback(callback.get('data'))) for callback in callbacks]
+    habit_ids = {data[0] for _, data in parsed if data}
+    habits = Habit.objects.select_related('owner').only(
+        'id', 'owner__tg_chat_id', 'owner__timezone',
+    ).order_by().in_bulk(habit_ids) if habit_ids else {}
+
+    targets = []
+    for callback, data in parsed:
+        habit = habits.get(data[0]) if data else None
+        chat = (callback.get('message') or {}).get('chat') or {}
+        if habit is None or str(chat.get('id')) != str(habit.owner.tg_chat_id):
+            targets.append((callback['id'], None))
+            continue
+        day = datetime.fromtimestamp(data[1], tz=habit.owner.timezone).date()
+        if day > local_today(habit.owner, now):
+            targets.append((callback['id'], None))
+            continue
+        targets.append((callback['id'], (habit.id, day)))
+
+    created = record_completions(pair for _, pair in targets if pair)
+    answers = []
+    for callback_id, pair in targets:
+        if pair is None:
+            answers.append((callback_id, INVALID_CALLBACK_ANSWER))
+        elif pair in created:
+            # повторное нажатие в этой же пачке отвечает «уже отмечено»
+            created.discard(pair)
+            answers.append((callback_id, COMPLETED_ANSWER.format(day=pair[1])))
+        else:
+            answers.append((callback_id, ALREADY_COMPLETED_ANSWER.format(day=pair[1])))
+    return answers
+
+
+def process_pending_updates(batch_size=None, now=None):
+    """Разбирает одну пачку необработанных обновлений; возвращает сводку.
+
+    Строки пачки блокируются с SKIP LOCKED, поэтому параллельные обработчики (webhook-задача
+    и команда опроса) берут разные обновления.
+    """
+    batch_size = batch_size or settings.TELEGRAM_UPDATES_BATCH_SIZE
+    now = now or timezone.now()
+    with transaction.atomic():
+        rows = list(
+            TelegramUpdate.objects.select_for_update(skip_locked=True)
+            .filter(processed_at__isnull=True).order_by('update_id')[:batch_size]
+        )
+        if not rows:
+            return {'updates': 0, 'replies': 0, 'answers': 0}
+        messages = [row.payload['message'] for row in rows if 'message' in row.payload]
+        callbacks = [row.payload['callback_query'] for row in rows if 'callback_query' in row.payload]
+        replies = link_chats(messages, now)
+        answers = complete_from_callbacks(callbacks, now)
+        TelegramUpdate.objects.filter(update_id__in=[row.update_id for row in rows]).update(processed_at=now)
+
+    # ответы уходят после фиксации: сбой сети не откатывает привязки и отметки
+    deliver_reminders(((chat_id, chat_id, text) for chat_id, text in replies))
+    answered = answer_callback_queries(answers)
+    return {'updates': len(rows), 'replies': len(replies), 'answers': answered}
+
+
+def process_all_pending(batch_size=None):
+    """Разбирает обновления пачками, пока они не закончатся"""
+    total = {'updates': 0, 'replies': 0, 'answers': 0}
+    while True:
+        result = process_pending_updates(batch_size)
+        for key, value in result.items():
+            total[key] += value
+        if not result['updates']:
+            return total
+
+
+def prune_processed_updates(now=None):
+    """Удаляет старые обработанные обновления; последнее сохраняется, чтобы не потерять смещение"""
+    cutoff = (now or timezone.now()) - timedelta(days=settings.TELEGRAM_UPDATES_RETENTION_DAYS)
+    last = TelegramUpdate.objects.aggregate(last=Max('update_id'))['last']
+    deleted, _ = TelegramUpdate.objects.filter(processed_at__lt=cutoff).exclude(update_id=last).delete()
+    return deleted
@@ -1,12 +1,51 @@
-from rest_framework.test import APITestCase
+import asyncio
+import io
+import json
+import os
+import tempfile
+import tracemalloc
+import uuid
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from unittest import mock, skipUnless
+
+from celery import current_app
+from django.core.cache import cache
+from django.core.management import call_command
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.test import AsyncClient, SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase, APITransactionTestCase
 from rest_framework import status
+from rest_framework_simplejwt.tokens import AccessToken
 
-from users.models import User
-from .models import Habit
+from config.db_router import ReplicaRouter, replica_reads, request_scope
+from users.models import TelegramLinkToken, User
+from .benchmarks import compare_results
+from .cache import bump_version, get_version, owner_scope
+from .completions import record_completions
+from .models import (
+    Habit, HabitCompletion, HabitDailyActivity, HabitImportCheckpoint, HabitTombstone, ReminderDelivery,
+    TelegramUpdate,
+)
+from .telegram_stub import FakeTelegramServer
+from .services import TelegramAPIError, TelegramRetryAfter, TelegramSendScheduler, deliver_reminders
+from .messages import REMINDER_MESSAGE_VERSION, done_keyboard, parse_done_callback
+from .partitions import rotate_partitions
+from .serializers import HabitSerializer
+from .sync import prune_tombstones
+from .validators import validate_habit
+from .tasks import (
+    due_reminders, process_telegram_updates, recompute_dst_reminders, send_reminder_notification, shard_reminders,
+    summarize_reminder_batches,
+)
+from .telegram_updates import process_pending_updates, store_updates
 
 
 class HabitTestCase(APITestCase):
     def setUp(self) -> None:
+        cache.clear()
         self.user = User.objects.create(
             email='test@mail.com',
             password='test'
@@ -57,7 +96,7 @@ class HabitTestCase(APITestCase):
             time_of_day="08:00:00"
         )
 
-        response = self.client.get("/api/tracker/habits/")
+        response = self.client.get("/api/tracker/habits/?count=true")
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
@@ -137,3 +176,1138 @@ class HabitTestCase(APITestCase):
         self.assertEqual(Habit.objects.count(), 0)
 
 
+class HabitPaginationTestCase(APITestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = User.objects.create(email='pages@mail.com')
+        self.client.force_authenticate(user=self.user)
+        habits = [Habit.objects.create(owner=self.user, action=f"Привычка {i}", place="Дома") for i in range(12)]
+        # половина привычек с одинаковым created_at: курсор должен различать их по id
+        Habit.objects.filter(id__in=[habit.id for habit in habits[:6]]).update(
+            created_at=datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+        )
+        self.expected = list(Habit.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def test_cursor_walks_all_pages(self):
+        """Переход по next и обратно по previous проходит все привычки без пропусков и повторов"""
+        url, seen, pages = '/api/tracker/habits/', [], []
+        while url:
+            response = self.client.get(url).json()
+            pages.append([habit['id'] for habit in response['results']])
+            seen += pages[-1]
+            url = response['next']
+        self.assertEqual(seen, self.expected)
+        self.assertEqual(len(pages), 3)
+
+        response = self.client.get(self.client.get('/api/tracker/habits/').json()['next']).json()
+        previous = self.client.get(response['previous']).json()
+        self.assertEqual([habit['id'] for habit in previous['results']], pages[0])
+        self.assertIsNone(previous['previous'])
+
+    def test_count_only_on_request(self):
+        """Без ?count=true COUNT(*) не выполняется, размер страницы можно увеличить явно"""
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/tracker/habits/?page_size=50').json()
+        self.assertNotIn('count', response)
+        self.assertEqual(len(response['results']), 12)
+        self.assertIsNone(response['next'])
+
+        cache.clear()
+        response = self.client.get('/api/tracker/habits/?count=true').json()
+        self.assertEqual(response['count'], 12)
+        self.assertEqual(len(response['results']), 5)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/tracker/habits/?cursor=bad')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class HabitBulkTestCase(APITestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = User.objects.create(email='bulk@mail.com')
+        self.client.force_authenticate(user=self.user)
+        self.pleasant = Habit.objects.create(owner=self.user, action="Выпить кофе", place="Кафе", is_pleasant=True)
+
+    def items(self, count):
+        return [
+            {"action": f"Привычка {i}", "place": "Дома", "time_of_day": "08:00:00", "related_habit": self.pleasant.id}
+            for i in range(count)
+        ]
+
+    def test_bulk_create_uses_fixed_number_of_queries(self):
+        """Число запросов не зависит от размера пакета: связанные привычки, затем INSERT в транзакции"""
+        for count in (2, 50):
+            with self.subTest(count=count), self.assertNumQueries(4):
+                response = self.client.post('/api/tracker/habits/bulk/', data=self.items(count), format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            self.assertEqual(len(response.json()), count)
+        habit = Habit.objects.get(id=response.json()[0]['id'])
+        self.assertEqual(habit.related_habit_id, self.pleasant.id)
+        self.assertIsNotNone(habit.next_reminder_at)
+
+    def test_bulk_delete_uses_fixed_number_of_queries(self):
+        """Следы удаления пишутся одним INSERT, кэш списка сбрасывается один раз на пакет"""
+        for count in (2, 50):
+            ids = [habit['id'] for habit in
+                   self.client.post('/api/tracker/habits/bulk/', data=self.items(count), format='json').json()]
+            version = get_version(owner_scope(self.user.pk))
+            with self.subTest(count=count), self.assertNumQueries(10), \
+                    mock.patch('tracker.bulk.bump_version', wraps=bump_version) as bump:
+                response = self.client.delete('/api/tracker/habits/bulk/', data=ids, format='json')
+            self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+            bump.assert_called_once()
+            self.assertNotEqual(get_version(owner_scope(self.user.pk)), version)
+            self.assertEqual(sorted(HabitTombstone.objects.filter(habit_id__in=ids).values_list('habit_id', flat=True)),
+                             sorted(ids))
+
+    def test_bulk_create_is_all_or_nothing(self):
+        """Ошибка в одном элементе отклоняет весь пакет и возвращается по индексу элемента"""
+        items = self.items(3)
+        items[1]['duration_seconds'] = 500
+        items[2]['reward'] = "Конфета"
+        response = self.client.post('/api/tracker/habits/bulk/', data=items, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        errors = response.json()
+        self.assertEqual(errors[0], {})
+        self.assertIn('duration_seconds', errors[1])
+        self.assertIn('non_field_errors', errors[2])
+        self.assertEqual(Habit.objects.count(), 1)
+
+    def test_bulk_update_and_delete(self):
+        """Изменяются и удаляются только свои привычки"""
+        created = self.client.post('/api/tracker/habits/bulk/', data=self.items(3), format='json').json()
+        other = Habit.objects.create(owner=User.objects.create(email='stranger@mail.com'), action="Чужая")
+
+        updates = [{"id": habit['id'], "time_of_day": "09:30:00", "is_public": True} for habit in created]
+        response = self.client.patch('/api/tracker/habits/bulk/', data=updates, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Habit.objects.filter(is_public=True, time_of_day=time(9, 30)).count(), 3)
+
+        response = self.client.patch('/api/tracker/habits/bulk/', data=[{"id": other.id, "action": "Моя"}],
+                                     format='json')
+        self.assertEqual(response.json(), [{'id': ['Привычка не найдена.']}])
+
+        response = self.client.delete('/api/tracker/habits/bulk/', data=[created[0]['id'], other.id], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.delete('/api/tracker/habits/bulk/', data=[habit['id'] for habit in created],
+                                      format='json')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(Habit.objects.filter(owner=self.user).count(), 1)
+
+
+class HabitBatchValidationTestCase(APITestCase):
+    def test_validate_batch_prefetches_related_once(self):
+        """Связанные привычки читаются одним запросом, нарушения собираются все сразу"""
+        user = User.objects.create(email='batch@mail.com')
+        pleasant = Habit.objects.create(owner=user, action="Кофе", is_pleasant=True)
+        useful = Habit.objects.create(owner=user, action="Зарядка")
+        habits = [
+            Habit(owner=user, action="Ок", related_habit_id=pleasant.id),
+            Habit(owner=user, action="Не приятная связь", related_habit_id=useful.id),
+            Habit(owner=user, action="Всё сразу", is_pleasant=True, reward="Конфета", related_habit_id=useful.id),
+        ]
+        with self.assertNumQueries(1):
+            errors = validate_habit.validate_batch(habits)
+        self.assertEqual(errors[0], [])
+        self.assertEqual(errors[1], ['Связанная привычка должна быть приятной.'])
+        self.assertEqual(len(errors[2]), 3)
+
+
+class HabitCompletionTestCase(APITestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = User.objects.create(email='done@mail.com')
+        self.client.force_authenticate(user=self.user)
+        self.habit = Habit.objects.create(owner=self.user, action="Читать", period_days=2)
+        patcher = mock.patch('django.utils.timezone.now',
+                             return_value=datetime(2026, 3, 20, 9, 0, tzinfo=dt_timezone.utc))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def complete(self, day):
+        return self.client.post(f'/api/tracker/habits/{self.habit.id}/complete/',
+                                data={'completed_on': f'2026-03-{day:02d}'})
+
+    def test_streak_follows_period_days(self):
+        """Разрыв больше period_days начинает серию заново, лучшая серия сохраняется"""
+        for day in (12, 14, 15):
+            self.assertEqual(self.complete(day).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.complete(15).status_code, status.HTTP_200_OK)
+        response = self.complete(19).json()
+        self.assertEqual(response['current_streak'], 1)
+        self.assertEqual(response['longest_streak'], 3)
+        self.assertEqual(HabitCompletion.objects.filter(habit=self.habit).count(), 4)
+
+    def test_past_completion_joins_streaks(self):
+        """Отметка задним числом склеивает серии: по маске в окне и по истории для старых дат"""
+        def counters():
+            self.habit.refresh_from_db()
+            return self.habit.current_streak, self.habit.longest_streak
+
+        def complete_on(day):
+            self.client.post(f'/api/tracker/habits/{self.habit.id}/complete/', data={'completed_on': day})
+
+        self.complete(10)
+        self.complete(14)
+        self.assertEqual(counters(), (1, 1))
+        self.complete(12)
+        self.assertEqual(counters(), (3, 3))
+
+        # старше окна маски — пересчёт по истории
+        for day in ('2026-02-01', '2026-02-05', '2026-02-03', '2026-02-07', '2026-02-11', '2026-02-09'):
+            complete_on(day)
+        self.assertEqual(counters(), (3, 6))
+        self.assertEqual(self.habit.last_completed_on, date(2026, 3, 14))
+        self.assertEqual(bin(self.habit.completion_mask).count('1'), 3)
+
+        # в окне, но серия продолжается за его краем — тоже по истории
+        complete_on('2026-02-13')
+        self.assertEqual(counters(), (3, 7))
+
+    def test_batch_completions_recompute_joined_streaks(self):
+        """Пакетная запись (кнопки «Выполнено») тоже склеивает серии отметками задним числом"""
+        record_completions([(self.habit.id, date(2026, 3, 10)), (self.habit.id, date(2026, 3, 14))])
+        record_completions([(self.habit.id, date(2026, 3, 12)), (self.habit.id, date(2026, 1, 2))])
+        self.habit.refresh_from_db()
+        self.assertEqual((self.habit.current_streak, self.habit.longest_streak), (3, 3))
+        self.assertEqual(self.habit.last_completed_on, date(2026, 3, 14))
+
+    def test_stats_are_read_without_history_scan(self):
+        """Статистика считается по счётчикам привычки, доля — от ожидаемого числа выполнений"""
+        for day in (14, 16, 18, 19):
+            self.complete(day)
+        with self.assertNumQueries(1):
+            stats = self.client.get(f'/api/tracker/habits/{self.habit.id}/stats/').json()
+        self.assertEqual(stats['current_streak'], 4)
+        self.assertEqual(stats['completed_last_7_days'], 4)
+        self.assertEqual(stats['adherence_7_days'], 1.0)
+        self.assertEqual(stats['adherence_30_days'], round(4 / 15, 2))
+
+        with mock.patch('django.utils.timezone.now',
+                        return_value=datetime(2026, 3, 25, 9, 0, tzinfo=dt_timezone.utc)):
+            stats = self.client.get(f'/api/tracker/habits/{self.habit.id}/stats/').json()
+        self.assertEqual(stats['current_streak'], 0)
+        self.assertEqual(stats['longest_streak'], 4)
+        self.assertEqual(stats['completed_last_7_days'], 1)
+
+    def test_future_completion_rejected(self):
+        self.assertEqual(self.complete(21).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class EventRetentionTestCase(APITestCase):
+    def test_old_history_rolls_up_and_is_deleted(self):
+        """Без секций (SQLite) устаревшие месяцы сворачиваются в дневные сводки и удаляются DELETE-ом"""
+        user = User.objects.create(email='history@mail.com')
+        habit = Habit.objects.create(owner=user, action="Бегать", time_of_day=time(8, 0))
+        for completed_on in (date(2026, 1, 10), date(2026, 1, 11), date(2026, 6, 1)):
+            HabitCompletion.objects.create(habit=habit, completed_on=completed_on)
+        for day, delivery_status in ((10, ReminderDelivery.STATUS_SENT), (11, ReminderDelivery.STATUS_FAILED)):
+            ReminderDelivery.objects.create(
+                habit=habit, scheduled_for=datetime(2026, 1, day, 5, 0, tzinfo=dt_timezone.utc),
+                status=delivery_status, claim_token=uuid.uuid4(), claimed_at=datetime(2026, 1, day, tzinfo=dt_timezone.utc),
+            )
+
+        now = datetime(2026, 6, 15, tzinfo=dt_timezone.utc)
+        for _ in range(2):
+            report = rotate_partitions(retention_months=3, now=now)
+        self.assertEqual(report['tracker_habitcompletion']['dropped'], [])
+
+        self.assertEqual(list(HabitCompletion.objects.values_list('completed_on', flat=True)), [date(2026, 6, 1)])
+        self.assertFalse(ReminderDelivery.objects.exists())
+        activity = {row.day: row for row in HabitDailyActivity.objects.filter(habit=habit)}
+        self.assertEqual(set(activity), {date(2026, 1, 10), date(2026, 1, 11)})
+        self.assertEqual((activity[date(2026, 1, 10)].completions, activity[date(2026, 1, 10)].reminders_sent), (1, 1))
+        self.assertEqual(activity[date(2026, 1, 11)].reminders_failed, 1)
+
+
+class HabitExportTestCase(APITestCase):
+    # размер выгрузки в тесте памяти; полный прогон: EXPORT_TEST_ROWS=1000000
+    rows = int(os.getenv('EXPORT_TEST_ROWS') or 20000)
+    memory_limit = 8 * 1024 * 1024
+
+    def setUp(self) -> None:
+        self.user = User.objects.create(email='export@mail.com')
+        self.client.force_authenticate(user=self.user)
+
+    def test_export_own_habits(self):
+        """Выгружаются только свои привычки, в CSV и NDJSON"""
+        Habit.objects.create(owner=self.user, action="Читать, по 10 страниц", time_of_day=time(8, 0))
+        Habit.objects.create(owner=User.objects.create(email='someone@mail.com'), action="Чужая")
+
+        response = self.client.get('/api/tracker/habits/export/')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn('"Читать, по 10 страниц"', lines[1])
+
+        response = self.client.get('/api/tracker/habits/export/?file_format=ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([(row['action'], row['time_of_day']) for row in rows], [("Читать, по 10 страниц", '08:00:00')])
+
+    def test_public_export_is_admin_only(self):
+        self.assertEqual(self.client.get('/api/tracker/habits/export/public/').status_code, status.HTTP_403_FORBIDDEN)
+        self.user.is_staff = True
+        self.user.save()
+        Habit.objects.create(owner=self.user, action="Публичная", is_public=True)
+        response = self.client.get('/api/tracker/habits/export/public/?file_format=ndjson')
+        row = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(row['owner__email'], 'export@mail.com')
+
+    def test_export_memory_is_constant(self):
+        """Пиковая память выгрузки ограничена и не зависит от числа строк"""
+        batch = 10000
+        for start in range(0, self.rows, batch):
+            Habit.objects.bulk_create(
+                Habit(owner=self.user, action=f"Привычка {i}", place="Дома")
+                for i in range(start, min(start + batch, self.rows))
+            )
+        tracemalloc.start()
+        try:
+            response = self.client.get('/api/tracker/habits/export/')
+            lines = sum(chunk.count(b'\n') for chunk in response.streaming_content)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(lines, self.rows + 1)
+        self.assertLess(peak, self.memory_limit)
+
+
+class ImportHabitsTestCase(APITestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create(email='import@mail.com')
+        handle, self.path = tempfile.mkstemp(suffix='.csv')
+        self.addCleanup(os.remove, self.path)
+        with os.fdopen(handle, 'w', encoding='utf-8') as fh:
+            fh.write('owner_email,action,place,time_of_day,period_days,reward,is_public\n')
+            for i in range(7):
+                fh.write(f'import@mail.com,Привычка {i},Дома,08:{i:02d},2,,true\n')
+            fh.write('nobody@mail.com,Чужая,,,,,\n')
+            fh.write('import@mail.com,Слишком редко,,,9,,\n')
+
+    def import_habits(self, **options):
+        call_command('import_habits', self.path, chunk_size=3, stdout=io.StringIO(), **options)
+
+    def test_import_validates_and_reports_rejected_rows(self):
+        """Отклонённые строки не мешают остальным и попадают в файл ошибок"""
+        errors_path = self.path + '.errors'
+        self.addCleanup(os.remove, errors_path)
+        with self.assertNumQueries(19):
+            self.import_habits(errors=errors_path)
+        habits = Habit.objects.filter(owner=self.user)
+        self.assertEqual(habits.count(), 7)
+        self.assertTrue(all(habit.next_reminder_at and habit.is_public for habit in habits))
+        with open(errors_path, encoding='utf-8') as fh:
+            rejected = [json.loads(line) for line in fh]
+        self.assertEqual([row['line'] for row in rejected], [8, 9])
+        self.assertIn('period_days', rejected[1]['errors'])
+
+    def test_import_resumes_from_checkpoint(self):
+        """После сбоя импорт продолжается с первой незаписанной пачки без дублей"""
+        from tracker import imports
+        original = imports.write_chunk
+        calls = []
+
+        def failing_write_chunk(*args):
+            calls.append(1)
+            if len(calls) == 2:
+                raise RuntimeError('сбой')
+            return original(*args)
+
+        with mock.patch('tracker.management.commands.import_habits.write_chunk', failing_write_chunk):
+            with self.assertRaises(RuntimeError):
+                self.import_habits()
+        self.assertEqual(HabitImportCheckpoint.objects.get().rows_done, 3)
+
+        self.import_habits()
+        checkpoint = HabitImportCheckpoint.objects.get()
+        self.assertEqual((checkpoint.rows_done, checkpoint.imported, checkpoint.skipped), (9, 7, 2))
+        self.assertEqual(Habit.objects.filter(owner=self.user).count(), 7)
+
+
+class HabitCacheTestCase(APITestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = User.objects.create(email='cache@mail.com')
+        self.other = User.objects.create(email='other@mail.com')
+        self.client.force_authenticate(user=self.user)
+        self.habit = Habit.objects.create(owner=self.other, action="Читать", place="Дома", is_public=True)
+
+    def test_public_feed_is_served_from_cache(self):
+        """Повторный запрос публичной ленты не обращается к таблице привычек"""
+        first = self.client.get('/api/tracker/habits/public/')
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/tracker/habits/public/')
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(second.json()['results'][0]['owner'], 'other@mail.com')
+
+    def test_public_feed_is_invalidated_on_change(self):
+        """Изменение и снятие с публикации сразу видны в ленте"""
+        self.client.get('/api/tracker/habits/public/')
+
+        self.habit.action = "Читать книгу"
+        self.habit.save()
+        response = self.client.get('/api/tracker/habits/public/')
+        self.assertEqual(response.json()['results'][0]['action'], "Читать книгу")
+
+        habit = Habit.objects.get(pk=self.habit.pk)
+        habit.is_public = False
+        habit.save()
+        response = self.client.get('/api/tracker/habits/public/')
+        self.assertEqual(response.json()['results'], [])
+
+    def test_owner_list_is_invalidated_on_create(self):
+        """Список своих привычек кэшируется отдельно и сбрасывается при создании привычки"""
+        response = self.client.get('/api/tracker/habits/')
+        self.assertEqual(response.json()['results'], [])
+
+        self.client.post('/api/tracker/habits/', data={"action": "Бегать", "place": "Парк"})
+        response = self.client.get('/api/tracker/habits/')
+        self.assertEqual(len(response.json()['results']), 1)
+
+
+class HabitSyncTestCase(APITestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = User.objects.create(email='sync@mail.com')
+        self.client.force_authenticate(user=self.user)
+        self.kept = Habit.objects.create(owner=self.user, action="Читать")
+        self.changed = Habit.objects.create(owner=self.user, action="Бегать")
+        self.removed = Habit.objects.create(owner=self.user, action="Гулять")
+
+    def sync(self, since=None):
+        return self.client.get('/api/tracker/habits/changes/', data={'since': since} if since else {})
+
+    def test_changes_since_watermark(self):
+        """Возвращаются созданные и изменённые после метки привычки и id удалённых"""
+        first = self.sync().json()
+        self.assertTrue(first['full'])
+        self.assertEqual(len(first['changed']), 3)
+
+        later = timezone.now() + timedelta(minutes=1)
+        removed_id = self.removed.id
+        with mock.patch('django.utils.timezone.now', return_value=later):
+            self.changed.action = "Бегать в парке"
+            self.changed.save()
+            self.removed.delete()
+            created = Habit.objects.create(owner=self.user, action="Плавать")
+        Habit.objects.filter(pk=self.kept.pk).update(updated_at=timezone.now() - timedelta(minutes=1))
+
+        with mock.patch('django.utils.timezone.now', return_value=later + timedelta(seconds=1)):
+            delta = self.sync(first['watermark']).json()
+        self.assertFalse(delta['full'])
+        self.assertEqual([habit['id'] for habit in delta['changed']], sorted([self.changed.id, created.id]))
+        self.assertEqual(delta['deleted'], [removed_id])
+
+    def test_unchanged_list_skips_database(self):
+        """Без изменений после метки ответ собирается по версии в кэше, без запросов к БД"""
+        later = timezone.now() + timedelta(minutes=1)
+        with mock.patch('django.utils.timezone.now', return_value=later):
+            watermark = self.sync().json()['watermark']
+        with mock.patch('django.utils.timezone.now', return_value=later + timedelta(minutes=1)), \
+                self.assertNumQueries(0):
+            delta = self.sync(watermark).json()
+        self.assertEqual((delta['changed'], delta['deleted']), ([], []))
+
+    def test_deleting_linked_habit_refreshes_other_owners(self):
+        """Удаление чужой приятной привычки обнуляет related_habit: кэш списка и дельта это видят"""
+        author = User.objects.create(email='author@mail.com')
+        pleasant = Habit.objects.create(owner=author, action="Съесть десерт", is_pleasant=True, is_public=True)
+        Habit.objects.filter(pk=self.kept.pk).update(related_habit=pleasant)
+        Habit.objects.filter(owner=self.user).update(updated_at=timezone.now() - timedelta(minutes=1))
+        bump_version(owner_scope(self.user.pk))
+        listed = self.client.get('/api/tracker/habits/').json()['results']
+        self.assertIn(pleasant.pk, [habit['related_habit'] for habit in listed])
+        watermark = self.sync().json()['watermark']
+        pleasant_id = pleasant.pk
+
+        pleasant.delete()
+
+        listed = self.client.get('/api/tracker/habits/').json()['results']
+        self.assertNotIn(pleasant_id, [habit['related_habit'] for habit in listed])
+        delta = self.sync(watermark).json()
+        self.assertEqual([(habit['id'], habit['related_habit']) for habit in delta['changed']], [(self.kept.pk, None)])
+
+    def test_stale_watermark_gets_full_list(self):
+        self.removed.delete()
+        HabitTombstone.objects.update(deleted_at=timezone.now() - timedelta(days=40))
+        prune_tombstones()
+        self.assertFalse(HabitTombstone.objects.exists())
+
+        delta = self.sync((timezone.now() - timedelta(days=40)).isoformat()).json()
+        self.assertTrue(delta['full'])
+        self.assertEqual(len(delta['changed']), 2)
+        self.assertEqual(self.sync('вчера').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_deleting_owner_leaves_no_tombstones(self):
+        self.user.delete()
+        self.assertFalse(HabitTombstone.objects.exists())
+
+    def test_conditional_get_returns_304_without_serializing(self):
+        """Повторный опрос с If-None-Match/If-Modified-Since получает 304; после изменения — новый список"""
+        for url in ('/api/tracker/habits/', '/api/tracker/habits/public/'):
+            response = self.client.get(url)
+            self.assertIn('ETag', response)
+            with self.assertNumQueries(0), \
+                    mock.patch('tracker.views.HabitSerializer.to_representation') as to_representation:
+                not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+                by_date = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+            self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(by_date.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(not_modified['ETag'], response['ETag'])
+            to_representation.assert_not_called()
+
+        response = self.client.get('/api/tracker/habits/')
+        self.kept.is_public = True
+        self.kept.save()
+        for url in ('/api/tracker/habits/', '/api/tracker/habits/public/'):
+            fresh = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(fresh.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(fresh['ETag'], response['ETag'])
+        # другая страница того же списка — другой ETag
+        self.assertNotEqual(self.client.get('/api/tracker/habits/', data={'page_size': 1})['ETag'],
+                            self.client.get('/api/tracker/habits/')['ETag'])
+
+
+class AsyncHabitReadTestCase(APITestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = User.objects.create(email='async@mail.com')
+        self.other = User.objects.create(email='other-async@mail.com')
+        self.habit = Habit.objects.create(owner=self.user, action="Читать", is_public=True)
+        self.foreign = Habit.objects.create(owner=self.other, action="Бегать")
+        self.token = str(AccessToken.for_user(self.user))
+
+    def test_reads_and_writes(self):
+        """Чтение идёт через асинхронные представления, запись — через HabitViewSet"""
+        self.client.force_authenticate(user=self.user)
+        detail = self.client.get(f'/api/tracker/habits/{self.habit.id}/')
+        self.assertEqual(detail.json(), json.loads(json.dumps(HabitSerializer(self.habit).data)))
+        self.assertEqual(self.client.get(f'/api/tracker/habits/{self.foreign.id}/').status_code,
+                         status.HTTP_404_NOT_FOUND)
+        self.assertEqual([habit['id'] for habit in self.client.get('/api/tracker/habits/').json()['results']],
+                         [self.habit.id])
+        self.assertEqual(self.client.get('/api/tracker/habits/public/').json()['results'][0]['owner'],
+                         'async@mail.com')
+
+        created = self.client.post('/api/tracker/habits/', data={'action': 'Плавать'})
+        self.assertEqual(created.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.client.patch(f'/api/tracker/habits/{self.habit.id}/', data={'place': 'Парк'}).json()
+                         ['place'], 'Парк')
+        self.assertEqual(self.client.delete(f"/api/tracker/habits/{created.json()['id']}/").status_code,
+                         status.HTTP_204_NO_CONTENT)
+        self.assertEqual(len(self.client.get('/api/tracker/habits/').json()['results']), 1)
+
+    def test_authentication_errors(self):
+        response = self.client.get('/api/tracker/habits/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertIn('WWW-Authenticate', response)
+        response = self.client.get('/api/tracker/habits/', HTTP_AUTHORIZATION='Bearer broken')
+        self.assertEqual(response.json()['code'], 'token_not_valid')
+
+    async def test_concurrent_readers(self):
+        """Одновременные запросы с JWT обслуживаются одним циклом событий"""
+        client, headers = AsyncClient(), {'Authorization': f'Bearer {self.token}'}
+        urls = [f'/api/tracker/habits/{self.habit.id}/', '/api/tracker/habits/', '/api/tracker/habits/public/']
+        responses = await asyncio.gather(*(client.get(url, headers=headers) for url in urls * 5))
+        self.assertEqual({response.status_code for response in responses}, {status.HTTP_200_OK})
+        self.assertEqual(len({response.content for response in responses[1::3]}), 1)
+
+
+class TelegramUpdatesTestCase(APITestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = User.objects.create(email='chat@mail.com', tg_chat_id='500')
+        self.habit = Habit.objects.create(owner=self.user, action="Читать", period_days=1)
+        self.reminded_at = datetime(2026, 3, 20, 5, 0, tzinfo=dt_timezone.utc)
+        patcher = mock.patch('django.utils.timezone.now',
+                             return_value=datetime(2026, 3, 20, 9, 0, tzinfo=dt_timezone.utc))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def telegram(self):
+        stub = FakeTelegramServer().start()
+        self.addCleanup(stub.stop)
+        settings_override = override_settings(TELEGRAM_URL=stub.base_url, TELEGRAM_BOT_URL='test',
+                                              TELEGRAM_BOT_USERNAME='habits_bot')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        return stub
+
+    def done_callback(self, habit, chat_id='500', scheduled=None):
+        scheduled = scheduled or self.reminded_at
+        return {'callback_query': {
+            'id': str(uuid.uuid4()),
+            'data': done_keyboard(habit.id, scheduled.timestamp())['inline_keyboard'][0][0]['callback_data'],
+            'message': {'chat': {'id': int(chat_id)}},
+        }}
+
+    def test_link_chat_with_one_time_token(self):
+        """Ссылка из приложения привязывает чат через /start; повторно токен не действует"""
+        stub = self.telegram()
+        user = User.objects.create(email='new@mail.com')
+        self.client.force_authenticate(user=user)
+        response = self.client.post('/users/telegram/link/')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        token = response.json()['token']
+        self.assertEqual(response.json()['link'], f'https://t.me/habits_bot?start={token}')
+
+        stub.push_update({'message': {'chat': {'id': 777}, 'text': f'/start {token}'}})
+        call_command('poll_telegram_updates', '--once', stdout=io.StringIO())
+        user.refresh_from_db()
+        self.assertEqual(user.tg_chat_id, '777')
+        self.assertEqual(TelegramLinkToken.objects.get(token=token).used_at, datetime(2026, 3, 20, 9, 0, tzinfo=dt_timezone.utc))
+
+        stub.push_update({'message': {'chat': {'id': 888}, 'text': f'/start {token}'}})
+        call_command('poll_telegram_updates', '--once', stdout=io.StringIO())
+        user.refresh_from_db()
+        self.assertEqual(user.tg_chat_id, '777')
+        self.assertEqual([message['chat_id'] for message in stub.messages], ['777', '888'])
+        self.assertIn('new@mail.com', stub.messages[0]['text'])
+        # следующий опрос подтверждает полученные обновления смещением и не получает их повторно
+        out = io.StringIO()
+        call_command('poll_telegram_updates', '--once', stdout=out)
+        self.assertIn('Получено 0', out.getvalue())
+        self.assertEqual(stub.updates, [])
+        self.assertEqual(TelegramUpdate.objects.filter(processed_at__isnull=True).count(), 0)
+
+    def test_done_callbacks_are_processed_in_bulk(self):
+        """Число запросов к БД на пачку не зависит от числа нажатий; повторы и чужие чаты не засчитываются"""
+        stub = self.telegram()
+        users = User.objects.bulk_create([User(email=f'burst{i}@mail.com', tg_chat_id=str(1000 + i)) for i in range(60)])
+        habits = Habit.objects.bulk_create([Habit(owner=user, action="Бегать") for user in users])
+
+        def burst(habits, update_id):
+            updates = []
+            for habit in habits:
+                update = self.done_callback(habit, chat_id=habit.owner.tg_chat_id)
+                # двойное нажатие: Telegram присылает два разных callback_query
+                updates += [update, self.done_callback(habit, chat_id=habit.owner.tg_chat_id)]
+            for update in updates:
+                update_id += 1
+                update['update_id'] = update_id
+            store_updates(updates)
+            # повторная доставка тех же обновлений ничего не дублирует
+            store_updates(updates[:5])
+            with CaptureQueriesContext(connection) as queries:
+                result = process_pending_updates(batch_size=1000)
+            self.assertEqual(result['updates'], len(updates))
+            return len(queries), update_id
+
+        small, update_id = burst(habits[:5], 0)
+        large, _ = burst(habits[5:], update_id)
+        self.assertEqual(small, large)
+
+        self.assertEqual(HabitCompletion.objects.filter(habit__in=habits).count(), 60)
+        self.assertEqual(HabitCompletion.objects.filter(habit__in=habits).first().completed_on, date(2026, 3, 20))
+        self.assertEqual(Habit.objects.get(pk=habits[0].pk).current_streak, 1)
+        texts = [answer['text'] for answer in stub.callback_answers]
+        self.assertEqual(texts.count('Отмечено выполнение за 20.03.2026'), 60)
+        self.assertEqual(texts.count('Выполнение за 20.03.2026 уже отмечено'), 60)
+
+    def test_callback_from_foreign_chat_is_rejected(self):
+        stub = self.telegram()
+        store_updates([
+            {'update_id': 1, **self.done_callback(self.habit, chat_id='999')},
+            {'update_id': 2, **self.done_callback(self.habit, scheduled=datetime(2026, 3, 25, 5, 0, tzinfo=dt_timezone.utc))},
+            {'update_id': 3, 'callback_query': {'id': 'x', 'data': 'garbage', 'message': {'chat': {'id': 500}}}},
+        ])
+        process_pending_updates()
+        self.assertFalse(HabitCompletion.objects.exists())
+        self.assertEqual([answer['text'] for answer in stub.callback_answers], ['Эта кнопка больше не действует'] * 3)
+
+    @override_settings(TELEGRAM_WEBHOOK_SECRET='hook-secret')
+    def test_webhook_checks_secret_and_deduplicates(self):
+        """Webhook проверяет секрет, сохраняет обновление один раз и планирует одну задачу разбора"""
+        update = {'update_id': 42, **self.done_callback(self.habit)}
+        response = self.client.post('/api/tracker/telegram/webhook/', data=update, format='json',
+                                    HTTP_X_TELEGRAM_BOT_API_SECRET_TOKEN='wrong')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        with mock.patch('tracker.tasks.process_telegram_updates.apply_async') as apply_async:
+            for _ in range(3):
+                response = self.client.post('/api/tracker/telegram/webhook/', data=update, format='json',
+                                            HTTP_X_TELEGRAM_BOT_API_SECRET_TOKEN='hook-secret')
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(apply_async.call_count, 1)
+        self.assertEqual(TelegramUpdate.objects.count(), 1)
+
+        self.telegram()
+        self.assertEqual(process_telegram_updates()['updates'], 1)
+        self.assertTrue(HabitCompletion.objects.filter(habit=self.habit, completed_on=date(2026, 3, 20)).exists())
+
+
+# выборка тика с реплики проверяется в ReplicaRoutingTestCase: здесь данные не зафиксированы и реплике не видны
+@override_settings(DATABASE_REPLICAS=[])
+class ReminderSelectionTestCase(APITestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create(email='reminder@mail.com', tg_chat_id='123')
+        patcher = mock.patch('django.utils.timezone.now')
+        self.now_mock = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.at(7, 0)
+
+    def at(self, hour, minute, second=0, day=1):
+        """Переводит «текущее время» на указанное московское время 1 января 2026"""
+        moment = datetime(2026, 1, day, hour - 3, minute, second, tzinfo=dt_timezone.utc)
+        self.now_mock.return_value = moment
+        return moment
+
+    def test_next_reminder_at_is_computed(self):
+        """Тест: срок напоминания считается при сохранении и меняется только вместе с расписанием"""
+        habit = Habit.objects.create(owner=self.user, action="Зарядка", time_of_day="08:30:00")
+        self.assertEqual(habit.next_reminder_at, datetime(2026, 1, 1, 5, 30, tzinfo=dt_timezone.utc))
+
+        early = Habit.objects.create(owner=self.user, action="Вода", time_of_day="06:00:00")
+        self.assertEqual(early.next_reminder_at, datetime(2026, 1, 2, 3, 0, tzinfo=dt_timezone.utc))
+
+        habit = Habit.objects.get(pk=habit.pk)
+        self.at(8, 0)
+        habit.action = "Пробежка"
+        habit.save()
+        self.assertEqual(habit.next_reminder_at, datetime(2026, 1, 1, 5, 30, tzinfo=dt_timezone.utc))
+
+        habit.time_of_day = time(7, 0)
+        habit.save()
+        self.assertEqual(habit.next_reminder_at, datetime(2026, 1, 2, 4, 0, tzinfo=dt_timezone.utc))
+
+        habit.time_of_day = None
+        habit.save()
+        habit.refresh_from_db()
+        self.assertIsNone(habit.next_reminder_at)
+
+    def test_next_reminder_uses_owner_timezone(self):
+        """Тест: срок считается в поясе владельца и пересчитывается при смене пояса"""
+        self.user.timezone = 'Asia/Tokyo'
+        self.user.save()
+        habit = Habit.objects.create(owner=self.user, action="Зарядка", time_of_day="08:00:00")
+        self.assertEqual(habit.next_reminder_at, datetime(2026, 1, 1, 23, 0, tzinfo=dt_timezone.utc))
+
+        user = User.objects.get(pk=self.user.pk)
+        user.timezone = 'Europe/London'
+        user.save()
+
+        habit.refresh_from_db()
+        self.assertEqual(habit.next_reminder_at, datetime(2026, 1, 1, 8, 0, tzinfo=dt_timezone.utc))
+
+    def test_dst_transition_realigns_schedule(self):
+        """Тест: перед переходом на летнее время сроки возвращаются на локальное время привычки"""
+        self.user.timezone = 'Europe/Berlin'
+        self.user.save()
+        self.now_mock.return_value = datetime(2026, 3, 27, 10, 0, tzinfo=dt_timezone.utc)
+        habit = Habit.objects.create(owner=self.user, action="Зарядка", time_of_day="08:00:00")
+        # так срок выглядит после сдвига тиком на сутки в UTC через 29 марта
+        Habit.objects.filter(pk=habit.pk).update(next_reminder_at=datetime(2026, 3, 29, 7, 0, tzinfo=dt_timezone.utc))
+
+        result = recompute_dst_reminders()
+
+        self.assertEqual(result['zones'], ['Europe/Berlin'])
+        habit.refresh_from_db()
+        self.assertEqual(habit.next_reminder_at, datetime(2026, 3, 29, 6, 0, tzinfo=dt_timezone.utc))
+
+    def test_due_reminders_uses_window(self):
+        """Тест: в выборку попадают только напоминания, срок которых наступил в последнюю минуту"""
+        Habit.objects.create(owner=self.user, action="Зарядка", time_of_day="07:59:00")
+        on_time = Habit.objects.create(owner=self.user, action="Вода", time_of_day="08:00:00")
+        Habit.objects.create(owner=self.user, action="Чтение", time_of_day="08:01:00")
+        Habit.objects.create(owner=self.user, action="Прогулка")
+
+        due = due_reminders(self.at(8, 0, 30))
+
+        self.assertEqual([row['id'] for row in due], [on_time.id])
+
+    @mock.patch('tracker.services.send_tg_reminder')
+    def test_sweep_advances_by_period_days(self, send_mock):
+        """Тест: после рассылки срок сдвигается на period_days, повторный тик ничего не отправляет"""
+        habit = Habit.objects.create(owner=self.user, action="Зарядка", time_of_day="08:00:00", period_days=3)
+
+        self.at(8, 0)
+        self.assertEqual(send_reminder_notification()['reminders_sent'], 1)
+        self.assertEqual(send_reminder_notification()['reminders_due'], 0)
+        self.assertEqual(send_mock.call_count, 1)
+
+        habit.refresh_from_db()
+        self.assertEqual(habit.next_reminder_at, datetime(2026, 1, 4, 5, 0, tzinfo=dt_timezone.utc))
+        self.at(8, 0, day=2)
+        self.assertEqual(send_reminder_notification()['reminders_due'], 0)
+
+    @mock.patch('tracker.services.send_tg_reminder')
+    def test_sweep_sends_stored_message(self, send_mock):
+        """Тест: рассылка отправляет сохранённый текст, устаревший пересобирается перед отправкой"""
+        pleasant = Habit.objects.create(owner=self.user, action="Выпить кофе", is_pleasant=True)
+        habit = Habit.objects.create(owner=self.user, action="Зарядка", time_of_day="08:00:00",
+                                     related_habit=pleasant)
+        self.assertIn("После выполнения: Выпить кофе", habit.reminder_message)
+
+        pleasant.action = "Выпить какао"
+        pleasant.save()
+        habit.refresh_from_db()
+        self.assertIn("После выполнения: Выпить какао", habit.reminder_message)
+
+        Habit.objects.filter(pk=habit.pk).update(reminder_message="Готовый текст")
+        reminded_at = self.at(8, 0)
+        send_reminder_notification()
+        self.assertEqual(send_mock.call_args.args[1], "Готовый текст")
+        # под напоминанием кнопка «Выполнено» с привычкой и сроком напоминания
+        button = send_mock.call_args.kwargs['reply_markup']['inline_keyboard'][0][0]
+        self.assertEqual(parse_done_callback(button['callback_data']), (habit.id, int(reminded_at.timestamp())))
+
+        pleasant.delete()
+        habit.refresh_from_db()
+        self.assertEqual(habit.reminder_message_version, 0)
+        self.at(8, 0, day=2)
+        send_reminder_notification()
+        self.assertNotIn("После выполнения", send_mock.call_args.args[1])
+        habit.refresh_from_db()
+        self.assertEqual(habit.reminder_message_version, REMINDER_MESSAGE_VERSION)
+
+    @mock.patch('tracker.services.send_tg_reminder')
+    def test_delivery_ledger_records_status(self, send_mock):
+        """Тест: журнал доставки хранит статус, число попыток и ошибку по каждому слоту"""
+        failing_owner = User.objects.create(email='failing@mail.com', tg_chat_id='666')
+        sent = Habit.objects.create(owner=self.user, action="Зарядка", time_of_day="08:00:00")
+        failed = Habit.objects.create(owner=failing_owner, action="Вода", time_of_day="08:00:00")
+
+        def send(chat_id, message, session=None, reply_markup=None):
+            if chat_id == '666':
+                raise TelegramAPIError('chat not found', 400)
+            return {'ok': True}
+
+        send_mock.side_effect = send
+
+        self.at(8, 0)
+        result = send_reminder_notification()
+
+        self.assertEqual((result['reminders_sent'], result['reminders_failed']), (1, 1))
+        sent_delivery = ReminderDelivery.objects.get(habit=sent)
+        self.assertEqual(sent_delivery.status, ReminderDelivery.STATUS_SENT)
+        self.assertEqual(sent_delivery.scheduled_for, self.at(8, 0))
+        self.assertEqual(sent_delivery.attempts, 1)
+        self.assertIsNotNone(sent_delivery.sent_at)
+        self.assertIsNotNone(sent_delivery.latency_ms)
+        failed_delivery = ReminderDelivery.objects.get(habit=failed)
+        self.assertEqual(failed_delivery.status, ReminderDelivery.STATUS_FAILED)
+        self.assertIn('chat not found', failed_delivery.error)
+
+    @mock.patch('tracker.services.send_tg_reminder')
+    def test_delivery_ledger_suppresses_duplicates(self, send_mock):
+        """Тест: слот, уже занятый другим тиком, повторно не отправляется"""
+        habit = Habit.objects.create(owner=self.user, action="Зарядка", time_of_day="08:00:00")
+        ReminderDelivery.objects.create(habit=habit, scheduled_for=habit.next_reminder_at,
+                                        claim_token=uuid.uuid4(), claimed_at=habit.next_reminder_at)
+
+        self.at(8, 0)
+        result = send_reminder_notification()
+
+        self.assertEqual(result['reminders_due'], 1)
+        self.assertEqual(result['reminders_duplicate'], 1)
+        self.assertEqual(result['reminders_sent'], 0)
+        send_mock.assert_not_called()
+
+    @mock.patch('tracker.services.send_tg_reminder')
+    def test_failed_reminder_is_retried_next_tick(self, send_mock):
+        """Тест: неудавшаяся отправка повторяется следующим тиком по тому же слоту и только один раз"""
+        habit = Habit.objects.create(owner=self.user, action="Зарядка", time_of_day="08:00:00")
+        send_mock.side_effect = [TelegramAPIError('Bad Request: message thread not found', 400), {'ok': True}]
+
+        reminded_at = self.at(8, 0)
+        self.assertEqual(send_reminder_notification()['reminders_failed'], 1)
+
+        self.at(8, 1)
+        result = send_reminder_notification()
+        self.assertEqual((result['reminders_due'], result['reminders_retried']), (0, 1))
+        self.assertEqual(result['reminders_sent'], 1)
+        button = send_mock.call_args.kwargs['reply_markup']['inline_keyboard'][0][0]
+        self.assertEqual(parse_done_callback(button['callback_data']), (habit.id, int(reminded_at.timestamp())))
+        delivery = ReminderDelivery.objects.get(habit=habit)
+        self.assertEqual((delivery.status, delivery.attempts), (ReminderDelivery.STATUS_SENT, 2))
+
+        self.at(8, 2)
+        self.assertEqual(send_reminder_notification()['reminders_retried'], 0)
+        self.assertEqual(send_mock.call_count, 2)
+
+    @mock.patch('tracker.services.send_tg_reminder')
+    def test_failed_reminder_retries_are_bounded(self, send_mock):
+        """Тест: повторы прекращаются после REMINDER_MAX_ATTEMPTS попыток или за окном REMINDER_RETRY_MINUTES"""
+        send_mock.side_effect = TelegramAPIError('Forbidden: bot was blocked by the user', 403)
+        for max_attempts, retry_minutes, expected in ((3, 30, 3), (5, 3, 3)):
+            with self.subTest(max_attempts=max_attempts, retry_minutes=retry_minutes), \
+                    override_settings(REMINDER_MAX_ATTEMPTS=max_attempts, REMINDER_RETRY_MINUTES=retry_minutes):
+                Habit.objects.all().delete()
+                self.at(7, 0)
+                Habit.objects.create(owner=self.user, action="Зарядка", time_of_day="08:00:00")
+                send_mock.reset_mock()
+                for minute in range(6):
+                    self.at(8, minute)
+                    send_reminder_notification()
+
+                self.assertEqual(send_mock.call_count, expected)
+                delivery = ReminderDelivery.objects.get()
+                self.assertEqual((delivery.status, delivery.attempts), (ReminderDelivery.STATUS_FAILED, expected))
+
+    def test_missed_reminders_are_rescheduled(self):
+        """Тест: пропущенное напоминание не отправляется задним числом, а переносится на следующий день"""
+        habit = Habit.objects.create(owner=self.user, action="Зарядка", time_of_day="08:00:00")
+
+        self.at(9, 0)
+        self.assertEqual(send_reminder_notification()['reminders_due'], 0)
+
+        habit.refresh_from_db()
+        self.assertEqual(habit.next_reminder_at, datetime(2026, 1, 2, 5, 0, tzinfo=dt_timezone.utc))
+
+    def _create_due_habits(self, count):
+        pleasant = Habit.objects.create(owner=self.user, action="Съесть яблоко", is_pleasant=True)
+        for i in range(count):
+            owner = User.objects.create(email=f'owner{count}-{i}@mail.com', tg_chat_id=str(1000 + i))
+            Habit.objects.create(owner=owner, action=f"Зарядка {i}", time_of_day="08:00:00",
+                                 related_habit=pleasant)
+
+    @mock.patch('tracker.services.send_tg_reminder')
+    def test_sweep_query_count_is_fixed(self, send_mock):
+        """Тест: число запросов в рассылке не зависит от количества напоминаний"""
+        for count in (1, 10):
+            with self.subTest(count=count):
+                Habit.objects.all().delete()
+                self.at(7, 0)
+                self._create_due_habits(count)
+                send_mock.reset_mock()
+                self.at(8, 0)
+
+                # пропущенные, выборка должных, UPDATE переноса срока (+ savepoint транзакции),
+                # занятие слотов в журнале (INSERT + SELECT), повтор неудавшихся слотов (UPDATE)
+                # и запись статусов доставки
+                with self.assertNumQueries(9):
+                    result = send_reminder_notification()
+
+                self.assertEqual(result['reminders_sent'], count)
+                self.assertEqual(send_mock.call_count, count)
+                message = send_mock.call_args.args[1]
+                self.assertIn('После выполнения: Съесть яблоко', message)
+
+    @mock.patch('tracker.services.send_tg_reminder')
+    def test_sweep_logs_one_summary_per_tick(self, send_mock):
+        """Тест: на уровне INFO тик пишет одну сводную запись, подробности — только выборочно"""
+        self._create_due_habits(5)
+        self.at(8, 0)
+
+        with self.assertLogs('tracker', level='INFO') as logs:
+            send_reminder_notification()
+
+        self.assertEqual(len(logs.records), 1)
+        self.assertEqual(logs.records[0].reminder_sweep['reminders_sent'], 5)
+
+        # следующий срок: слоты первого тика уже заняты, и повтор на тот же срок ничего бы не отправил
+        Habit.objects.filter(time_of_day__isnull=False).update(next_reminder_at=self.at(8, 0, day=2))
+        with override_settings(REMINDER_LOG_SAMPLE_RATE=1.0), self.assertLogs('tracker', level='INFO') as logs:
+            send_reminder_notification()
+
+        self.assertEqual(len(logs.records), 6)
+        summary = [record for record in logs.records if hasattr(record, 'reminder_sweep')]
+        self.assertEqual(summary[0].reminder_sweep['reminders_sent'], 5)
+        self.assertEqual(send_mock.call_count, 10)
+
+    @override_settings(REMINDER_BATCH_SIZE=2)
+    @mock.patch('tracker.services.send_tg_reminder')
+    def test_sweep_fans_out_to_shards(self, send_mock):
+        """Тест: крупный тик раздаётся подзадачам, сводка собирается по всем шардам"""
+        self._create_due_habits(6)
+        self.at(8, 0)
+        current_app.conf.task_always_eager = True
+        self.addCleanup(setattr, current_app.conf, 'task_always_eager', False)
+
+        with mock.patch.object(summarize_reminder_batches, 'run',
+                               wraps=summarize_reminder_batches.run) as summarize_mock:
+            result = send_reminder_notification()
+
+        self.assertEqual(result['status'], 'dispatched')
+        self.assertEqual(result['shards'], 3)
+        self.assertEqual(send_mock.call_count, 6)
+        batch_results = summarize_mock.call_args.args[0]
+        self.assertEqual(sum(batch['sent'] for batch in batch_results), 6)
+
+    def test_shard_reminders_keeps_owner_together(self):
+        """Тест: напоминания одного владельца не разбиваются между шардами"""
+        messages = {owner_id: [(owner_id * 10 + i, 'chat', 'text') for i in range(3)] for owner_id in range(5)}
+
+        with override_settings(REMINDER_BATCH_SIZE=4, REMINDER_MAX_SHARDS=2):
+            batches = shard_reminders(messages)
+
+        self.assertEqual(len(batches), 2)
+        self.assertEqual(sum(len(batch) for batch in batches), 15)
+        for owner_id in range(5):
+            keys = {owner_id * 10 + i for i in range(3)}
+            self.assertEqual(sum(1 for batch in batches if keys & {key for key, _, _ in batch}), 1)
+
+
+class TelegramDeliveryTestCase(SimpleTestCase):
+    def test_deliver_reminders_reports_each_message(self):
+        """Тест: параллельная доставка возвращает результат по каждому сообщению"""
+        messages = [(i, str(i), f'Напоминание {i}') for i in range(20)]
+
+        with FakeTelegramServer(failing_chats=['7']) as stub, \
+                override_settings(TELEGRAM_URL=stub.base_url, TELEGRAM_BOT_URL='test'):
+            results = deliver_reminders(messages, max_workers=4)
+
+        self.assertEqual([result.key for result in results], list(range(20)))
+        self.assertEqual([result.key for result in results if not result.ok], [7])
+        self.assertEqual(len(stub.messages), 19)
+        self.assertEqual({message['text'] for message in stub.messages},
+                         {text for key, chat_id, text in messages if key != 7})
+
+    def test_retry_after_is_honored(self):
+        """Тест: после ответа 429 сообщение повторяется через retry_after и доходит"""
+        scheduler = TelegramSendScheduler(chat_rate=100, global_rate=100, deadline=10)
+
+        with FakeTelegramServer(chat_rate=1) as stub, \
+                override_settings(TELEGRAM_URL=stub.base_url, TELEGRAM_BOT_URL='test'):
+            results = deliver_reminders([(1, '5', 'Первое'), (2, '5', 'Второе')], max_workers=1,
+                                        scheduler=scheduler)
+
+        self.assertTrue(all(result.ok for result in results))
+        self.assertEqual([result.attempts for result in results], [1, 2])
+        self.assertEqual(stub.rate_limited, 1)
+        self.assertEqual([message['text'] for message in stub.messages], ['Первое', 'Второе'])
+
+    @override_settings(TELEGRAM_GLOBAL_RATE=1, TELEGRAM_CHAT_RATE=1, TELEGRAM_SEND_DEADLINE=1)
+    def test_delivery_benchmark_ignores_rate_limits(self):
+        """Тест: замер доставки не упирается в лимиты из настроек — меряется пул соединений"""
+        out = io.StringIO()
+
+        call_command('bench_tg_delivery', messages=50, latency_ms=0, stdout=out)
+
+        self.assertTrue(out.getvalue().startswith('50/50 '))
+
+
+class TelegramSendSchedulerTestCase(SimpleTestCase):
+    def setUp(self) -> None:
+        self.now = 0.0
+        self.sent = []
+
+    def _sleep(self, seconds):
+        self.now += seconds
+
+    def _scheduler(self, **kwargs):
+        return TelegramSendScheduler(clock=lambda: self.now, sleep=self._sleep, **kwargs)
+
+    @mock.patch('tracker.services.send_tg_reminder')
+    def test_global_and_chat_rates(self, send_mock):
+        """Тест: темп отправки не превышает общий лимит и лимит на чат"""
+        send_mock.side_effect = lambda chat_id, message, session=None, reply_markup=None: self.sent.append((self.now, chat_id))
+        scheduler = self._scheduler(global_rate=10, chat_rate=1, deadline=60)
+
+        for chat_id in ['1', '2', '3', '4', '5']:
+            scheduler.send(chat_id, 'text')
+        self.assertAlmostEqual(self.now, 0.4)
+
+        for _ in range(3):
+            scheduler.send('9', 'text')
+        self.assertAlmostEqual(self.sent[-1][0] - self.sent[-3][0], 2.0)
+
+    @mock.patch('tracker.services.send_tg_reminder')
+    def test_gives_up_after_deadline(self, send_mock):
+        """Тест: повторы прекращаются, когда окно напоминания истекло"""
+        send_mock.side_effect = TelegramRetryAfter('Too Many Requests', 429, retry_after=30)
+        scheduler = self._scheduler(deadline=45)
+
+        with self.assertRaises(TimeoutError):
+            scheduler.send('1', 'text')
+        self.assertEqual(send_mock.call_count, 2)
+
+
+class BenchmarkCompareTestCase(SimpleTestCase):
+    def test_regressions_are_detected_per_metric(self):
+        """Задержки хуже при росте, пропускная способность — при падении; новые замеры пропускаются"""
+        baseline = {'results': [{'name': 'api.list', 'p50_ms': 10.0, 'p99_ms': 20.0, 'per_second': 100.0}]}
+        current = {'results': [
+            {'name': 'api.list', 'p50_ms': 11.0, 'p99_ms': 30.0, 'per_second': 70.0},
+            {'name': 'api.new', 'p50_ms': 1.0, 'p99_ms': 1.0, 'per_second': 1.0},
+        ]}
+
+        rows = compare_results(baseline, current, threshold=20)
+
+        self.assertEqual([(metric, change, regressed) for _, metric, _, _, change, regressed in rows], [
+            ('p50_ms', 10.0, False),
+            ('p99_ms', 50.0, True),
+            ('per_second', -30.0, True),
+        ])
+
+
+def time_ns_ago(seconds):
+    return int((timezone.now().timestamp() - seconds) * 10 ** 9)
+
+
+@skipUnless(settings.DATABASE_REPLICAS, 'нужна реплика: DB_REPLICA_HOSTS')
+class ReplicaRoutingTestCase(APITransactionTestCase):
+    """Две базы: данные фиксируются, поэтому их видит и соединение реплики (в тестах — зеркало основной БД)"""
+    databases = '__all__'
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.replica = settings.DATABASE_REPLICAS[0]
+        self.user = User.objects.create(email='replica@mail.com', tg_chat_id='123')
+        self.client.force_authenticate(user=self.user)
+        self.habit = Habit.objects.create(owner=self.user, action="Читать", time_of_day="08:00:00", is_public=True)
+
+    def queries(self, func):
+        """Выполняет func; возвращает (SQL основной БД, SQL реплики)"""
+        with override_settings(DATABASE_REPLICAS=[self.replica]), \
+                CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections[self.replica]) as replica:
+            func()
+        return [q['sql'] for q in primary.captured_queries], [q['sql'] for q in replica.captured_queries]
+
+    def test_reads_go_to_replica_until_list_changes(self):
+        # список не менялся дольше DATABASE_REPLICA_LAG
+        with mock.patch('tracker.cache.time.time_ns', return_value=time_ns_ago(60)):
+            bump_version(owner_scope(self.user.pk))
+        primary, replica = self.queries(lambda: self.client.get(f'/api/tracker/habits/{self.habit.id}/'))
+        self.assertEqual((len(primary), len(replica)), (0, 1))
+        primary, replica = self.queries(lambda: self.client.get('/api/tracker/habits/'))
+        self.assertEqual((len(primary), len(replica)), (0, 1))
+
+        # после записи список только что изменился: реплика могла его не получить
+        self.client.post('/api/tracker/habits/', data={'action': 'Плавать'})
+        primary, replica = self.queries(lambda: self.client.get('/api/tracker/habits/'))
+        self.assertEqual((len(primary), len(replica)), (1, 0))
+        self.assertEqual(len(self.client.get('/api/tracker/habits/').json()['results']), 2)
+
+    def test_sweep_selects_candidates_on_replica(self):
+        """Диапазон по сроку просматривается на реплике, основная база блокирует кандидатов по id"""
+        now = self.habit.next_reminder_at + timedelta(seconds=1)
+
+        def select():
+            with transaction.atomic():
+                self.assertEqual([row['id'] for row in due_reminders(now, for_update=True)], [self.habit.id])
+
+        primary, replica = self.queries(select)
+        candidates = [sql for sql in replica if 'next_reminder_at' in sql]
+        self.assertEqual(len(candidates), 1)
+        # на PostgreSQL перед выборкой на той же реплике проверяется её отставание
+        lag_probes = [sql for sql in replica if 'pg_is_in_recovery' in sql]
+        expected_probes = 1 if connections[settings.DATABASE_REPLICAS[0]].vendor == 'postgresql' else 0
+        self.assertEqual(len(lag_probes), expected_probes)
+        self.assertEqual(len(replica), len(candidates) + len(lag_probes))
+        self.assertTrue(any('"id" IN' in sql for sql in primary))
+
+
+class ReplicaRouterTestCase(SimpleTestCase):
+    router = ReplicaRouter()
+
+    def test_reads_use_replica_only_inside_block(self):
+        with override_settings(DATABASE_REPLICAS=['replica_1'], DATABASE_REPLICA_LAG=5):
+            self.assertEqual(self.router.db_for_read(Habit), 'default')
+            with replica_reads() as allowed:
+                self.assertTrue(allowed)
+                self.assertEqual(self.router.db_for_read(Habit), 'replica_1')
+                # запись закрепляет последующие чтения за основной базой
+                self.assertEqual(self.router.db_for_write(Habit), 'default')
+                self.assertEqual(self.router.db_for_read(Habit), 'default')
+            with replica_reads(changed_at=timezone.now().timestamp() - 1) as allowed:
+                self.assertFalse(allowed)
+            with request_scope():
+                self.router.db_for_write(Habit)
+                with replica_reads() as allowed:
+                    self.assertFalse(allowed)
+        with override_settings(DATABASE_REPLICAS=[]), replica_reads() as allowed:
+            self.assertFalse(allowed)
+        self.assertFalse(self.router.allow_migrate('replica_1', 'tracker'))
@@ -1,7 +1,9 @@
 from tracker.apps import TrackerConfig
 from rest_framework.routers import DefaultRouter
 from django.urls import path, include
-from .views import HabitViewSet
+from .views import (
+    AsyncHabitDetailView, AsyncHabitListView, AsyncPublicHabitListView, HabitViewSet, TelegramWebhookView,
+)
 
 
 app_name = TrackerConfig.name
@@ -9,6 +11,13 @@ app_name = TrackerConfig.name
 router = DefaultRouter()
 router.register(r'habits', HabitViewSet, basename='habits')
 
+# чтение обслуживают асинхронные представления, запись — те же представления HabitViewSet из роутера
+viewset_views = {pattern.name: pattern.callback for pattern in router.urls}
+
 urlpatterns = [
+    path('habits/', AsyncHabitListView.as_view(fallback=viewset_views['habits-list'])),
+    path('habits/public/', AsyncPublicHabitListView.as_view(fallback=viewset_views['habits-public'])),
+    path('habits/<int:pk>/', AsyncHabitDetailView.as_view(fallback=viewset_views['habits-detail'])),
     path('', include(router.urls)),
+    path('telegram/webhook/', TelegramWebhookView.as_view(), name='telegram_webhook'),
 ]
@@ -41,25 +41,6 @@ class RewardAndRelatedHabitValidator(BaseModelValidator):
         return not (reward_provided and habit.related_habit)
 
 
-class DurationSecondsValidator(BaseModelValidator):
-    """Проверка: время выполнения должно быть не более 120 секунд"""
-    error_message = 'Время выполнения должно быть не более 120 секунд.'
-    max_duration = 120
-    
-    def validate(self, habit):
-        return habit.duration_seconds <= self.max_duration
-
-
-class PeriodDaysValidator(BaseModelValidator):
-    """Проверка: периодичность должна быть от 1 до 7 дней"""
-    error_message = 'Периодичность должна быть от 1 до 7 дней.'
-    min_period = 1
-    max_period = 7
-    
-    def validate(self, habit):
-        return self.min_period <= habit.period_days <= self.max_period
-
-
 class PleasantHabitValidator(BaseModelValidator):
     """Проверка: приятная привычка не может иметь вознаграждения или связанной привычки"""
     error_message = 'Приятная привычка не может иметь вознаграждения или связанной привычки.'
@@ -92,23 +73,59 @@ class RelatedHabitNotSelfValidator(BaseModelValidator):
 
 
 class HabitModelValidator:
-    """Основной класс валидации модели, объединяющий все валидаторы"""
-    
+    """Основной класс валидации модели, объединяющий все валидаторы.
+
+    Ограничения отдельных полей (duration_seconds, period_days) проверяются валидаторами полей
+    в clean_fields(), здесь только правила, связывающие несколько полей.
+    """
+
     def __init__(self):
         self.validators = [
-            DurationSecondsValidator(),
-            PeriodDaysValidator(),
             RewardAndRelatedHabitValidator(),
             PleasantHabitValidator(),
             RelatedHabitIsPleasantValidator(),
             RelatedHabitNotSelfValidator(),
         ]
-    
+
     def __call__(self, habit):
-        """Выполняет все валидаторы"""
+        """Выполняет все валидаторы для одной привычки и сообщает обо всех нарушениях сразу"""
+        errors = self.validate_batch([habit])[0]
+        if errors:
+            raise ValidationError(errors)
+
+    def validate_batch(self, habits):
+        """Проверяет список привычек; возвращает списки сообщений об ошибках в порядке привычек.
+
+        Незагруженные связанные привычки читаются одним запросом на весь список, после чего
+        каждое правило проходит по всем привычкам без обращений к БД.
+        """
+        self.prefetch_related_habits(habits)
+        errors = [[] for _ in habits]
         for validator in self.validators:
-            validator(habit)
+            for index, habit in enumerate(habits):
+                if not validator.validate(habit):
+                    errors[index].append(validator.error_message or validator.get_error_message(habit))
+        return errors
+
+    @staticmethod
+    def prefetch_related_habits(habits):
+        if not habits:
+            return
+        model = type(habits[0])
+        field = model._meta.get_field('related_habit')
+        pending = [
+            habit for habit in habits
+            if habit.related_habit_id is not None and not field.is_cached(habit)
+        ]
+        if not pending:
+            return
+        # action тоже нужен: из него собирается текст напоминания при сохранении
+        related = model._default_manager.order_by().only('id', 'is_pleasant', 'action').in_bulk(
+            {habit.related_habit_id for habit in pending}
+        )
+        for habit in pending:
+            if habit.related_habit_id in related:
+                habit.related_habit = related[habit.related_habit_id]
 
 
 validate_habit = HabitModelValidator()
-
@@ -1,11 +1,47 @@
-from rest_framework import viewsets, generics, permissions
+import secrets
+from abc import ABCMeta, abstractmethod
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+from django.shortcuts import aget_object_or_404
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, viewsets, generics, permissions, status
 from rest_framework.decorators import action
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.views import APIView, exception_handler
+
+from config.db_router import replica_reads
 
-from .models import Habit
-from .serializers import HabitSerializer
+from .bulk import bulk_create_habits, bulk_delete_habits, bulk_update_habits
+from .completions import completion_stats, local_today, record_completion
+from .cache import (
+    PUBLIC_SCOPE, acached_data, aget_version, cached_data, etag, get_version, owner_scope, version_time,
+)
+from .exports import (
+    HABIT_EXPORT_FIELDS, HISTORY_EXPORT_FIELDS, PUBLIC_EXPORT_FIELDS, get_file_format, streaming_export,
+)
+from .models import Habit, HabitCompletion
+from .serializers import HabitCompletionSerializer, HabitSerializer
 from .permissions import IsOwnerOrReadOnly
 from .paginators import HabitsPaginator
+from .sync import habit_changes, parse_watermark
+from .tasks import schedule_update_processing
+from .telegram_updates import store_updates
+
+
+def set_list_validators(response, tag, modified):
+    response['ETag'] = tag
+    response['Last-Modified'] = http_date(modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 
 class HabitViewSet(viewsets.ModelViewSet):
@@ -18,15 +54,253 @@ class HabitViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         user = self.request.user
         if user and user.is_authenticated:
-            return Habit.objects.filter(owner=user)
+            return Habit.objects.filter(owner=user).select_related('owner')
         return Habit.objects.none()
 
+    def conditional_list(self, scope, build):
+        """Ответ со списком из кэша и валидаторами ETag/Last-Modified.
+
+        Валидаторы считаются по версии списка в кэше, поэтому неизменившийся список отдаётся
+        как 304 без запросов к БД и без сериализации.
+        """
+        request = self.request
+        version = get_version(scope)
+        tag, modified = etag(scope, request, version), version_time(version)
+        response = get_conditional_response(request, etag=tag, last_modified=int(modified))
+        if response is None:
+            # неизменившийся DATABASE_REPLICA_LAG секунд список можно читать с реплики
+            with replica_reads(changed_at=modified):
+                response = Response(cached_data(scope, request, build, version))
+        return set_list_validators(response, tag, modified)
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_list(owner_scope(request.user.pk),
+                                     lambda: super(HabitViewSet, self).list(request, *args, **kwargs).data)
+
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
     @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated])
     def public(self, request):
         """Получить список всех публичных привычек"""
-        public_habits = Habit.objects.filter(is_public=True)
-        serializer = self.get_serializer(public_habits, many=True)
-        return Response(serializer.data)
+        def build():
+            public_habits = Habit.objects.filter(is_public=True).select_related('owner')
+            page = self.paginate_queryset(public_habits)
+            return self.get_paginated_response(self.get_serializer(page, many=True).data).data
+
+        return self.conditional_list(PUBLIC_SCOPE, build)
+
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        """Дельта-синхронизация: привычки, изменённые после ?since=<watermark>, и id удалённых"""
+        now = timezone.now()
+        changed, deleted, full = habit_changes(request.user, parse_watermark(request.query_params.get('since')), now)
+        return Response({
+            'watermark': now,
+            'full': full,
+            'changed': self.get_serializer(changed.select_related('owner'), many=True).data,
+            'deleted': deleted,
+        })
+
+    @action(detail=False, methods=['post', 'patch', 'delete'], url_path='bulk')
+    def bulk(self, request):
+        """Массовое создание (POST), изменение (PATCH) и удаление (DELETE, список id) привычек"""
+        if request.method == 'POST':
+            habits = bulk_create_habits(request.user, request.data)
+            return Response(self.get_serializer(habits, many=True).data, status=status.HTTP_201_CREATED)
+        if request.method == 'PATCH':
+            habits = bulk_update_habits(request.user, request.data)
+            return Response(self.get_serializer(habits, many=True).data)
+        bulk_delete_habits(request.user, request.data)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        """Отметить выполнение привычки; возвращает обновлённую статистику"""
+        habit = self.get_object()
+        today = local_today(request.user)
+        serializer = HabitCompletionSerializer(data=request.data, context={'today': today})
+        serializer.is_valid(raise_exception=True)
+        habit, created = record_completion(habit, serializer.validated_data.get('completed_on', today))
+        return Response(completion_stats(habit, today),
+                        status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+    @action(detail=True, methods=['get'])
+    def stats(self, request, pk=None):
+        """Серия и доля выполнений за 7/30 дней по сохранённым счётчикам"""
+        return Response(completion_stats(self.get_object(), local_today(request.user)))
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Потоковая выгрузка своих привычек (?file_format=csv|ndjson)"""
+        return streaming_export(Habit.objects.filter(owner=request.user), HABIT_EXPORT_FIELDS,
+                                get_file_format(request), 'habits')
+
+    @action(detail=False, methods=['get'], url_path='export/history')
+    def export_history(self, request):
+        """Потоковая выгрузка истории выполнения своих привычек"""
+        return streaming_export(HabitCompletion.objects.filter(habit__owner=request.user), HISTORY_EXPORT_FIELDS,
+                                get_file_format(request), 'history')
+
+    @action(detail=False, methods=['get'], url_path='export/public',
+            permission_classes=[permissions.IsAuthenticated, permissions.IsAdminUser])
+    def export_public(self, request):
+        """Потоковая выгрузка всех публичных привычек (только для администраторов)"""
+        return streaming_export(Habit.objects.filter(is_public=True), PUBLIC_EXPORT_FIELDS,
+                                get_file_format(request), 'public_habits')
+
+
+class AsyncHabitReadView(View, metaclass=ABCMeta):
+    """Асинхронное чтение привычек для ASGI: пока ждёт БД и кэш, процесс обслуживает другие запросы.
+
+    Аутентификация (aauthenticate), права HabitViewSet, курсорная пагинация, кэш списков и ETag — те же,
+    что у синхронного HabitViewSet, ответ — в JSON. Остальные методы передаются синхронному
+    представлению из роутера (fallback) через sync_to_async.
+    """
+    fallback = None
+    permission_classes = HabitViewSet.permission_classes
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # как у APIView: CSRF проверяет сама аутентификация DRF
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def get(self, request, *args, **kwargs):
+        request = Request(request, authenticators=[auth() for auth in HabitViewSet.authentication_classes],
+                          negotiator=DefaultContentNegotiation())
+        try:
+            request.accepted_renderer, request.accepted_media_type = request.negotiator.select_renderer(
+                request, [JSONRenderer()], kwargs.pop('format', None),
+            )
+            await self.authenticate(request)
+            for permission in self.permission_classes:
+                if not permission().has_permission(request, self):
+                    self.permission_denied(request, permission)
+            response = await self.read(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(request, exc)
+        return response
+
+    async def delegate(self, request, *args, **kwargs):
+        return await sync_to_async(self.fallback)(request, *args, **kwargs)
+
+    post = put = patch = delete = options = delegate
+
+    @abstractmethod
+    async def read(self, request, *args, **kwargs):
+        """Ответ на GET после аутентификации и проверки прав; аргументы — из URL"""
+
+    @staticmethod
+    async def authenticate(request):
+        """Request._authenticate() без блокировки: aauthenticate(), если он есть у класса аутентификации"""
+        for authenticator in request.authenticators:
+            try:
+                if hasattr(authenticator, 'aauthenticate'):
+                    user_auth_tuple = await authenticator.aauthenticate(request)
+                else:
+                    user_auth_tuple = await sync_to_async(authenticator.authenticate)(request)
+            except exceptions.APIException:
+                request._not_authenticated()
+                raise
+            if user_auth_tuple is not None:
+                request._authenticator = authenticator
+                request.user, request.auth = user_auth_tuple
+                return
+        request._not_authenticated()
+
+    @staticmethod
+    def permission_denied(request, permission):
+        if request.authenticators and not request.successful_authenticator:
+            raise exceptions.NotAuthenticated()
+        raise exceptions.PermissionDenied(getattr(permission, 'message', None))
+
+    def handle_exception(self, request, exc):
+        """Ответ об ошибке в формате DRF (exception_handler), с WWW-Authenticate для 401"""
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            if request.authenticators:
+                exc.auth_header = request.authenticators[0].authenticate_header(request)
+            else:
+                exc.status_code = status.HTTP_403_FORBIDDEN
+        response = exception_handler(exc, {'request': request, 'view': self})
+        if response is None:
+            raise exc
+        headers = {name: value for name, value in response.items() if name.lower() != 'content-type'}
+        return self.render(response.data, response.status_code, headers=headers)
+
+    @staticmethod
+    def render(data, status_code=status.HTTP_200_OK, headers=None):
+        return HttpResponse(JSONRenderer().render(data), status=status_code, headers=headers,
+                            content_type='application/json')
+
+    def serialize(self, request, instance, many=False):
+        return HabitSerializer(instance, many=many, context={'request': request, 'view': self}).data
+
+    async def conditional_list(self, scope, request, queryset):
+        """HabitViewSet.conditional_list(): страница queryset из кэша, 304 без запросов к БД"""
+        async def build():
+            paginator = HabitsPaginator()
+            page = await paginator.apaginate_queryset(queryset, request, view=self)
+            return paginator.get_paginated_response(self.serialize(request, page, many=True)).data
+
+        version = await aget_version(scope)
+        tag, modified = etag(scope, request, version), version_time(version)
+        response = get_conditional_response(request, etag=tag, last_modified=int(modified))
+        if response is None:
+            with replica_reads(changed_at=modified):
+                response = self.render(await acached_data(scope, request, build, version))
+        return set_list_validators(response, tag, modified)
+
+
+class AsyncHabitListView(AsyncHabitReadView):
+    """GET /habits/ — свои привычки"""
+
+    async def read(self, request):
+        queryset = Habit.objects.filter(owner=request.user).select_related('owner')
+        return await self.conditional_list(owner_scope(request.user.pk), request, queryset)
+
+
+class AsyncPublicHabitListView(AsyncHabitReadView):
+    """GET /habits/public/ — публичные привычки всех пользователей"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    async def read(self, request):
+        queryset = Habit.objects.filter(is_public=True).select_related('owner')
+        return await self.conditional_list(PUBLIC_SCOPE, request, queryset)
+
+
+class AsyncHabitDetailView(AsyncHabitReadView):
+    """GET /habits/<pk>/ — своя привычка"""
+
+    async def read(self, request, pk):
+        changed_at = None
+        if settings.DATABASE_REPLICAS:
+            # привычки владельца меняются вместе с версией его списка
+            changed_at = version_time(await aget_version(owner_scope(request.user.pk)))
+        with replica_reads(changed_at=changed_at):
+            habit = await aget_object_or_404(Habit.objects.filter(owner=request.user).select_related('owner'), pk=pk)
+        for permission in self.permission_classes:
+            if not permission().has_object_permission(request, self, habit):
+                self.permission_denied(request, permission)
+        return self.render(self.serialize(request, habit))
+
+
+class TelegramWebhookView(APIView):
+    """Webhook Telegram: сохраняет обновление и планирует пакетный разбор.
+
+    Запрос подтверждается заголовком X-Telegram-Bot-Api-Secret-Token (secret_token в setWebhook);
+    без TELEGRAM_WEBHOOK_SECRET webhook выключен. Ответ не ждёт разбора: Telegram повторяет
+    обновления, на которые не получил 200, а повтор уже сохранённого update_id ничего не меняет.
+    """
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+
+    def post(self, request):
+        secret = settings.TELEGRAM_WEBHOOK_SECRET
+        received = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+        if not secret or not secrets.compare_digest(received.encode(), secret.encode()):
+            return Response(status=status.HTTP_403_FORBIDDEN)
+        if not isinstance(request.data, dict) or not isinstance(request.data.get('update_id'), int):
+            return Response({'detail': 'Ожидается объект Update с update_id.'}, status=status.HTTP_400_BAD_REQUEST)
+        store_updates([request.data])
+        schedule_update_processing()
+        return Response(status=status.HTTP_200_OK)
@@ -0,0 +1,156 @@
+"""JWT-аутентификация без запроса пользователя к БД на каждый запрос.
+
+Стандартный JWTAuthentication читает пользователя из БД по user_id на каждый вызов API.
+CachedJWTAuthentication держит в кэше AUTH_USER_CACHE_TTL секунд поля пользователя, нужные для
+доступа (CACHED_FIELDS, без хеша пароля), и собирает по ним пользователя; сохранение
+и удаление пользователя сразу убирают его из кэша (users/signals.py), а изменения в обход save()
+становятся видны не позже чем через TTL.
+
+С AUTH_TRUST_TOKEN_CLAIMS пользователь собирается прямо из claims токена (id, email, is_active)
+без обращения к кэшу и БД; остальные поля модели загружаются из БД при первом обращении.
+Claims доверяются только первые AUTH_TRUSTED_CLAIMS_MAX_AGE секунд после выдачи токена и только
+если после выдачи пароль или активность пользователя не менялись, поэтому отозванный пользователь
+сохраняет доступ не дольше этого окна, даже если метка отзыва потеряна кэшем.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from users.models import User
+
+TRUSTED_CLAIMS = ('email', 'is_active')
+CACHED_FIELDS = ('id', 'email', 'is_active', 'is_staff', 'is_superuser', 'timezone', 'tg_chat_id')
+
+
+def _user_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def _revoked_key(user_id):
+    return f'auth:revoked:{user_id}'
+
+
+def _cached_fields(user):
+    return {field: getattr(user, field) for field in CACHED_FIELDS}
+
+
+def _user_from_fields(values):
+    """Пользователь из значений полей без запроса к БД; остальные поля загружаются при первом обращении"""
+    # from_db() ждёт значения в порядке полей модели
+    names = [field.attname for field in User._meta.concrete_fields if field.attname in values]
+    return User.from_db(DEFAULT_DB_ALIAS, names, [values[name] for name in names])
+
+
+def forget_users(*user_ids):
+    """Убирает пользователей из кэша аутентификации (нужно после изменений в обход save())"""
+    cache.delete_many([_user_key(user_id) for user_id in user_ids])
+
+
+def revoke_trusted_claims(user_id):
+    """Перестаёт доверять claims токенов пользователя, выданных до этого момента"""
+    cache.set(_revoked_key(user_id), time.time(), timeout=settings.AUTH_TRUSTED_CLAIMS_MAX_AGE)
+
+
+def add_trusted_claims(token, user):
+    """Добавляет в токен claims, по которым пользователь собирается без БД"""
+    token['email'] = user.email
+    token['is_active'] = user.is_active
+    return token
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication с пользователем из кэша или из доверенных claims токена.
+
+    aauthenticate() — то же для асинхронных представлений: кэш и БД читаются без блокировки цикла событий.
+    """
+
+    def get_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+        user = self.trusted_user(user_id, validated_token)
+        if user is None:
+            key = _user_key(user_id)
+            fields = cache.get(key)
+            if fields is None:
+                # проверки активности и отзыва выполняет родительский класс
+                user = super().get_user(validated_token)
+                cache.set(key, _cached_fields(user), timeout=settings.AUTH_USER_CACHE_TTL)
+                return user
+            user = _user_from_fields(fields)
+        self.check_user(user, validated_token)
+        return user
+
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+        user = None
+        if self.may_trust_claims(validated_token):
+            user = self.user_from_claims(user_id, validated_token, await cache.aget(_revoked_key(user_id)))
+        if user is None:
+            key = _user_key(user_id)
+            fields = await cache.aget(key)
+            if fields is None:
+                try:
+                    user = await User.objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+                except User.DoesNotExist as e:
+                    raise AuthenticationFailed(_("User not found"), code="user_not_found") from e
+                self.check_user(user, validated_token)
+                await cache.aset(key, _cached_fields(user), timeout=settings.AUTH_USER_CACHE_TTL)
+                return user
+            user = _user_from_fields(fields)
+        self.check_user(user, validated_token)
+        return user
+
+    def get_user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+    def trusted_user(self, user_id, validated_token):
+        """Пользователь из claims токена или None, если им нельзя доверять"""
+        if not self.may_trust_claims(validated_token):
+            return None
+        return self.user_from_claims(user_id, validated_token, cache.get(_revoked_key(user_id)))
+
+    def may_trust_claims(self, validated_token):
+        """Claims есть в токене и токен выдан не раньше AUTH_TRUSTED_CLAIMS_MAX_AGE секунд назад"""
+        if not settings.AUTH_TRUST_TOKEN_CLAIMS or api_settings.CHECK_REVOKE_TOKEN:
+            # для проверки отзыва по паролю нужен хеш пароля из БД
+            return False
+        if any(claim not in validated_token for claim in TRUSTED_CLAIMS):
+            return False
+        issued_at = validated_token.get('iat')
+        return issued_at is not None and time.time() - issued_at <= settings.AUTH_TRUSTED_CLAIMS_MAX_AGE
+
+    def user_from_claims(self, user_id, validated_token, revoked_at):
+        """Пользователь из claims, если они не отозваны после выдачи токена"""
+        if revoked_at is not None and validated_token['iat'] <= revoked_at:
+            return None
+        return _user_from_fields({
+            'id': int(user_id), 'email': validated_token['email'], 'is_active': validated_token['is_active'],
+        })
+
+    def check_user(self, user, validated_token):
+        """Те же проверки, что у JWTAuthentication.get_user(), для пользователя не из БД"""
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN and (
+            validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password)
+        ):
+            raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
@@ -0,0 +1,37 @@
+from asgiref.sync import async_to_sync
+from django.contrib.auth.backends import ModelBackend
+
+from users.models import User
+from users.passwords import acheck_password
+
+
+class PooledPasswordBackend(ModelBackend):
+    """ModelBackend, у которого пароль сверяется в пуле потоков хеширования (users/passwords.py).
+
+    Для неизвестного email хеш тоже считается: по времени ответа нельзя узнать, есть ли учётная запись.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        # синхронный вход (например, админка); API входа вызывает aauthenticate() без блокировки потока
+        return async_to_sync(self.aauthenticate)(request, username, password, **kwargs)
+
+    async def aauthenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = await User._default_manager.aget_by_natural_key(username)
+        except User.DoesNotExist:
+            user = None
+
+        async def upgrade(encoded):
+            user.password = encoded
+            # обновление хеша — не смена пароля: доверие к claims выданных токенов сохраняется
+            user._loaded_auth = user.auth_state
+            await user.asave(update_fields=['password'])
+
+        valid = await acheck_password(password, user.password if user else None, upgrade)
+        if valid and self.user_can_authenticate(user):
+            return user
+        return None
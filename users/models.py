@@ -1,5 +1,9 @@
+import secrets
+
+from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from timezone_field import TimeZoneField
 
 
 
@@ -12,10 +16,48 @@ class User(AbstractUser):
         null=True,
         verbose_name="Телеграм chat-id"
     )
+    timezone = TimeZoneField(default=settings.TIME_ZONE, verbose_name="Часовой пояс")
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = []
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_timezone = instance.__dict__.get('timezone')
+        instance._loaded_auth = instance.auth_state
+        return instance
+
+    @property
+    def auth_state(self):
+        """Поля, изменение которых отзывает доступ: пароль и активность (незагруженные — None)"""
+        return self.__dict__.get('password'), self.__dict__.get('is_active')
+
+    @property
+    def auth_changed(self):
+        """Пароль или активность изменены с момента загрузки из БД"""
+        return hasattr(self, '_loaded_auth') and self.auth_state != self._loaded_auth
+
+    @property
+    def timezone_changed(self):
+        """Часовой пояс изменён с момента загрузки из БД (нужно пересчитать расписание привычек)"""
+        return hasattr(self, '_loaded_timezone') and self.timezone != self._loaded_timezone
+
     def __str__(self):
         return self.email
 
+
+
+def generate_link_token():
+    return secrets.token_urlsafe(24)
+
+
+class TelegramLinkToken(models.Model):
+    """Одноразовый токен привязки чата: бот получает его в команде /start по ссылке t.me/<бот>?start=<токен>"""
+    user = models.ForeignKey(User, related_name='telegram_link_tokens', on_delete=models.CASCADE)
+    token = models.CharField(max_length=64, unique=True, default=generate_link_token)
+    created_at = models.DateTimeField(auto_now_add=True)
+    used_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.token}"
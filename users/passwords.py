@@ -0,0 +1,57 @@
+"""Хеширование и проверка паролей в отдельном пуле потоков.
+
+PBKDF2 занимает сотни миллисекунд процессорного времени. В асинхронных представлениях
+регистрации и входа (users/views.py, бэкенд users/backends.py) хеш считается в пуле из
+PASSWORD_HASH_WORKERS потоков, а поток обработки запросов (цикл событий под config/asgi.py)
+тем временем обслуживает другие запросы.
+hashlib.pbkdf2_hmac отпускает GIL, поэтому потоки пула считают хеши параллельно на всех ядрах,
+а размер пула ограничивает долю процессора, которую может занять всплеск регистраций.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_hash_executor():
+    """Общий пул потоков для хеширования паролей"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS,
+                                               thread_name_prefix='password-hash')
+    return _executor
+
+
+async def _run_in_pool(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(get_hash_executor(), func, *args)
+
+
+async def ahash_password(raw_password):
+    """Хеш пароля для поля User.password"""
+    return await _run_in_pool(make_password, raw_password)
+
+
+async def acheck_password(raw_password, encoded, setter=None):
+    """Сверяет пароль с хешем; без пользователя (encoded=None) тратит столько же времени,
+    чтобы по времени ответа нельзя было узнать, зарегистрирован ли email.
+
+    Если верный пароль записан с устаревшими параметрами хешера (например, выросло число итераций
+    PBKDF2), новый хеш считается в том же пуле и передаётся корутине setter для сохранения —
+    как setter у django.contrib.auth.hashers.check_password().
+    """
+    if encoded is None:
+        await _run_in_pool(make_password, raw_password)
+        return False
+    upgraded = []
+    valid = await _run_in_pool(check_password, raw_password, encoded,
+                               lambda raw: upgraded.append(make_password(raw)))
+    if upgraded and setter is not None:
+        await setter(upgraded[0])
+    return valid
@@ -1,10 +1,42 @@
-from rest_framework import serializers
+from asgiref.sync import sync_to_async
+from django.contrib.auth import aauthenticate
+from django.contrib.auth.models import update_last_login
+from rest_framework import exceptions, serializers
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from timezone_field.rest_framework import TimeZoneSerializerField
+
+from users.authentication import add_trusted_claims
 from users.models import User
 
 
 class RegisterSerializer(serializers.ModelSerializer):
+    timezone = TimeZoneSerializerField(use_pytz=False, required=False)
 
     class Meta:
         model = User
-        fields = ('id', 'email', 'password')
+        fields = ('id', 'email', 'password', 'timezone')
+        extra_kwargs = {'password': {'write_only': True}}
+
+
+class UserTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Выдача токенов с claims email и is_active (см. users/authentication.py)"""
+
+    @classmethod
+    def get_token(cls, user):
+        return add_trusted_claims(super().get_token(user), user)
 
+    async def aauthenticate(self):
+        """validated_data входа для асинхронного LoginApiView: то же, что is_valid(raise_exception=True),
+        но пользователь проверяется через aauthenticate() и поток не ждёт хеширования пароля"""
+        attrs = self.to_internal_value(self.initial_data)
+        self.user = await aauthenticate(
+            request=self.context.get('request'),
+            **{self.username_field: attrs[self.username_field], 'password': attrs['password']},
+        )
+        if not jwt_settings.USER_AUTHENTICATION_RULE(self.user):
+            raise exceptions.AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+        refresh = await sync_to_async(self.get_token)(self.user)
+        if jwt_settings.UPDATE_LAST_LOGIN:
+            await sync_to_async(update_last_login)(None, self.user)
+        return {'refresh': str(refresh), 'access': str(refresh.access_token)}
@@ -0,0 +1,23 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from users.authentication import forget_users, revoke_trusted_claims
+from users.models import User
+
+
+@receiver(post_save, sender=User)
+def forget_cached_user(sender, instance, created, **kwargs):
+    """Сохранённый пользователь перечитывается из БД при следующем запросе; смена пароля
+    или деактивация отзывает доверие к claims уже выданных токенов"""
+    if created:
+        return
+    forget_users(instance.pk)
+    if instance.auth_changed:
+        revoke_trusted_claims(instance.pk)
+    instance._loaded_auth = instance.auth_state
+
+
+@receiver(post_delete, sender=User)
+def forget_deleted_user(sender, instance, **kwargs):
+    forget_users(instance.pk)
+    revoke_trusted_claims(instance.pk)
@@ -1,3 +1,207 @@
-from django.test import TestCase
+import time
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.contrib.auth.signals import user_login_failed
+from django.core.cache import cache
+from django.db import connection
+from django.test import AsyncClient, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from users.authentication import CachedJWTAuthentication, add_trusted_claims
+from users.models import User
+
+
+class RegisterTestCase(APITestCase):
+    def test_register_with_timezone(self):
+        """Тест регистрации с часовым поясом"""
+        response = self.client.post('/users/register/', data={
+            'email': 'tz@mail.com',
+            'password': 'secret-pass',
+            'timezone': 'Asia/Tokyo',
+        })
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()['timezone'], 'Asia/Tokyo')
+        user = User.objects.get(email='tz@mail.com')
+        self.assertEqual(str(user.timezone), 'Asia/Tokyo')
+        self.assertTrue(user.check_password('secret-pass'))
+
+    def test_register_default_timezone(self):
+        """Тест: без часового пояса используется пояс проекта"""
+        response = self.client.post('/users/register/', data={'email': 'default@mail.com', 'password': 'secret-pass'})
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(str(User.objects.get(email='default@mail.com').timezone), 'Europe/Moscow')
+
+
+    def test_register_writes_user_once(self):
+        """Регистрация — одна проверка email и одна вставка; хеш пароля в ответ не попадает"""
+        with self.assertNumQueries(2):
+            response = self.client.post('/users/register/', data={'email': 'once@mail.com', 'password': 'secret-pass'},
+                                        format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn('password', response.json())
+        self.assertEqual(self.client.post('/users/register/', data={'email': 'once@mail.com', 'password': 'x'},
+                                          format='json').status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class LoginTestCase(APITestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = User.objects.create(email='login@mail.com')
+        self.user.set_password('secret-pass')
+        self.user.save()
+
+    def login(self, password='secret-pass', email='login@mail.com', **extra):
+        return self.client.post('/users/login/', data={'email': email, 'password': password}, format='json', **extra)
+
+    def test_login_returns_token_pair(self):
+        response = self.login()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.json()), {'access', 'refresh'})
+        self.assertEqual(self.login(password='wrong').status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.login(email='nobody@mail.com').status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.login().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_login_and_register_are_async_views(self):
+        """Вход и регистрация — асинхронные представления: под ASGI поток не ждёт хеширования пароля"""
+        for url in ('/users/login/', '/users/register/'):
+            self.assertTrue(iscoroutinefunction(resolve(url).func))
+        client = AsyncClient()
+
+        response = await client.post('/users/login/', data={'email': 'login@mail.com', 'password': 'secret-pass'},
+                                     content_type='application/json')
+        self.assertEqual(set(response.json()), {'access', 'refresh'})
+        response = await client.post('/users/login/', data={'email': 'login@mail.com'},
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('password', response.json())
+        response = await client.post('/users/register/', data={'email': 'async@mail.com', 'password': 'secret-pass'},
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(await User.objects.filter(email='async@mail.com', is_active=True).aexists())
+
+    def test_login_upgrades_outdated_hash(self):
+        """Хеш со старым числом итераций пересчитывается при входе, как у ModelBackend"""
+        hasher = PBKDF2PasswordHasher()
+        User.objects.filter(pk=self.user.pk).update(
+            password=hasher.encode('secret-pass', hasher.salt(), iterations=1000),
+        )
+
+        self.assertEqual(self.login().status_code, status.HTTP_200_OK)
+
+        self.user.refresh_from_db()
+        self.assertEqual(hasher.decode(self.user.password)['iterations'], hasher.iterations)
+        self.assertTrue(self.user.check_password('secret-pass'))
+        self.assertIsNone(cache.get(f'auth:revoked:{self.user.pk}'))
+
+    def test_login_goes_through_authenticate(self):
+        """Вход проходит через authenticate(): неудачная попытка отправляет сигнал user_login_failed"""
+        failed = mock.Mock()
+        user_login_failed.connect(failed)
+        self.addCleanup(user_login_failed.disconnect, failed)
+
+        self.login()
+        failed.assert_not_called()
+        self.login(password='wrong')
+        self.assertEqual(failed.call_args.kwargs['credentials']['email'], 'login@mail.com')
+
+    def test_only_failed_logins_are_throttled(self):
+        """Перебор паролей упирается в лимит по email, а с одного IP — и по разным email; успешные входы не считаются"""
+        rates = {'login_ip': '5/min', 'login_email': '3/min'}
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': rates}):
+            self.assertEqual({self.login().status_code for _ in range(6)}, {status.HTTP_200_OK})
+
+            statuses = [self.login(password='wrong').status_code for _ in range(4)]
+            self.assertEqual(statuses, [status.HTTP_401_UNAUTHORIZED] * 3 + [status.HTTP_429_TOO_MANY_REQUESTS])
+            response = self.login()
+            self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+            self.assertIn('Retry-After', response)
+            # с другого адреса лимит по email тот же
+            self.assertEqual(self.login(REMOTE_ADDR='10.0.0.2').status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+            for i in range(2):
+                self.login(email=f'other{i}@mail.com')
+            self.assertEqual(self.login(email='fresh@mail.com').status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+            self.assertEqual(self.login(email='fresh@mail.com', REMOTE_ADDR='10.0.0.4').status_code,
+                             status.HTTP_401_UNAUTHORIZED)
+
+
+class CachedJWTAuthenticationTestCase(APITestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = User.objects.create(email='jwt@mail.com')
+        self.user.set_password('secret-pass')
+        self.user.save()
+        response = self.client.post('/users/login/', data={'email': 'jwt@mail.com', 'password': 'secret-pass'})
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.json()['access']}")
+
+    def user_queries(self):
+        """Число запросов к таблице пользователей за один запрос к API"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/tracker/habits/')
+        return response, sum(1 for query in queries if 'FROM "users_user"' in query['sql'])
+
+    def test_user_is_read_from_cache(self):
+        """Пользователь читается из БД только при первом запросе"""
+        self.assertEqual(self.user_queries()[1], 1)
+        response, queries = self.user_queries()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(queries, 0)
+
+    def test_cache_keeps_only_access_fields(self):
+        """В кэше нет хеша пароля; пользователь из кэша собирается с правильными полями"""
+        self.user_queries()
+        cached = cache.get(f'auth:user:{self.user.pk}')
+        self.assertNotIn('password', cached)
+        self.assertEqual((cached['email'], cached['is_active']), (self.user.email, True))
+
+        user = CachedJWTAuthentication().get_user({'user_id': self.user.pk})
+        self.assertEqual((user.pk, user.email, user.is_active, user.timezone),
+                         (self.user.pk, self.user.email, True, self.user.timezone))
+        self.assertNotIn('password', user.__dict__)
+
+    def test_save_invalidates_cached_user(self):
+        """Деактивация через save() закрывает доступ сразу, не дожидаясь истечения кэша"""
+        self.user_queries()
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.user_queries()[0].status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(AUTH_TRUST_TOKEN_CLAIMS=True)
+    def test_trusted_claims_skip_database(self):
+        """Свежий токен с claims не требует ни БД, ни кэша; смена пароля отзывает доверие"""
+        response, queries = self.user_queries()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(queries, 0)
+
+        self.user.set_password('new-pass')
+        self.user.save()
+        self.assertEqual(self.user_queries()[1], 1)
+
+    @override_settings(AUTH_TRUST_TOKEN_CLAIMS=True)
+    def test_trusted_claims_of_inactive_user_are_rejected(self):
+        """Пользователь из claims с is_active=false не проходит аутентификацию"""
+        token = AccessToken.for_user(self.user)
+        add_trusted_claims(token, User(email=self.user.email, is_active=False))
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        response, queries = self.user_queries()
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(queries, 0)
+
+    @override_settings(AUTH_TRUST_TOKEN_CLAIMS=True, AUTH_TRUSTED_CLAIMS_MAX_AGE=60)
+    def test_old_token_claims_are_not_trusted(self):
+        """Claims старше AUTH_TRUSTED_CLAIMS_MAX_AGE не доверяются: пользователь берётся из БД"""
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        with mock.patch('users.authentication.time.time', return_value=time.time() + 120):
+            self.assertEqual(self.user_queries()[0].status_code, status.HTTP_401_UNAUTHORIZED)
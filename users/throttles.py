@@ -0,0 +1,70 @@
+import hashlib
+
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class LoginRateThrottle(SimpleRateThrottle):
+    """Ограничение неудачных попыток входа; лимиты — login_ip и login_email в DEFAULT_THROTTLE_RATES.
+
+    В отличие от allow_request(), проверка лимита (blocked) не учитывает попытку: учитываются
+    только неудачные входы (record_failure), поэтому успешные входы не расходуют лимит.
+    """
+
+    def get_rate(self):
+        # читается при каждой проверке, чтобы лимиты можно было поменять через настройки
+        return api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+
+    def blocked(self, request):
+        """Лимит неудачных попыток исчерпан"""
+        if self.rate is None:
+            return False
+        self.key = self.get_cache_key(request, None)
+        self.history = self.cache.get(self.key, [])
+        self.now = self.timer()
+        while self.history and self.history[-1] <= self.now - self.duration:
+            self.history.pop()
+        return len(self.history) >= self.num_requests
+
+    def record_failure(self, request):
+        if self.rate is None:
+            return
+        self.blocked(request)
+        self.throttle_success()
+
+
+class LoginIPRateThrottle(LoginRateThrottle):
+    scope = 'login_ip'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class LoginEmailRateThrottle(LoginRateThrottle):
+    scope = 'login_email'
+
+    def __init__(self, email):
+        super().__init__()
+        self.email = email
+
+    def get_cache_key(self, request, view):
+        ident = hashlib.md5(self.email.strip().lower().encode()).hexdigest()
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+
+def _login_throttles(email):
+    return LoginIPRateThrottle(), LoginEmailRateThrottle(email)
+
+
+def login_throttle_wait(request, email):
+    """None, если попытку входа можно выполнять, иначе — сколько секунд ждать"""
+    for throttle in _login_throttles(email):
+        if throttle.blocked(request):
+            return throttle.wait() or 1
+    return None
+
+
+def record_login_failure(request, email):
+    """Учитывает неудачную попытку входа в лимитах по IP и по email"""
+    for throttle in _login_throttles(email):
+        throttle.record_failure(request)
@@ -1,12 +1,13 @@
 from django.urls import path
-from .views import RegisterApiView
+from .views import LoginApiView, RegisterApiView, TelegramLinkApiView
 from users.apps import UsersConfig
-from rest_framework_simplejwt.views import (TokenObtainPairView, TokenRefreshView,)
+from rest_framework_simplejwt.views import TokenRefreshView
 
 app_name = UsersConfig.name
 
 urlpatterns = [
     path('register/', RegisterApiView.as_view(), name='register'),
-    path('login/', TokenObtainPairView.as_view(), name='login'),
+    path('login/', LoginApiView.as_view(), name='login'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('telegram/link/', TelegramLinkApiView.as_view(), name='telegram_link'),
 ]
@@ -1,14 +1,100 @@
-from rest_framework import generics, permissions
+from datetime import timedelta
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import IntegrityError
+from rest_framework import generics, permissions, status
+from rest_framework.exceptions import AuthenticationFailed, Throttled, ValidationError
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework_simplejwt.views import TokenObtainPairView
+
+from .passwords import ahash_password
 from .serializers import RegisterSerializer
-from users.models import User
+from .throttles import login_throttle_wait, record_login_failure
+from users.models import TelegramLinkToken, User
+
+
+class AsyncAPIView(APIView):
+    """APIView с асинхронными обработчиками (в DRF этой версии их нет) для запуска под config/asgi.py.
+
+    Парсеры, рендереры, обработка исключений и схема drf-yasg — как у APIView. Аутентификация,
+    права и троттлинг (initial) выполняются в потоке через sync_to_async, а обработчик ждёт
+    БД и пул хеширования паролей, не занимая поток: процесс тем временем обслуживает другие запросы.
+    Подклассы определяют обработчики запросов как async def.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            if iscoroutinefunction(handler):
+                response = await handler(request, *args, **kwargs)
+            else:
+                response = handler(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
 
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
 
-class RegisterApiView(generics.CreateAPIView):
+
+class RegisterApiView(AsyncAPIView, generics.CreateAPIView):
+    """Регистрация одной записью в БД; пароль хешируется в пуле потоков (users/passwords.py)"""
     serializer_class = RegisterSerializer
     queryset = User.objects.all()
     permission_classes = [permissions.AllowAny,]
 
-    def perform_create(self, serializer):
-        user = serializer.save(is_active=True)
-        user.set_password(user.password)
-        user.save()
+    async def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        # проверка уникальности email обращается к БД
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+        password = await ahash_password(serializer.validated_data['password'])
+        try:
+            await sync_to_async(serializer.save)(password=password, is_active=True)
+        except IntegrityError:
+            # тот же email зарегистрирован параллельным запросом
+            raise ValidationError({'email': ['Пользователь с таким email уже существует.']})
+        return Response(serializer.data, status=status.HTTP_201_CREATED,
+                        headers=self.get_success_headers(serializer.data))
+
+
+class LoginApiView(AsyncAPIView, TokenObtainPairView):
+    """Выдача пары JWT через aauthenticate() (users/backends.py сверяет пароль в пуле потоков);
+    неудачные попытки ограничены по IP и по email"""
+
+    async def post(self, request, *args, **kwargs):
+        email = request.data.get(User.USERNAME_FIELD)
+        email = email if isinstance(email, str) else ''
+        wait = await sync_to_async(login_throttle_wait)(request, email)
+        if wait is not None:
+            raise Throttled(wait, detail='Слишком много попыток входа, повторите позже.')
+        serializer = self.get_serializer(data=request.data)
+        try:
+            tokens = await serializer.aauthenticate()
+        except AuthenticationFailed:
+            await sync_to_async(record_login_failure)(request, email)
+            raise
+        return Response(tokens, status=status.HTTP_200_OK)
+
+
+class TelegramLinkApiView(APIView):
+    """Выдаёт одноразовую ссылку привязки Telegram-чата к текущему пользователю"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        link = TelegramLinkToken.objects.create(user=request.user)
+        return Response({
+            'token': link.token,
+            'link': f'https://t.me/{settings.TELEGRAM_BOT_USERNAME}?start={link.token}',
+            'expires_at': link.created_at + timedelta(seconds=settings.TELEGRAM_LINK_TOKEN_TTL),
+        }, status=status.HTTP_201_CREATED)